@@ -0,0 +1,427 @@
+"""Request parsing and response bodies shared by the threaded and asyncio routes.
+
+app.py (Flask, requests, the Twilio client) and asgi.py (Starlette,
+aiohttp, the async Twilio client) serve the same endpoints. Everything
+that does not touch an upstream lives here: reading and validating the
+JSON body, planning which text the glossary answers locally, and building
+the success and error bodies. Each serving mode keeps only its own I/O
+and turns the (payload, status code) pairs returned here into responses.
+
+Parsers raise InvalidRequest, which both modes answer with a 400.
+"""
+import json
+import logging
+from datetime import datetime
+
+from consultation_packing import CONSULTATION_FIELDS, is_translatable
+from outbound_scheduler import QueueTimeout
+from sarvam_client import SarvamAPIError
+from upstream_guard import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+TEST_TRANSLATE_TEXT = "Hello, how are you today? This is a test of the translation service."
+TEST_TRANSLATE_LANGUAGES = ('hi-IN', 'mr-IN', 'ta-IN', 'te-IN')
+
+
+class InvalidRequest(Exception):
+    """The request body is missing, malformed or fails validation"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+    def result(self):
+        return {"status": "error", "error": self.message}, self.status_code
+
+
+def load_json(body):
+    """Decode a raw request body; None when it is empty, InvalidRequest when it is not JSON"""
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise InvalidRequest("Invalid JSON body")
+
+
+def require_object(data):
+    if not isinstance(data, dict) or not data:
+        raise InvalidRequest("No JSON data provided")
+    return data
+
+
+def supported_codes(languages):
+    return [language['code'] for language in languages.values()]
+
+
+def language_name(languages, code):
+    return languages.get(code.split('-')[0], {}).get('name', code)
+
+
+def idempotency_key(headers, data):
+    """Idempotency-Key header, or the idempotency_key body field"""
+    return headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+
+def upstream_error(error):
+    """Short per-language error text for batch and consultation results"""
+    return f"API returned {error.status_code}" if isinstance(error, SarvamAPIError) else str(error)
+
+
+def error_result(message, status_code):
+    return {"status": "error", "error": message}, status_code
+
+
+def retry_later_result(message, retry_after):
+    """503 answer for an open circuit breaker or an exhausted outbound queue (sent with Retry-After)"""
+    return {"status": "error", "error": message, "retry_after": int(retry_after + 0.5)}, 503
+
+
+def sarvam_not_configured_result():
+    logger.error("SARVAM_API_KEY not configured in environment variables")
+    return error_result("SARVAM_API_KEY not configured", 500)
+
+
+# SMS
+
+def parse_sms(data, translated=False):
+    """Fields of a /api/send_sms (or /api/send-translated-sms when translated) request"""
+    data = require_object(data)
+    to_number = data.get('to')
+    if not to_number:
+        raise InvalidRequest("Recipient phone number ('to') is required.")
+
+    default = '' if translated else 'Not specified'
+    return {
+        "to": to_number,
+        "diagnosis": data.get('diagnosis', default),
+        "medicines": data.get('medicines', default),
+        "nutrition": data.get('nutrition', default),
+        "notes": data.get('notes', default),
+        "language_name": data.get('language_name', 'Unknown Language') if translated else None,
+        "message_type": data.get('message_type', 'all'),
+        "priority": data.get('priority')
+    }
+
+
+def sms_sent_result(sms, sms_details, delivery, message_sid):
+    payload = {
+        "status": "success",
+        "duplicate": False,
+        "delivery_id": delivery['delivery_id'],
+        "message_sid": message_sid,
+        "to": sms['to'],
+        "message_type": sms['message_type'],
+        "segments": sms_details['segments'],
+        "encoding": sms_details['encoding'],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    if sms['language_name'] is not None:
+        payload["language"] = sms['language_name']
+    return payload, 200
+
+
+def sms_queued_result(sms, sms_details, job, created):
+    return {
+        "status": "success",
+        "job_id": job['job_id'],
+        "job_status": job['status'],
+        "duplicate": not created,
+        "to": sms['to'],
+        "message_type": sms['message_type'],
+        "segments": sms_details['segments'],
+        "encoding": sms_details['encoding'],
+        "status_url": f"/api/sms/{job['job_id']}",
+        "timestamp": datetime.utcnow().isoformat()
+    }, 202
+
+
+def duplicate_delivery_result(delivery):
+    """The original result for a repeated send, or 409 while it is in flight"""
+    logger.info(f"Repeated SMS to {delivery['to_number']} answered with delivery {delivery['delivery_id']}")
+    if not delivery['message_sid']:
+        return {
+            "status": "error",
+            "error": "An identical SMS to this number is still being sent",
+            "delivery_id": delivery['delivery_id'],
+            "retry_after": 1
+        }, 409
+    return {
+        "status": "success",
+        "duplicate": True,
+        "delivery_id": delivery['delivery_id'],
+        "message_sid": delivery['message_sid'],
+        "delivery_status": delivery['status'],
+        "to": delivery['to_number'],
+        "message_type": delivery['message_type'],
+        "segments": delivery['segments'],
+        "encoding": delivery['encoding'],
+        "timestamp": datetime.utcnow().isoformat()
+    }, 200
+
+
+def sms_failure_result(error, twilio_error):
+    """Answer for an SMS that could not be sent; twilio_error is TwilioRestException"""
+    if isinstance(error, twilio_error):
+        logger.error(f"Twilio Error: {error}")
+        return error_result(f"Twilio error: {str(error)}", 400)
+    if isinstance(error, QueueTimeout):
+        logger.warning(f"SMS not sent: {error}")
+        return retry_later_result(f"SMS capacity exhausted: {error}", 1)
+    logger.error(f"Server Error: {error}")
+    return error_result(f"Internal server error: {str(error)}", 500)
+
+
+# Translation
+
+def parse_translate(data, languages):
+    """Fields of a /api/translate request"""
+    data = require_object(data)
+    text = data.get('text', '')
+    target_lang = data.get('targetLang', 'mr-IN')
+    if not text:
+        raise InvalidRequest("No text provided for translation")
+    if target_lang not in supported_codes(languages):
+        raise InvalidRequest(f"Unsupported target language. Supported: {list(languages.keys())}")
+    return {
+        "text": text,
+        "source_lang": data.get('sourceLang', 'en-IN'),
+        "target_lang": target_lang,
+        "priority": data.get('priority')
+    }
+
+
+def parse_target_languages(data, languages):
+    """Deduplicated targetLanguages of a batch or consultation request"""
+    target_languages = data.get('targetLanguages', [])
+    if not target_languages:
+        raise InvalidRequest("No target languages specified")
+    codes = supported_codes(languages)
+    for lang in target_languages:
+        if lang not in codes:
+            raise InvalidRequest(f"Unsupported language: {lang}")
+    return list(dict.fromkeys(target_languages))
+
+
+def parse_batch(data, languages):
+    """Fields of a /api/batch-translate (or /stream) request"""
+    data = require_object(data)
+    text = data.get('text', '')
+    if not text:
+        raise InvalidRequest("No text provided for translation")
+    return {
+        "text": text,
+        "target_languages": parse_target_languages(data, languages),
+        "priority": data.get('priority')
+    }
+
+
+def parse_consultation(data, languages):
+    """Fields of a /api/translate-consultation request; 'active' holds the fields worth translating"""
+    data = require_object(data)
+    target_languages = parse_target_languages(data, languages)
+    fields = {name: data.get(name, '') or '' for name in CONSULTATION_FIELDS}
+    # Empty and 'Not specified' fields are passed through untouched
+    active = {name: value for name, value in fields.items() if is_translatable(value)}
+    if not active:
+        raise InvalidRequest("No consultation fields provided for translation")
+    return {
+        "source_lang": data.get('sourceLang', 'en-IN'),
+        "target_languages": target_languages,
+        "fields": fields,
+        "active": active,
+        "priority": data.get('priority')
+    }
+
+
+def glossary_plan(glossary, text, source_lang, target_lang, split_partial):
+    """(segments, uncovered) when text is answered span by span, None when it goes upstream whole.
+
+    Text the glossary covers fully is answered locally (uncovered is empty).
+    Partly covered text goes upstream whole, with protected terms masked
+    (see Glossary.protect), so the translator sees complete sentences; only
+    with split_partial are its uncovered spans translated one by one.
+    uncovered maps segment index -> span for the spans that still need an upstream translation.
+    """
+    # The phrase tables are English -> target language
+    if source_lang != 'en-IN':
+        return None
+    segments = glossary.segment(text, target_lang)
+    coverage = glossary.record(segments)
+    if coverage == 'none' or (coverage == 'partial' and not split_partial):
+        return None
+    uncovered = {
+        index: span for index, (span, translation) in enumerate(segments)
+        if translation is None and glossary.needs_translation(span)
+    }
+    return segments, uncovered
+
+
+def assemble_segments(segments, translated):
+    """Join glossary segments back together with the upstream translations of the uncovered spans"""
+    parts = []
+    for index, (span, translation) in enumerate(segments):
+        if translation is not None:
+            parts.append(translation)
+        elif index in translated:
+            leading = span[:len(span) - len(span.lstrip())]
+            trailing = span[len(span.rstrip()):]
+            parts.append(leading + translated[index] + trailing)
+        else:
+            parts.append(span)
+    return ''.join(parts)
+
+
+def split_consultation_fields(glossary, fields, source_lang, target_lang):
+    """Split fields into the ones the glossary covers fully and the ones that go upstream.
+
+    Returns ({name: translation}, {name: masked text}, {name: protected terms}).
+    """
+    local = {}
+    remaining = {}
+    protected = {}
+    for name, value in fields.items():
+        segments = glossary.segment(value, target_lang) if source_lang == 'en-IN' else None
+        if segments and glossary.record(segments) == 'full':
+            local[name] = ''.join(span if translation is None else translation for span, translation in segments)
+        else:
+            remaining[name], protected[name] = glossary.protect(value)
+    return local, remaining, protected
+
+
+def restore_fields(glossary, translated, protected):
+    """Put protected terms back into translated fields; returns ({name: text}, [names that lost a placeholder])"""
+    restored = {}
+    lost = []
+    for name, text in translated.items():
+        text = glossary.restore(text, protected.get(name))
+        if text is None:
+            lost.append(name)
+        else:
+            restored[name] = text
+    return restored, lost
+
+
+def translation_result(params, translated_text, languages):
+    return {
+        "status": "success",
+        "translated_text": translated_text,
+        "source_language": params['source_lang'],
+        "target_language": params['target_lang'],
+        "language_name": language_name(languages, params['target_lang']),
+        "timestamp": datetime.utcnow().isoformat()
+    }, 200
+
+
+def translation_failure_result(error, timeout_errors=(), connection_errors=()):
+    """Answer for a failed /api/translate; the error classes differ between requests and aiohttp"""
+    if isinstance(error, SarvamAPIError):
+        logger.error(f"Translation API Error: {error}")
+        return {
+            "status": "error",
+            "error": "Translation service unavailable",
+            "details": error.text[:200] if error.text else "No error details"
+        }, error.status_code
+    if isinstance(error, CircuitOpenError):
+        logger.warning(f"Translation rejected: {error}")
+        return retry_later_result(f"Translation service temporarily unavailable for {error.key}", error.retry_after)
+    if isinstance(error, QueueTimeout):
+        logger.warning(f"Translation rejected: {error}")
+        return retry_later_result(f"Translation capacity exhausted: {error}", 1)
+    if isinstance(error, timeout_errors):
+        logger.error("Translation request timeout")
+        return error_result("Translation request timeout", 408)
+    if isinstance(error, connection_errors):
+        logger.error("Cannot connect to translation service")
+        return error_result("Cannot connect to translation service", 503)
+    logger.error(f"Translation Error: {error}")
+    return error_result(f"Translation failed: {str(error)}", 500)
+
+
+def batch_language_result(languages, target_lang, translated_text, error):
+    """Per-language entry of a batch translation response"""
+    if error is None:
+        return {
+            "translated_text": translated_text,
+            "language_name": language_name(languages, target_lang),
+            "status": "success"
+        }
+    return {
+        "translated_text": "",
+        "language_name": language_name(languages, target_lang),
+        "status": "error",
+        "error": upstream_error(error)
+    }
+
+
+def batch_result(languages, target_languages, outcomes):
+    """/api/batch-translate answer from {language: (translated_text, error)}"""
+    return {
+        "status": "success",
+        "translations": {
+            target_lang: batch_language_result(languages, target_lang, *outcomes[target_lang])
+            for target_lang in target_languages
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }, 200
+
+
+def stream_summary(languages, succeeded, elapsed):
+    return {
+        "status": "success",
+        "languages": languages,
+        "succeeded": succeeded,
+        "failed": languages - succeeded,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def consultation_result(languages, params, outcomes):
+    """/api/translate-consultation answer from {language: ((fields, upstream requests), error)}"""
+    results = {}
+    for target_lang in params['target_languages']:
+        outcome, error = outcomes[target_lang]
+        result = {"language_name": language_name(languages, target_lang)}
+        if error is None:
+            translated_fields, upstream_requests = outcome
+            result.update(params['fields'])
+            result.update(translated_fields)
+            result["upstream_requests"] = upstream_requests
+            result["status"] = "success"
+        else:
+            result.update({name: '' for name in CONSULTATION_FIELDS})
+            result["status"] = "error"
+            result["error"] = upstream_error(error)
+        results[target_lang] = result
+
+    return {
+        "status": "success",
+        "translations": results,
+        "translated_fields": list(params['active']),
+        "timestamp": datetime.utcnow().isoformat()
+    }, 200
+
+
+def test_translate_result(languages, outcomes):
+    """/api/test-translate answer from {language: (upstream response, error)}"""
+    results = {}
+    for target_lang in TEST_TRANSLATE_LANGUAGES:
+        sarvam_response, error = outcomes[target_lang]
+        language = language_name(languages, target_lang)
+        if error is not None:
+            results[target_lang] = {"status": "error", "language": language, "preview": str(error)[:50]}
+            continue
+        results[target_lang] = {
+            "status": sarvam_response.status_code,
+            "language": language,
+            "preview": sarvam_response.text[:50] if sarvam_response.text else "No response"
+        }
+
+    return {
+        "status": "success",
+        "test_text": TEST_TRANSLATE_TEXT,
+        "results": results
+    }, 200
@@ -1,13 +1,42 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
+from twilio.request_validator import RequestValidator
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import requests
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import hashlib
 import logging
 import json
+import time
+
+import api_requests
+import consultation_render
+from consultation_packing import join_chunk, pack_fields, split_chunk, unpack_fields
+from delivery_log import DeliveryLog
+from event_stream import MEDIA_TYPES as STREAM_MEDIA_TYPES, STREAM_HEADERS, choose_format, encode_event
+from fanout import FanOut, FanOutTimeout, time_left
+from glossary import Glossary
+from health_probe import STATUS_DOWN, STATUS_UNAUTHORIZED, STATUS_UP, DependencyProber
+from message_templates import TemplateRegistry
+from metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_REQUESTS, REGISTRY,
+                     SMS_CHARACTERS, SMS_MESSAGES, SMS_SEGMENTS, TWILIO_IN_FLIGHT, TWILIO_REQUESTS, UPLOAD_BYTES,
+                     UPLOADS, MultiProcessCollector)
+from outbound_scheduler import (BATCH, CLASS_LIMIT, LIVE, ROUTINE, URGENT, PriorityScheduler, QueueTimeout,
+                                outbound_priority, priority_for_message_type, resolve_priority)
+from pdf_renderer import FontNotAvailable, PDFRenderer, stream_file
+from rate_limit import SharedTokenBucket
+from sarvam_client import SarvamAPIError, SarvamClient, build_payload
+from singleflight import FlightTimeout, SingleFlight
+from sms_encoding import describe
+from sms_outbox import PermanentSendError, RetryLater, SMSOutbox
+from translation_cache import TranslationCache, make_cache_key
+from twilio_http import TWILIO_API_URL, RebasedTwilioHttpClient
+from upload_store import BLOB_NAME, UploadStore, UploadTooLarge
+from upstream_guard import CircuitOpenError, UpstreamGuard, is_timeout_error
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -19,19 +48,196 @@ CORS(app)  # This handles CORS for all routes
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(g.metrics_route)
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' in g:
+        HTTP_REQUESTS.observe(time.perf_counter() - g.metrics_start, g.metrics_route, request.method,
+                              str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if 'metrics_route' in g:
+        HTTP_IN_FLIGHT.dec(g.metrics_route)
+
 # Fetch Twilio credentials from environment variables
 ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 MESSAGING_SERVICE_SID = os.environ.get("MESSAGING_SERVICE_SID", "MG5f279602eea059dd0207a0ddc7e18290")
+# Send Twilio API calls elsewhere, e.g. to the local stand-in in bench/fake_upstreams.py
+TWILIO_API_BASE_URL = os.environ.get("TWILIO_API_BASE_URL")
 SARVAM_API_KEY = os.environ.get("SARVAM_API_KEY")
 
+# Sarvam AI translation settings
+SARVAM_BASE_URL = os.environ.get("SARVAM_BASE_URL", "https://api.sarvam.ai")
+SARVAM_MODEL = os.environ.get("SARVAM_MODEL", "sarvam-translate:v1")
+SARVAM_POOL_SIZE = int(os.environ.get("SARVAM_POOL_SIZE", 16))
+SARVAM_MAX_RETRIES = int(os.environ.get("SARVAM_MAX_RETRIES", 2))
+SARVAM_BACKOFF_BASE = float(os.environ.get("SARVAM_BACKOFF_BASE", 0.25))
+
+# Translation cache settings
+TRANSLATION_CACHE_PATH = os.environ.get(
+    "TRANSLATION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "translation_cache.db")
+)
+TRANSLATION_CACHE_TTL = int(os.environ.get("TRANSLATION_CACHE_TTL", 7 * 24 * 3600))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_MAX_ENTRIES", 5000))
+TRANSLATION_CACHE_MAX_BYTES = int(os.environ.get("TRANSLATION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Disk tier bound: rows kept in the shared store, and how often each worker sweeps it (seconds)
+TRANSLATION_CACHE_DISK_MAX_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_DISK_MAX_ENTRIES", 200000))
+TRANSLATION_CACHE_SWEEP_INTERVAL = float(os.environ.get("TRANSLATION_CACHE_SWEEP_INTERVAL", 300))
+# How often a worker checks whether another worker purged the cache (its memory tier is then emptied)
+TRANSLATION_CACHE_PURGE_CHECK_INTERVAL = float(os.environ.get("TRANSLATION_CACHE_PURGE_CHECK_INTERVAL", 1.0))
+
+# Multi-language fan-out settings (keep concurrency inside the Sarvam quota)
+SARVAM_MAX_CONCURRENCY = int(os.environ.get("SARVAM_MAX_CONCURRENCY", 4))
+TRANSLATE_LANGUAGE_TIMEOUT = float(os.environ.get("TRANSLATE_LANGUAGE_TIMEOUT", 30))
+BATCH_TRANSLATE_DEADLINE = float(os.environ.get("BATCH_TRANSLATE_DEADLINE", 45))
+
+# Sarvam timeouts follow a rolling latency percentile (times a multiplier), capped by the fixed limits above
+SARVAM_TIMEOUT_PERCENTILE = float(os.environ.get("SARVAM_TIMEOUT_PERCENTILE", 0.99))
+SARVAM_TIMEOUT_MULTIPLIER = float(os.environ.get("SARVAM_TIMEOUT_MULTIPLIER", 2.0))
+SARVAM_TIMEOUT_MIN = float(os.environ.get("SARVAM_TIMEOUT_MIN", 2.0))
+SARVAM_LATENCY_WINDOW = int(os.environ.get("SARVAM_LATENCY_WINDOW", 500))
+# Hedged second request for slow calls: fixed delay (0 = the rolling p95) and the share of calls that may hedge
+SARVAM_HEDGE_DELAY = float(os.environ.get("SARVAM_HEDGE_DELAY", 0))
+SARVAM_HEDGE_BUDGET = float(os.environ.get("SARVAM_HEDGE_BUDGET", 0.1))
+SARVAM_HEDGE_WORKERS = int(os.environ.get("SARVAM_HEDGE_WORKERS", 32))
+# Per-language circuit breaker: consecutive failures to open it, seconds before a trial call
+SARVAM_BREAKER_THRESHOLD = int(os.environ.get("SARVAM_BREAKER_THRESHOLD", 5))
+SARVAM_BREAKER_COOLDOWN = float(os.environ.get("SARVAM_BREAKER_COOLDOWN", 30))
+
+# Maximum input length of one Sarvam translate request (sarvam-translate:v1 accepts 2000)
+SARVAM_MAX_INPUT_CHARS = int(os.environ.get("SARVAM_MAX_INPUT_CHARS", 2000))
+
+# Local medical glossary (English -> target language phrase tables)
+GLOSSARY_DIR = os.environ.get(
+    "GLOSSARY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "glossaries")
+)
+# Translate text around partial glossary matches span by span instead of as a whole. Off by default:
+# separately translated fragments lose the sentence's word order. Whole texts go upstream with
+# protected terms masked, and only text the glossary covers fully is answered locally.
+GLOSSARY_SPLIT_PARTIAL = os.environ.get("GLOSSARY_SPLIT_PARTIAL", "False").lower() == 'true'
+
+# SMS delivery settings ('sync' sends on the request thread, 'outbox' queues for background dispatch)
+SMS_DELIVERY_MODE = os.environ.get("SMS_DELIVERY_MODE", "sync").lower()
+SMS_OUTBOX_PATH = os.environ.get(
+    "SMS_OUTBOX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sms_outbox.db")
+)
+SMS_OUTBOX_WORKERS = int(os.environ.get("SMS_OUTBOX_WORKERS", 2))
+SMS_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("SMS_OUTBOX_MAX_ATTEMPTS", 5))
+# Job lease (renewed while a send runs) and the longest a job waits for a Twilio token before it is deferred
+SMS_OUTBOX_LEASE_SECONDS = float(os.environ.get("SMS_OUTBOX_LEASE_SECONDS", 60))
+SMS_OUTBOX_MAX_WAIT = float(os.environ.get("SMS_OUTBOX_MAX_WAIT", 20))
+# Run outbox dispatch workers in this process (off for offline tools that import the app)
+SMS_OUTBOX_DISPATCH = os.environ.get("SMS_OUTBOX_DISPATCH", "True").lower() == 'true'
+
+# Delivery log: one record per SMS sent, used for idempotency and Twilio delivery receipts
+SMS_DELIVERY_LOG_PATH = os.environ.get(
+    "SMS_DELIVERY_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sms_deliveries.db")
+)
+# Seconds in which an identical SMS to the same number (without an Idempotency-Key) counts as a repeat
+SMS_DEDUP_WINDOW = float(os.environ.get("SMS_DEDUP_WINDOW", 60))
+# Public URL of /api/sms/status-callback; Twilio only sends receipts when this is set
+SMS_STATUS_CALLBACK_URL = os.environ.get("SMS_STATUS_CALLBACK_URL")
+SMS_RECEIPT_FLUSH_INTERVAL = float(os.environ.get("SMS_RECEIPT_FLUSH_INTERVAL", 1.0))
+SMS_RECEIPT_BATCH_SIZE = int(os.environ.get("SMS_RECEIPT_BATCH_SIZE", 200))
+TWILIO_VALIDATE_CALLBACKS = os.environ.get("TWILIO_VALIDATE_CALLBACKS", "True").lower() == 'true'
+
+# Outbound SMS pacing, matched to the Messaging Service messages-per-second ceiling
+SMS_RATE_PER_SECOND = float(os.environ.get("SMS_RATE_PER_SECOND", 1))
+SMS_RATE_BURST = float(os.environ.get("SMS_RATE_BURST", SMS_RATE_PER_SECOND))
+SMS_BULK_MAX_RECIPIENTS = int(os.environ.get("SMS_BULK_MAX_RECIPIENTS", 500))
+
+# Sarvam calls per second across all worker processes; Twilio sends are paced by SMS_RATE_PER_SECOND
+SARVAM_RATE_PER_SECOND = float(os.environ.get("SARVAM_RATE_PER_SECOND", 20))
+SARVAM_RATE_BURST = float(os.environ.get("SARVAM_RATE_BURST", SARVAM_RATE_PER_SECOND))
+# SQLite file holding the Sarvam and Twilio token buckets, shared by every worker process on the host.
+# Set it to '' to pace each process on its own; the rates above then apply per worker, so divide them
+# by the number of workers (GUNICORN_WORKERS) to stay within the upstream quotas.
+RATE_LIMIT_DB_PATH = os.environ.get(
+    "RATE_LIMIT_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "rate_limits.db")
+)
+# Longest an outbound call may queue for its upstream, per priority class (live > urgent > routine > batch)
+OUTBOUND_MAX_WAIT = {
+    LIVE: float(os.environ.get("OUTBOUND_MAX_WAIT_LIVE", 5)),
+    URGENT: float(os.environ.get("OUTBOUND_MAX_WAIT_URGENT", 10)),
+    ROUTINE: float(os.environ.get("OUTBOUND_MAX_WAIT_ROUTINE", 30)),
+    BATCH: float(os.environ.get("OUTBOUND_MAX_WAIT_BATCH", 60)),
+}
+# Share of each upstream's burst a class leaves untouched for the classes above it. The queues above
+# order calls within one process; these keep a batch run in one worker from draining the shared bucket
+# ahead of live calls in another. They need a burst (SARVAM_RATE_BURST, SMS_RATE_BURST) above 1.
+OUTBOUND_RESERVE = {
+    LIVE: 0.0,
+    URGENT: float(os.environ.get("OUTBOUND_RESERVE_URGENT", 0.1)),
+    ROUTINE: float(os.environ.get("OUTBOUND_RESERVE_ROUTINE", 0.25)),
+    BATCH: float(os.environ.get("OUTBOUND_RESERVE_BATCH", 0.5)),
+}
+
+# Segment budget per SMS; longer messages are compacted rather than cut blindly
+SMS_MAX_SEGMENTS = int(os.environ.get("SMS_MAX_SEGMENTS", 6))
+
+# Pre-localized SMS/PDF boilerplate, one <code>.json per language
+LOCALES_DIR = os.environ.get(
+    "LOCALES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+)
+
+# Server-side PDF rendering: Noto script fonts and the content-addressed PDF cache
+PDF_FONT_DIR = os.environ.get(
+    "PDF_FONT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+)
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_cache")
+)
+PDF_CACHE_MAX_FILES = int(os.environ.get("PDF_CACHE_MAX_FILES", 1000))
+
+# Content-addressed uploads, in the directory the Node server also writes
+UPLOAD_DIR = os.environ.get(
+    "UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+)
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 64 * 1024))
+UPLOAD_MAX_AGE = int(os.environ.get("UPLOAD_MAX_AGE", 7 * 24 * 3600))
+# Internal nginx location mapped to UPLOAD_DIR; when set, nginx serves blob bodies (X-Accel-Redirect)
+UPLOAD_X_ACCEL_PREFIX = os.environ.get("UPLOAD_X_ACCEL_PREFIX")
+
+# Background reachability checks of Sarvam and Twilio reported by /api/health (interval 0 disables them)
+HEALTH_PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", 30))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", 5))
+# Seconds clients may reuse /api/languages before revalidating it with If-None-Match
+LANGUAGES_MAX_AGE = int(os.environ.get("LANGUAGES_MAX_AGE", 300))
+
+# Directory through which worker processes share metrics, so /api/metrics on any worker reports them all
+# (gunicorn.conf.py sets one up). Unset, each worker reports only itself, labelled with its pid.
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
 # Validate that the credentials exist
 if not all([ACCOUNT_SID, AUTH_TOKEN]):
     raise ValueError("Twilio credentials are not set in the environment variables.")
 
 # Initialize the Twilio Client
 try:
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
+    if TWILIO_API_BASE_URL:
+        client = Client(ACCOUNT_SID, AUTH_TOKEN, http_client=RebasedTwilioHttpClient(TWILIO_API_BASE_URL))
+        logger.warning(f"Twilio API calls are sent to {TWILIO_API_BASE_URL}")
+    else:
+        client = Client(ACCOUNT_SID, AUTH_TOKEN)
     logger.info("Twilio client initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize Twilio client: {str(e)}")
@@ -51,230 +257,703 @@ SUPPORTED_LANGUAGES = {
     'en': {'code': 'en-IN', 'name': 'English'}
 }
 
-def format_sms_message(message_type, diagnosis, medicines, nutrition, notes):
-    """Format SMS message based on the type of content being sent"""
-    
-    if message_type == 'diagnosis':
-        return f"""Medical Diagnosis: {diagnosis}
-Please consult your doctor for any concerns."""
-
-    elif message_type == 'medicines':
-        return f"""Prescribed Medicines: {medicines}
-Take as directed by doctor."""
-
-    elif message_type == 'nutrition':
-        # Take first 150 characters for SMS brevity
-        short_nutrition = nutrition[:150] + "..." if len(nutrition) > 150 else nutrition
-        return f"""Nutrition Plan: {short_nutrition}
-Follow this dietary advice for better recovery."""
-
-    elif message_type == 'notes':
-        return f"""Important Notes: {notes}
-Please follow these instructions carefully."""
-
-    elif message_type == 'all':
-        message = "Medical Consultation Summary:"
-        if diagnosis and diagnosis != 'Not specified':
-            message += f"Diagnosis: {diagnosis}"
-        if medicines and medicines != 'Not specified':
-            message += f"Medicines: {medicines}"
-        if nutrition and nutrition != 'Not specified':
-            # Shorten nutrition for SMS
-            short_nutrition = nutrition[:100] + "..." if len(nutrition) > 100 else nutrition
-            message += f"Nutrition: {short_nutrition}"
-        if notes and notes != 'Not specified':
-            message += f"Notes: {notes}"
-        message += "Follow medical advice and consult your doctor for concerns."
-        return message
+# /api/languages is static for the life of the process: serialized once, revalidated by ETag
+LANGUAGES_BODY = json.dumps({
+    "status": "success",
+    "languages": SUPPORTED_LANGUAGES,
+    "default_source": "en-IN"
+})
+LANGUAGES_ETAG = hashlib.sha256(LANGUAGES_BODY.encode('utf-8')).hexdigest()[:32]
 
-    else:
-        return "Medical consultation information."
+# Message templates compiled once for every message type and language
+message_templates = TemplateRegistry.load(LOCALES_DIR, SUPPORTED_LANGUAGES)
 
-def format_translated_sms_message(message_type, diagnosis, medicines, nutrition, notes, language_name):
-    """Format SMS message for translated content"""
-    
-    if message_type == 'diagnosis':
-        return f"""Medical Diagnosis ({language_name}): {diagnosis}
-
-Please consult your doctor for any concerns."""
-
-    elif message_type == 'medicines':
-        return f"""Prescribed Medicines ({language_name}): {medicines}
-Take as directed by your doctor."""
-
-    elif message_type == 'nutrition':
-        # Take first 150 characters for SMS brevity
-        short_nutrition = nutrition[:150] + "..." if len(nutrition) > 150 else nutrition
-        return f"""Nutrition Plan ({language_name}): {short_nutrition}
-
-Follow this dietary advice for better recovery."""
-
-    elif message_type == 'notes':
-        return f"""Important Notes ({language_name}):{notes}
-
-Please follow these instructions carefully."""
-    elif message_type == 'all':
-        message = f"Medical Consultation Summary ({language_name}):"
-        if diagnosis and diagnosis != 'Not specified':
-            message += f"Diagnosis: {diagnosis}"
-        if medicines and medicines != 'Not specified':
-            message += f"Medicines: {medicines}"
-        if nutrition and nutrition != 'Not specified':
-            # Shorten nutrition for SMS
-            short_nutrition = nutrition[:100] + "..." if len(nutrition) > 100 else nutrition
-            message += f"Nutrition: {short_nutrition}\n\n"
-        if notes and notes != 'Not specified':
-            message += f"Notes: {notes}"
-        message += "Follow medical advice and consult your doctor for concerns."
-        return message
+# Rendered PDFs cached on disk by content hash; fonts are subset once per process
+pdf_renderer = PDFRenderer(PDF_CACHE_DIR, PDF_FONT_DIR, max_files=PDF_CACHE_MAX_FILES)
+
+# Concurrent renders of the same report share one render
+pdf_flights = SingleFlight()
+
+# Uploaded reports and recordings, stored once per distinct content
+upload_store = UploadStore(UPLOAD_DIR, max_bytes=UPLOAD_MAX_BYTES, chunk_size=UPLOAD_CHUNK_SIZE)
+
+# Shared translation cache (memory LRU backed by SQLite)
+translation_cache = TranslationCache(
+    db_path=TRANSLATION_CACHE_PATH or None,
+    ttl_seconds=TRANSLATION_CACHE_TTL,
+    max_entries=TRANSLATION_CACHE_MAX_ENTRIES,
+    max_bytes=TRANSLATION_CACHE_MAX_BYTES,
+    purge_check_interval=TRANSLATION_CACHE_PURGE_CHECK_INTERVAL,
+    disk_max_entries=TRANSLATION_CACHE_DISK_MAX_ENTRIES,
+    sweep_interval=TRANSLATION_CACHE_SWEEP_INTERVAL
+)
+
+# Shared keep-alive client for all Sarvam calls
+sarvam_client = SarvamClient(
+    SARVAM_API_KEY,
+    base_url=SARVAM_BASE_URL,
+    pool_maxsize=max(SARVAM_POOL_SIZE, SARVAM_MAX_CONCURRENCY),
+    max_retries=SARVAM_MAX_RETRIES,
+    backoff_base=SARVAM_BACKOFF_BASE
+)
+
+def outbound_bucket(upstream, rate, burst):
+    """Token bucket for an upstream: shared between worker processes unless RATE_LIMIT_DB_PATH is empty"""
+    if not RATE_LIMIT_DB_PATH:
+        return None
+    return SharedTokenBucket(RATE_LIMIT_DB_PATH, upstream, rate, burst)
+
+# Paces Sarvam calls to the quota, serving queued calls by priority class
+sarvam_scheduler = PriorityScheduler('sarvam', SARVAM_RATE_PER_SECOND, SARVAM_RATE_BURST, OUTBOUND_MAX_WAIT,
+                                     bucket=outbound_bucket('sarvam', SARVAM_RATE_PER_SECOND, SARVAM_RATE_BURST),
+                                     reserves=OUTBOUND_RESERVE)
+
+# Known phrases and protected terms answered without an upstream call
+glossary = Glossary.load(GLOSSARY_DIR)
+
+# Coalesces identical concurrent translation requests
+translation_flights = SingleFlight()
 
+# Bounded worker pool for per-language translation requests
+translation_fanout = FanOut(max_workers=SARVAM_MAX_CONCURRENCY, thread_name_prefix='sarvam')
+
+def is_upstream_failure(error):
+    """Whether an error says Sarvam is unhealthy (as opposed to rejecting this one request)"""
+    if isinstance(error, SarvamAPIError):
+        return error.status_code >= 500 or error.status_code == 429
+    # Waiting too long for a local rate-limit token, or running out of fan-out time before
+    # the call, is congestion here, not a Sarvam fault
+    return not isinstance(error, (QueueTimeout, FanOutTimeout))
+
+def is_upstream_timeout(error):
+    """Whether a Sarvam attempt ran out of time, with requests here or aiohttp in asgi.py"""
+    return isinstance(error, requests.exceptions.Timeout) or is_timeout_error(error)
+
+# Adaptive timeouts, hedging and per-language circuit breakers for Sarvam calls
+sarvam_guard = UpstreamGuard(
+    'sarvam',
+    timeout_percentile=SARVAM_TIMEOUT_PERCENTILE,
+    timeout_multiplier=SARVAM_TIMEOUT_MULTIPLIER,
+    min_timeout=SARVAM_TIMEOUT_MIN,
+    window=SARVAM_LATENCY_WINDOW,
+    hedge_delay=SARVAM_HEDGE_DELAY or None,
+    hedge_ratio=SARVAM_HEDGE_BUDGET,
+    hedge_workers=SARVAM_HEDGE_WORKERS,
+    failure_threshold=SARVAM_BREAKER_THRESHOLD,
+    cooldown=SARVAM_BREAKER_COOLDOWN,
+    is_failure=is_upstream_failure,
+    is_timeout=is_upstream_timeout
+)
+
+def sarvam_translate(text, source_lang, target_lang, timeout=30):
+    """Translate text with Sarvam AI, serving repeated requests from the translation cache"""
+    cached = translation_cache.get(text, source_lang, target_lang, SARVAM_MODEL)
+    if cached is not None:
+        return cached
+
+    # Within a fan-out the call gets only what is left of the item's deadline
+    timeout = time_left(timeout)
+    # Identical requests already in flight share one upstream call
+    key = make_cache_key(text, source_lang, target_lang, SARVAM_MODEL)
+    return translation_flights.do(key, lambda: fetch_translation(text, source_lang, target_lang, timeout),
+                                  timeout=timeout)
+
+def fetch_translation(text, source_lang, target_lang, timeout):
+    """Call Sarvam AI for one translation and store the result in the cache"""
+    def attempt(attempt_timeout):
+        # The token wait before each attempt also uses up the fan-out item's time
+        attempt_timeout = time_left(attempt_timeout)
+        # Retries inside the client queue for a token of their own
+        sarvam_response = sarvam_client.translate(text, source_lang, target_lang, SARVAM_MODEL,
+                                                  timeout=attempt_timeout, acquire=sarvam_scheduler.acquire)
+        if sarvam_response.status_code != 200:
+            raise SarvamAPIError(sarvam_response.status_code, sarvam_response.text)
+        return sarvam_response
+
+    # Fails fast with CircuitOpenError while this language's breaker is open; each attempt
+    # (hedges included) first queues for a Sarvam token at the current priority class
+    sarvam_response = sarvam_guard.call(target_lang, attempt, timeout, acquire=sarvam_scheduler.acquire)
+
+    translated_text = sarvam_response.json().get('translated_text', '')
+    if translated_text:
+        translation_cache.set(text, source_lang, target_lang, SARVAM_MODEL, translated_text)
+    return translated_text
+
+def translate_packed(chunks, source_lang, target_lang, timeout=None):
+    """Translate packed chunks (see consultation_packing) and unpack them into {name: text}"""
+    timeout = timeout or TRANSLATE_LANGUAGE_TIMEOUT
+    translated_pieces = []
+    for chunk in chunks:
+        translated = sarvam_translate(join_chunk(chunk), source_lang, target_lang, timeout=timeout)
+        parts = split_chunk(translated, len(chunk))
+        if parts is None:
+            # The delimiters did not survive translation; fall back to one call per piece
+            logger.warning(f"Packed translation for {target_lang} lost its delimiters; translating pieces individually")
+            parts = [sarvam_translate(piece[1], source_lang, target_lang, timeout=timeout) for piece in chunk]
+        translated_pieces.extend(parts)
+    return unpack_fields(chunks, translated_pieces)
+
+def translate_protected(text, source_lang, target_lang, timeout=30):
+    """Translate text whole, holding protected terms back from the translator as placeholders"""
+    masked, terms = glossary.protect(text)
+    restored = glossary.restore(sarvam_translate(masked, source_lang, target_lang, timeout=timeout), terms)
+    if restored is None:
+        logger.warning(f"Translation to {target_lang} lost a protected-term placeholder; translating unmasked text")
+        return sarvam_translate(text, source_lang, target_lang, timeout=timeout)
+    return restored
+
+def translate_with_glossary(text, source_lang, target_lang, timeout=30):
+    """Translate text, answering it locally when the glossary covers it fully"""
+    plan = api_requests.glossary_plan(glossary, text, source_lang, target_lang, GLOSSARY_SPLIT_PARTIAL)
+    if plan is None:
+        return translate_protected(text, source_lang, target_lang, timeout=timeout)
+
+    segments, uncovered = plan
+    translated = {}
+    if uncovered:
+        # All uncovered spans travel together in as few upstream calls as possible
+        translated = translate_packed(pack_fields(uncovered, SARVAM_MAX_INPUT_CHARS), source_lang, target_lang, timeout)
+    return api_requests.assemble_segments(segments, translated)
+
+def sms_language_label(language):
+    """Bounded metrics label for an SMS language: a locale code, 'en-IN' or 'other'"""
+    if not language:
+        return 'en-IN'
+    return message_templates.resolve(language) or 'other'
+
+def record_sms_sent(message_body, language=None):
+    """Count characters and billable segments for an SMS Twilio accepted"""
+    label = sms_language_label(language)
+    details = describe(message_body)
+    SMS_MESSAGES.inc(label)
+    SMS_CHARACTERS.inc(label, amount=details['characters'])
+    SMS_SEGMENTS.inc(label, details['encoding'], amount=details['segments'])
+
+def twilio_message_params(delivery_id=None):
+    """Extra Messages API parameters: ask Twilio for delivery receipts when there is somewhere to send them.
+
+    The delivery id rides along in the callback URL, so a receipt can attach
+    the SID to a delivery whose sender died before recording Twilio's answer.
+    """
+    if not SMS_STATUS_CALLBACK_URL:
+        return {}
+    if delivery_id is None:
+        return {"status_callback": SMS_STATUS_CALLBACK_URL}
+    separator = '&' if '?' in SMS_STATUS_CALLBACK_URL else '?'
+    return {"status_callback": f"{SMS_STATUS_CALLBACK_URL}{separator}delivery_id={delivery_id}"}
+
+def send_via_twilio(to_number, message_body, language=None, max_wait=CLASS_LIMIT, delivery_id=None, acquired=False):
+    """Send one SMS through the Messaging Service and return the Twilio message.
+
+    Waits for a Twilio token at the current priority class, at most max_wait
+    seconds (the class limit by default). acquired=True when the caller
+    already holds a token.
+    """
+    if not acquired:
+        twilio_scheduler.acquire(max_wait=max_wait)
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        with TWILIO_IN_FLIGHT.track():
+            message = client.messages.create(
+                body=message_body,
+                messaging_service_sid=MESSAGING_SERVICE_SID,
+                to=to_number,
+                **twilio_message_params(delivery_id)
+            )
+        outcome = 'success'
+    except TwilioRestException as e:
+        outcome = str(e.status or 'error')
+        raise
+    finally:
+        TWILIO_REQUESTS.observe(time.perf_counter() - start, outcome)
+    record_sms_sent(message_body, language)
+    return message
+
+# Shared pacing for every Twilio send, queued by priority class
+twilio_scheduler = PriorityScheduler('twilio', SMS_RATE_PER_SECOND, SMS_RATE_BURST, OUTBOUND_MAX_WAIT,
+                                     bucket=outbound_bucket('twilio', SMS_RATE_PER_SECOND, SMS_RATE_BURST),
+                                     reserves=OUTBOUND_RESERVE)
+
+# Durable record of every SMS sent, with Twilio delivery receipts written in batches
+delivery_log = DeliveryLog(
+    SMS_DELIVERY_LOG_PATH,
+    flush_interval=SMS_RECEIPT_FLUSH_INTERVAL,
+    flush_batch_size=SMS_RECEIPT_BATCH_SIZE
+)
+delivery_log.start()
+
+# Upstream reachability, checked in the background so /api/health never waits on the network
+def probe_sarvam(timeout):
+    """HEAD of the Sarvam base URL: reachability and latency without spending translation quota"""
+    response = sarvam_client.session.head(SARVAM_BASE_URL, timeout=timeout)
+    response.close()
+    return (STATUS_UP if response.status_code < 500 else STATUS_DOWN), {"http_status": response.status_code}
+
+twilio_probe_session = requests.Session()
+
+def probe_twilio(timeout):
+    """Fetch of the Twilio account: proves the API is reachable and the credentials are accepted"""
+    base_url = (TWILIO_API_BASE_URL or TWILIO_API_URL).rstrip('/')
+    response = twilio_probe_session.get(f"{base_url}/2010-04-01/Accounts/{ACCOUNT_SID}.json",
+                                        auth=(ACCOUNT_SID, AUTH_TOKEN), timeout=timeout)
+    details = {"http_status": response.status_code}
+    if response.status_code in (401, 403):
+        return STATUS_UNAUTHORIZED, details
+    if response.status_code != 200:
+        return STATUS_DOWN, details
+    details["account_status"] = response.json().get('status')
+    # A suspended or closed account answers the fetch but cannot send
+    return (STATUS_UP if details["account_status"] in (None, 'active') else STATUS_UNAUTHORIZED), details
+
+dependency_prober = DependencyProber(
+    {"sarvam_ai": probe_sarvam if SARVAM_API_KEY else None, "twilio": probe_twilio},
+    interval=HEALTH_PROBE_INTERVAL,
+    timeout=HEALTH_PROBE_TIMEOUT
+)
+dependency_prober.start()
+REGISTRY.callback_gauge('dependency_up', 'Whether the last background check found the upstream API usable',
+                        ('dependency',), dependency_prober.up_values)
+
+# Checks X-Twilio-Signature on status callbacks
+twilio_request_validator = RequestValidator(AUTH_TOKEN)
+
+def reserve_delivery(idempotency_key, to_number, message_body, sms_details, message_type, language=None,
+                     dedup_window=SMS_DEDUP_WINDOW, source='sync'):
+    """Log an SMS before it is sent; returns (delivery, created) like DeliveryLog.reserve"""
+    return delivery_log.reserve(
+        to_number,
+        message_body,
+        message_type=message_type,
+        language=language,
+        segments=sms_details['segments'],
+        encoding=sms_details['encoding'],
+        idempotency_key=idempotency_key,
+        dedup_window=dedup_window,
+        source=source
+    )
+
+def record_delivery_error(delivery_id, error):
+    """Mark a reserved delivery as not sent, releasing its idempotency key"""
+    if isinstance(error, TwilioRestException):
+        delivery_log.mark_error(delivery_id, f"Twilio error: {str(error)}", error.code)
     else:
-        return f"Medical consultation information ({language_name})."
+        delivery_log.mark_error(delivery_id, str(error))
 
-@app.route('/api/send_sms', methods=['POST'])
-def send_sms():
+def send_logged(delivery_id, to_number, message_body, language=None, max_wait=CLASS_LIMIT, acquired=False):
+    """send_via_twilio for a reserved delivery, recording the SID or the failure"""
     try:
-        data = request.get_json()
-        
-        # Input validation
-        to_number = data.get('to')
-        if not to_number:
-            return jsonify({"status": "error", "error": "Recipient phone number ('to') is required."}), 400
-
-        # Extract other fields from the request
-        diagnosis = data.get('diagnosis', 'Not specified')
-        nutrition = data.get('nutrition', 'Not specified')
-        notes = data.get('notes', 'Not specified')
-        medicines = data.get('medicines', 'Not specified')
-        message_type = data.get('message_type', 'all')
-
-        # Format the SMS message based on type
-        message_body = format_sms_message(message_type, diagnosis, medicines, nutrition, notes)
-
-        # Validate message length for SMS limits
-        if len(message_body) > 1600:
-            logger.warning(f"Long SMS message detected: {len(message_body)} characters")
-            # Truncate if necessary
-            message_body = message_body[:1597] + "..."
-
-        # Send SMS via Twilio using the Messaging Service
-        message = client.messages.create(
-            body=message_body,
-            messaging_service_sid=MESSAGING_SERVICE_SID,
-            to=to_number
-        )
-        
-        # Log successful sending
-        logger.info(f"SMS sent successfully to {to_number}. Message SID: {message.sid}")
-        logger.info(f"Message type: {message_type}, Length: {len(message_body)} chars")
-        
-        # If successful, return a success response
-        return jsonify({
-            "status": "success",
-            "message_sid": message.sid,
-            "to": to_number,
-            "message_type": message_type,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        message = send_via_twilio(to_number, message_body, language, max_wait=max_wait, delivery_id=delivery_id,
+                                  acquired=acquired)
+    except Exception as e:
+        record_delivery_error(delivery_id, e)
+        raise
+    delivery_log.mark_sent(delivery_id, message.sid, message.status or 'accepted')
+    return message
+
+def api_response(result):
+    """Flask response for a (payload, status code) pair from api_requests; sets Retry-After when the payload has one"""
+    payload, status_code = result
+    response = jsonify(payload)
+    if 'retry_after' in payload:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response, status_code
+
+def read_json():
+    """The request's JSON body (whatever the Content-Type); InvalidRequest when it is malformed"""
+    return api_requests.load_json(request.get_data(cache=True))
+
+def send_outbox_job(job):
+    """Dispatch callback for the SMS outbox; returns the message SID.
+
+    The delivery is keyed by job. When an earlier claim of the job reserved
+    it but never recorded an outcome (its worker died mid-send), Twilio may
+    already have the message, so it is not sent again until the reservation
+    is settled: a receipt fills in the SID, or the reservation is abandoned
+    after the delivery log's pending timeout. A send that failed explicitly
+    released the key and goes out again straight away.
+    """
+    priority = priority_for_message_type(job.get('message_type'))
+    # Take the Twilio token before reserving: a job that cannot get one in time is deferred whole,
+    # without leaving a failed delivery behind or outliving its lease in the queue
+    try:
+        twilio_scheduler.acquire(priority, max_wait=SMS_OUTBOX_MAX_WAIT)
+    except QueueTimeout as e:
+        raise RetryLater(str(e), SMS_OUTBOX_MAX_WAIT)
 
+    delivery, created = reserve_delivery(f"outbox:{job['job_id']}", job['to_number'], job['body'], describe(job['body']),
+                                         job.get('message_type'), job.get('language'), dedup_window=0,
+                                         source='outbox')
+    if not created:
+        if delivery['message_sid']:
+            return delivery['message_sid']
+        # Recheck at least every 15s so a receipt that settles the delivery is picked up promptly
+        raise RetryLater(f"Delivery {delivery['delivery_id']} from an earlier attempt has no outcome yet",
+                         min(delivery_log.pending_expires_in(delivery) + 1, 15))
+    try:
+        with outbound_priority(priority):
+            return send_logged(delivery['delivery_id'], job['to_number'], job['body'], job.get('language'),
+                               acquired=True).sid
     except TwilioRestException as e:
-        # Handle Twilio-specific errors (e.g., invalid number, unverified number)
-        error_msg = f"Twilio error: {str(e)}"
-        logger.error(f"Twilio Error: {e}")
-        return jsonify({"status": "error", "error": error_msg}), 400
+        # Client errors (bad number, unverified recipient) will not succeed on retry
+        if e.status and 400 <= e.status < 500 and e.status != 429:
+            raise PermanentSendError(f"Twilio error: {str(e)}")
+        raise
+
+# Durable outbox for asynchronous SMS delivery
+sms_outbox = SMSOutbox(
+    SMS_OUTBOX_PATH,
+    send_outbox_job,
+    workers=SMS_OUTBOX_WORKERS,
+    lease_seconds=SMS_OUTBOX_LEASE_SECONDS,
+    max_attempts=SMS_OUTBOX_MAX_ATTEMPTS
+)
+if SMS_OUTBOX_DISPATCH:
+    sms_outbox.start()
+
+def use_outbox(data):
+    """Whether this SMS request should be queued instead of sent inline"""
+    return bool(data.get('async', SMS_DELIVERY_MODE == 'outbox'))
+
+def queue_sms(sms, message_body, sms_details, key):
+    """Persist an SMS job and build the 202 response for it"""
+    job, created = sms_outbox.enqueue(
+        sms['to'],
+        message_body,
+        message_type=sms['message_type'],
+        language=sms['language_name'],
+        idempotency_key=key
+    )
+
+    if created:
+        logger.info(f"SMS job {job['job_id']} queued for {sms['to']}")
+    else:
+        logger.info(f"Duplicate SMS request for idempotency key {key}; returning job {job['job_id']}")
+    return api_response(api_requests.sms_queued_result(sms, sms_details, job, created))
+
+def format_sms_message(message_type, diagnosis, medicines, nutrition, notes):
+    """Format SMS message based on the type of content being sent"""
+    return consultation_render.format_sms_message(message_templates, message_type, diagnosis, medicines,
+                                                  nutrition, notes)
+
+def format_translated_sms_message(message_type, diagnosis, medicines, nutrition, notes, language_name):
+    """Format SMS message for translated content, with the boilerplate in the same language"""
+    return consultation_render.format_translated_sms_message(message_templates, message_type, diagnosis, medicines,
+                                                             nutrition, notes, language_name)
+
+def build_sms_body(message_type, diagnosis, medicines, nutrition, notes, language_name=None):
+    """Render an SMS (translated when language_name is given) that fits the segment budget"""
+    return consultation_render.build_sms_body(message_templates, message_type, diagnosis, medicines, nutrition,
+                                              notes, language_name, max_segments=SMS_MAX_SEGMENTS)
+
+def send_consultation_sms(translated):
+    """Shared body of /api/send_sms and /api/send-translated-sms"""
+    try:
+        data = read_json()
+        sms = api_requests.parse_sms(data, translated)
+
+        # Format the SMS message based on type, compacted to the segment budget
+        message_body, sms_details = build_sms_body(sms['message_type'], sms['diagnosis'], sms['medicines'],
+                                                   sms['nutrition'], sms['notes'], sms['language_name'])
+
+        key = api_requests.idempotency_key(request.headers, data)
+        if use_outbox(data):
+            return queue_sms(sms, message_body, sms_details, key)
+
+        # A repeat of a send (same Idempotency-Key, or a double tap) gets the original result
+        delivery, created = reserve_delivery(key, sms['to'], message_body, sms_details, sms['message_type'],
+                                             language=sms['language_name'])
+        if not created:
+            return api_response(api_requests.duplicate_delivery_result(delivery))
+
+        # Send SMS via Twilio using the Messaging Service, ahead of lower-priority traffic
+        with outbound_priority(resolve_priority(priority_for_message_type(sms['message_type']), sms['priority'])):
+            message = send_logged(delivery['delivery_id'], sms['to'], message_body, sms['language_name'])
+
+        logger.info(f"SMS sent successfully to {sms['to']}"
+                    + (f" in {sms['language_name']}" if translated else "") + f". Message SID: {message.sid}")
+        logger.info(f"Message type: {sms['message_type']}, Length: {len(message_body)} chars, "
+                    f"Segments: {sms_details['segments']} ({sms_details['encoding']})")
+        return api_response(api_requests.sms_sent_result(sms, sms_details, delivery, message.sid))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
     except Exception as e:
-        # Handle any other unexpected errors
-        error_msg = f"Internal server error: {str(e)}"
-        logger.error(f"Server Error: {e}")
-        return jsonify({"status": "error", "error": error_msg}), 500
+        return api_response(api_requests.sms_failure_result(e, TwilioRestException))
+
+@app.route('/api/send_sms', methods=['POST'])
+def send_sms():
+    return send_consultation_sms(translated=False)
 
 @app.route('/api/send-translated-sms', methods=['POST'])
 def send_translated_sms():
     """Send SMS with translated medical content"""
+    return send_consultation_sms(translated=True)
+
+def render_bulk_message(recipient):
+    """Render one bulk recipient through the same formatters as the single-SMS routes"""
+    message_type = recipient.get('message_type', 'all')
+    language_name = recipient.get('language_name')
+    default = '' if language_name else 'Not specified'
+
+    return build_sms_body(
+        message_type,
+        recipient.get('diagnosis', default),
+        recipient.get('medicines', default),
+        recipient.get('nutrition', default),
+        recipient.get('notes', default),
+        language_name
+    )
+
+@app.route('/api/send_sms/bulk', methods=['POST'])
+def send_sms_bulk():
+    """Queue SMS for many recipients in the outbox; the outbox sends them at the Messaging Service throughput"""
     try:
-        data = request.get_json()
-        
-        # Input validation
-        to_number = data.get('to')
-        if not to_number:
-            return jsonify({"status": "error", "error": "Recipient phone number ('to') is required."}), 400
-
-        # Extract translated content
-        diagnosis = data.get('diagnosis', '')
-        nutrition = data.get('nutrition', '')
-        notes = data.get('notes', '')
-        medicines = data.get('medicines', '')
-        language_name = data.get('language_name', 'Unknown Language')
-        message_type = data.get('message_type', 'all')
-
-        # Format the SMS message for translated content
-        message_body = format_translated_sms_message(message_type, diagnosis, medicines, nutrition, notes, language_name)
-
-        # Validate message length for SMS limits
-        if len(message_body) > 1600:
-            logger.warning(f"Long translated SMS message detected: {len(message_body)} characters")
-            # Truncate if necessary
-            message_body = message_body[:1597] + "..."
-
-        # Send SMS via Twilio using the Messaging Service
-        message = client.messages.create(
-            body=message_body,
-            messaging_service_sid=MESSAGING_SERVICE_SID,
-            to=to_number
-        )
-        
-        # Log successful sending
-        logger.info(f"Translated SMS sent successfully to {to_number} in {language_name}. Message SID: {message.sid}")
-        
-        # If successful, return a success response
+        data = read_json()
+
+        recipients = data.get('recipients') if isinstance(data, dict) else None
+        if not recipients or not isinstance(recipients, list):
+            return jsonify({"status": "error", "error": "A non-empty 'recipients' list is required."}), 400
+
+        if len(recipients) > SMS_BULK_MAX_RECIPIENTS:
+            return jsonify({
+                "status": "error",
+                "error": f"Too many recipients: {len(recipients)} (max {SMS_BULK_MAX_RECIPIENTS})"
+            }), 400
+
+        # Sending inline would hold the request for len(recipients) / SMS_RATE_PER_SECOND seconds,
+        # so every recipient becomes an outbox job and the caller follows the jobs' status URLs
+        started = time.monotonic()
+        results = []
+        queued = 0
+        total_segments = 0
+        for index, recipient in enumerate(recipients):
+            if not isinstance(recipient, dict):
+                results.append({"index": index, "status": "error",
+                                "error": "Each recipient must be an object with a 'to' number."})
+                continue
+            result = {
+                "index": index,
+                "to": recipient.get('to'),
+                "message_type": recipient.get('message_type', 'all')
+            }
+            try:
+                if not recipient.get('to'):
+                    raise ValueError("Recipient phone number ('to') is required.")
+                message_body, sms_details = render_bulk_message(recipient)
+                # A recipient's idempotency_key makes a resubmitted batch safe
+                job, created = sms_outbox.enqueue(
+                    recipient['to'],
+                    message_body,
+                    message_type=recipient.get('message_type', 'all'),
+                    language=recipient.get('language_name'),
+                    idempotency_key=recipient.get('idempotency_key')
+                )
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = str(e)
+                results.append(result)
+                continue
+
+            queued += 1
+            total_segments += sms_details['segments']
+            result.update({
+                "status": "queued",
+                "job_id": job['job_id'],
+                "job_status": job['status'],
+                "duplicate": not created,
+                "status_url": f"/api/sms/{job['job_id']}",
+                "segments": sms_details['segments'],
+                "encoding": sms_details['encoding']
+            })
+            results.append(result)
+        elapsed = time.monotonic() - started
+
+        logger.info(f"Bulk SMS: {queued}/{len(recipients)} queued in {elapsed:.2f}s")
+
         return jsonify({
             "status": "success",
-            "message_sid": message.sid,
-            "to": to_number,
-            "language": language_name,
-            "message_type": message_type,
+            "results": results,
+            "summary": {
+                "total": len(recipients),
+                "succeeded": queued,
+                "failed": len(recipients) - queued,
+                "segments": total_segments,
+                "queued": True,
+                "elapsed_seconds": round(elapsed, 3),
+                "rate_limit_per_second": SMS_RATE_PER_SECOND,
+                "estimated_send_seconds": round(queued / SMS_RATE_PER_SECOND, 1)
+            },
             "timestamp": datetime.utcnow().isoformat()
-        })
+        }), 202
 
-    except TwilioRestException as e:
-        error_msg = f"Twilio error: {str(e)}"
-        logger.error(f"Twilio Error: {e}")
-        return jsonify({"status": "error", "error": error_msg}), 400
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
     except Exception as e:
-        error_msg = f"Internal server error: {str(e)}"
-        logger.error(f"Server Error: {e}")
+        error_msg = f"Bulk SMS failed: {str(e)}"
+        logger.error(f"Bulk SMS Error: {e}")
         return jsonify({"status": "error", "error": error_msg}), 500
 
+@app.route('/api/sms/<job_id>', methods=['GET'])
+def get_sms_job(job_id):
+    """Report the delivery status of a queued SMS job"""
+    job = sms_outbox.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "error": f"SMS job not found: {job_id}"}), 404
+
+    return jsonify({
+        "status": "success",
+        "job_id": job['job_id'],
+        "job_status": job['status'],
+        "message_sid": job['message_sid'],
+        "to": job['to_number'],
+        "message_type": job['message_type'],
+        "language": job['language'],
+        "attempts": job['attempts'],
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+@app.route('/api/sms/status-callback', methods=['POST'])
+def sms_status_callback():
+    """Twilio delivery receipt webhook; receipts are buffered and written to the delivery log in batches"""
+    if TWILIO_VALIDATE_CALLBACKS:
+        # Twilio signs the exact URL it was given (with the delivery id query), which behind a proxy is not request.url
+        url = request.url
+        if SMS_STATUS_CALLBACK_URL:
+            url = SMS_STATUS_CALLBACK_URL.split('?', 1)[0]
+            if request.query_string:
+                url += '?' + request.query_string.decode('utf-8')
+        if not twilio_request_validator.validate(url, request.form.to_dict(), request.headers.get('X-Twilio-Signature', '')):
+            logger.warning(f"Rejected SMS status callback with an invalid signature from {request.remote_addr}")
+            return jsonify({"status": "error", "error": "Invalid Twilio signature"}), 403
+
+    message_sid = request.form.get('MessageSid') or request.form.get('SmsSid')
+    message_status = request.form.get('MessageStatus') or request.form.get('SmsStatus')
+    if not message_sid or not message_status:
+        return jsonify({"status": "error", "error": "MessageSid and MessageStatus are required."}), 400
+
+    delivery_log.ingest(message_sid, message_status.lower(), request.form.get('ErrorCode'),
+                        delivery_id=request.args.get('delivery_id'))
+    return '', 204
+
+def delivery_summary(delivery):
+    """Public view of a delivery log record"""
+    summary = {
+        "delivery_id": delivery['delivery_id'],
+        "message_sid": delivery['message_sid'],
+        "to": delivery['to_number'],
+        "source": delivery['source'],
+        "message_type": delivery['message_type'],
+        "language": delivery['language'],
+        "segments": delivery['segments'],
+        "encoding": delivery['encoding'],
+        "delivery_status": delivery['status'],
+        "error_code": delivery['error_code'],
+        "error": delivery['error'],
+        "created_at": delivery['created_at'],
+        "updated_at": delivery['updated_at']
+    }
+    if 'events' in delivery:
+        summary["events"] = delivery['events']
+    return summary
+
+def utc_isoformat(value):
+    """An ISO 8601 timestamp in the log's naive-UTC format, so range comparisons are exact"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+@app.route('/api/sms/deliveries', methods=['GET'])
+def list_sms_deliveries():
+    """Delivery log, newest first: ?to=<number>, ?date=YYYY-MM-DD or ?since=/&until=, ?status=, ?limit="""
+    since = request.args.get('since')
+    until = request.args.get('until')
+    day = request.args.get('date')
+    try:
+        if day:
+            start = datetime.strptime(day, '%Y-%m-%d')
+            since, until = start.isoformat(), (start + timedelta(days=1)).isoformat()
+        since = utc_isoformat(since) if since else None
+        until = utc_isoformat(until) if until else None
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"status": "error", "error": "Use YYYY-MM-DD for date, ISO 8601 for since/until and an integer limit."}), 400
+
+    deliveries = delivery_log.query(
+        to_number=request.args.get('to'),
+        since=since,
+        until=until,
+        status=request.args.get('status'),
+        limit=limit
+    )
+    return jsonify({
+        "status": "success",
+        "deliveries": [delivery_summary(delivery) for delivery in deliveries],
+        "count": len(deliveries),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+@app.route('/api/sms/deliveries/<delivery_id>', methods=['GET'])
+def get_sms_delivery(delivery_id):
+    """One delivery with every receipt Twilio sent for it"""
+    delivery = delivery_log.get(delivery_id, with_events=True)
+    if delivery is None:
+        return jsonify({"status": "error", "error": f"SMS delivery not found: {delivery_id}"}), 404
+    return jsonify({"status": "success", **delivery_summary(delivery), "timestamp": datetime.utcnow().isoformat()})
+
+def build_pdf_document(data):
+    """Localized title, headings and content for a translated PDF report"""
+    return consultation_render.build_pdf_document(message_templates, data)
+
+def open_rendered_pdf(document, digest):
+    """Render (or find) a document's PDF and open it, returning (digest, file, cached).
+
+    Another request's pruning can remove the cached file between render()
+    returning its path and the open here; render it again in that case.
+    """
+    for _ in range(3):
+        digest, path, cached = pdf_flights.do(digest, lambda: pdf_renderer.render(document))
+        try:
+            return digest, open(path, 'rb'), cached
+        except FileNotFoundError:
+            logger.warning(f"Cached PDF {digest[:12]} was pruned before it could be served; rendering again")
+    raise RuntimeError("Rendered PDF was pruned before it could be served")
+
+def pdf_response(pdf, digest, cached):
+    """Stream an open PDF file with chunked transfer"""
+    response = Response(stream_file(pdf), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'inline; filename="consultation-{digest[:12]}.pdf"'
+    response.headers['X-PDF-Cache'] = 'hit' if cached else 'miss'
+    response.headers['X-PDF-Url'] = f'/api/pdf/{digest}'
+    response.set_etag(digest)
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
+
 @app.route('/api/generate-translated-pdf', methods=['POST'])
 def generate_translated_pdf():
     """Generate PDF data for translated medical content (frontend will handle actual PDF generation)"""
     try:
         data = request.get_json()
         
-        # Extract translated content
-        diagnosis = data.get('diagnosis', '')
-        nutrition = data.get('nutrition', '')
-        notes = data.get('notes', '')
-        medicines = data.get('medicines', '')
-        language_name = data.get('language_name', 'Unknown Language')
-        patient_info = data.get('patient_info', {})
-        
-        # Prepare PDF content structure
+        # Prepare PDF content structure with localized title and headings
+        document = build_pdf_document(data)
         pdf_content = {
-            "title": f"Medical Consultation Report ({language_name})",
-            "language": language_name,
-            "sections": {
-                "diagnosis": diagnosis,
-                "nutrition": nutrition,
-                "notes": notes,
-                "medicines": medicines
-            },
-            "patient_info": patient_info,
+            "title": document['title'],
+            "headings": document['headings'],
+            "labels": document['labels'],
+            "language": document['language'],
+            "sections": document['sections'],
+            "patient_info": document['patient_info'],
             "timestamp": datetime.utcnow().isoformat(),
             "generated_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        logger.info(f"PDF content prepared for {language_name} translation")
+        logger.info(f"PDF content prepared for {document['language']} translation")
         
         return jsonify({
             "status": "success",
@@ -288,230 +967,374 @@ def generate_translated_pdf():
         logger.error(f"PDF Generation Error: {e}")
         return jsonify({"status": "error", "error": error_msg}), 500
 
-@app.route('/api/translate', methods=['POST'])
-def translate_text():
-    """Translate medical consultation data to multiple Indian languages using Sarvam AI"""
+@app.route('/api/render-translated-pdf', methods=['POST'])
+def render_translated_pdf():
+    """Render the translated report as a PDF on the server, served from the disk cache on reprints"""
     try:
         data = request.get_json()
-        
-        # Validate required fields
         if not data:
-            return jsonify({"status": "error", "error": "No JSON data provided"}), 400
-        
-        # Get translation parameters
-        text = data.get('text', '')
-        source_lang = data.get('sourceLang', 'en-IN')
-        target_lang = data.get('targetLang', 'mr-IN')
-        
-        if not text:
-            return jsonify({"status": "error", "error": "No text provided for translation"}), 400
-        
-        # Validate target language
-        if target_lang not in [lang['code'] for lang in SUPPORTED_LANGUAGES.values()]:
-            return jsonify({
-                "status": "error", 
-                "error": f"Unsupported target language. Supported: {list(SUPPORTED_LANGUAGES.keys())}"
-            }), 400
-        
-        # Validate Sarvam API key
-        if not SARVAM_API_KEY:
-            logger.error("SARVAM_API_KEY not configured in environment variables")
-            return jsonify({"status": "error", "error": "SARVAM_API_KEY not configured"}), 500
-
-        logger.info(f"Translation request: {source_lang} -> {target_lang}, Length: {len(text)}")
-
-        # Sarvam AI Translation API request
-        url = "https://api.sarvam.ai/translate"
-        payload = {
-            "input": text,
-            "source_language_code": source_lang,
-            "target_language_code": target_lang,
-            "model": "sarvam-translate:v1"
-        }
-        headers = {
-            "api-subscription-key": SARVAM_API_KEY,
-            "Content-Type": "application/json"
-        }
+            return jsonify({"status": "error", "error": "No data provided"}), 400
 
-        # Call Sarvam AI Translation API
-        sarvam_response = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        # Handle Sarvam API response
-        if sarvam_response.status_code == 200:
-            translation_data = sarvam_response.json()
-            logger.info(f"Translation completed successfully for {target_lang}")
-            return jsonify({
-                "status": "success",
-                "translated_text": translation_data.get('translated_text', ''),
-                "source_language": source_lang,
-                "target_language": target_lang,
-                "language_name": SUPPORTED_LANGUAGES.get(target_lang.split('-')[0], {}).get('name', target_lang),
-                "timestamp": datetime.utcnow().isoformat()
-            })
-        else:
-            error_detail = f"Sarvam API error: {sarvam_response.status_code} - {sarvam_response.text}"
-            logger.error(f"Translation API Error: {error_detail}")
-            return jsonify({
-                "status": "error", 
-                "error": "Translation service unavailable",
-                "details": sarvam_response.text[:200] if sarvam_response.text else "No error details"
-            }), sarvam_response.status_code
-
-    except requests.exceptions.Timeout:
-        logger.error("Translation request timeout")
-        return jsonify({"status": "error", "error": "Translation request timeout"}), 408
-    except requests.exceptions.ConnectionError:
-        logger.error("Cannot connect to translation service")
-        return jsonify({"status": "error", "error": "Cannot connect to translation service"}), 503
+        document = build_pdf_document(data)
+        digest = pdf_renderer.key(document)
+        if request.if_none_match.contains(digest) and pdf_renderer.lookup(digest):
+            return Response(status=304, headers={"ETag": f'"{digest}"'})
+
+        start = time.monotonic()
+        digest, pdf, cached = open_rendered_pdf(document, digest)
+        logger.info(f"PDF for {document['language']} {'served from cache' if cached else 'rendered'} "
+                    f"in {time.monotonic() - start:.3f}s")
+        return pdf_response(pdf, digest, cached)
+
+    except FontNotAvailable as e:
+        logger.error(f"PDF Font Error: {e}")
+        return jsonify({"status": "error", "error": str(e)}), 503
     except Exception as e:
-        error_msg = f"Translation failed: {str(e)}"
-        logger.error(f"Translation Error: {e}")
+        error_msg = f"PDF rendering error: {str(e)}"
+        logger.error(f"PDF Rendering Error: {e}")
         return jsonify({"status": "error", "error": error_msg}), 500
 
-@app.route('/api/languages', methods=['GET'])
-def get_supported_languages():
-    """Return list of supported languages for translation"""
+@app.route('/api/pdf/<digest>', methods=['GET'])
+def get_rendered_pdf(digest):
+    """Re-download a rendered PDF by its content hash"""
+    if len(digest) != 64 or any(char not in '0123456789abcdef' for char in digest):
+        return jsonify({"status": "error", "error": "Invalid PDF id"}), 400
+
+    path = pdf_renderer.lookup(digest)
+    if path is None:
+        return jsonify({"status": "error", "error": "PDF not found"}), 404
+
+    # send_file answers If-None-Match and Range requests from the file on disk; it opens
+    # the path itself, so pruning in between is reported as not found
+    try:
+        return send_file(path, mimetype='application/pdf', etag=digest, conditional=True,
+                         max_age=86400, download_name=f"consultation-{digest[:12]}.pdf")
+    except FileNotFoundError:
+        return jsonify({"status": "error", "error": "PDF not found"}), 404
+
+def upload_too_large_response():
+    return jsonify({"status": "error", "error": f"Upload exceeds the {UPLOAD_MAX_BYTES} byte limit"}), 413
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Store an upload (raw body or multipart/form-data files) under its content hash"""
+    # Refuse oversized bodies from the header alone, before any of the body is read
+    if request.content_length is not None and request.content_length > UPLOAD_MAX_BYTES:
+        return upload_too_large_response()
+
+    try:
+        if request.mimetype == 'multipart/form-data':
+            stored = upload_store.ingest_multipart(request.environ)
+        else:
+            stored = [result for result in [upload_store.ingest(request.stream)] if result is not None]
+    except UploadTooLarge:
+        # Chunked bodies have no Content-Length; the cap is enforced while streaming
+        return upload_too_large_response()
+    except RequestEntityTooLarge:
+        return jsonify({"status": "error", "error": "Form fields are too large"}), 413
+    except ValueError as e:
+        return jsonify({"status": "error", "error": f"Malformed upload: {str(e)}"}), 400
+
+    if not stored:
+        return jsonify({"status": "error", "error": "No file content received"}), 400
+
+    uploads = []
+    for result in stored:
+        outcome = 'stored' if result['created'] else 'deduplicated'
+        UPLOADS.inc(outcome)
+        UPLOAD_BYTES.inc(outcome, amount=result['size'])
+        logger.info(f"Upload {result['id']} {outcome} ({result['size']} bytes)")
+        uploads.append({
+            "id": result['id'],
+            "sha256": result['sha256'],
+            "size": result['size'],
+            "duplicate": not result['created'],
+            "content_type": upload_store.content_type(upload_store.path(result['id'])),
+            "url": f"/api/uploads/{result['id']}"
+        })
+
     return jsonify({
         "status": "success",
-        "languages": SUPPORTED_LANGUAGES,
-        "default_source": "en-IN",
+        "uploads": uploads,
         "timestamp": datetime.utcnow().isoformat()
-    })
+    }), 201 if any(not upload['duplicate'] for upload in uploads) else 200
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Serve a stored upload; blobs never change, so the id is a strong ETag"""
+    if not BLOB_NAME.match(upload_id):
+        return jsonify({"status": "error", "error": "Invalid upload id"}), 400
+
+    path = upload_store.path(upload_id)
+    if path is None:
+        return jsonify({"status": "error", "error": "Upload not found"}), 404
+
+    mimetype = upload_store.content_type(path)
+    if UPLOAD_X_ACCEL_PREFIX:
+        # nginx answers Range and sends the body with sendfile; Python only authorizes and names it
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{UPLOAD_X_ACCEL_PREFIX.rstrip('/')}/{upload_id}"
+        response.set_etag(upload_id)
+    else:
+        # send_file answers If-None-Match and Range from the file on disk; whole-file bodies go
+        # through the server's wsgi.file_wrapper, which gunicorn sends with sendfile()
+        response = send_file(path, mimetype=mimetype, etag=upload_id, conditional=True, max_age=UPLOAD_MAX_AGE)
+
+    # Patient recordings and reports: cacheable by the browser, never by shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = UPLOAD_MAX_AGE
+    return response
+
+@app.route('/api/translate', methods=['POST'])
+def translate_text():
+    """Translate medical consultation data to multiple Indian languages using Sarvam AI"""
+    try:
+        params = api_requests.parse_translate(read_json(), SUPPORTED_LANGUAGES)
+
+        if not SARVAM_API_KEY:
+            return api_response(api_requests.sarvam_not_configured_result())
+
+        logger.info(f"Translation request: {params['source_lang']} -> {params['target_lang']}, "
+                    f"Length: {len(params['text'])}")
+
+        with outbound_priority(resolve_priority(LIVE, params['priority'])):
+            translated_text = translate_with_glossary(params['text'], params['source_lang'], params['target_lang'])
+
+        logger.info(f"Translation completed successfully for {params['target_lang']}")
+        return api_response(api_requests.translation_result(params, translated_text, SUPPORTED_LANGUAGES))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        return api_response(api_requests.translation_failure_result(
+            e, (requests.exceptions.Timeout, FlightTimeout, FanOutTimeout), requests.exceptions.ConnectionError))
+
+@app.route('/api/languages', methods=['GET'])
+def get_supported_languages():
+    """Return list of supported languages for translation; 304 when the client's copy is current"""
+    response = Response(LANGUAGES_BODY, content_type='application/json')
+    response.set_etag(LANGUAGES_ETAG)
+    response.headers['Cache-Control'] = f"public, max-age={LANGUAGES_MAX_AGE}"
+    return response.make_conditional(request)
+
+def stream_dumps(payload):
+    """Compact single-line JSON for streamed events, serialized like jsonify"""
+    return app.json.dumps(payload, separators=(',', ':'))
 
 @app.route('/api/batch-translate', methods=['POST'])
 def batch_translate():
     """Translate to multiple languages at once"""
     try:
-        data = request.get_json()
-        
-        text = data.get('text', '')
-        target_languages = data.get('targetLanguages', [])
-        
-        if not text:
-            return jsonify({"status": "error", "error": "No text provided for translation"}), 400
-        
-        if not target_languages:
-            return jsonify({"status": "error", "error": "No target languages specified"}), 400
-        
-        # Validate languages
-        for lang in target_languages:
-            if lang not in [lang['code'] for lang in SUPPORTED_LANGUAGES.values()]:
-                return jsonify({
-                    "status": "error", 
-                    "error": f"Unsupported language: {lang}"
-                }), 400
-        
-        results = {}
-        
-        # Translate to each target language
-        for target_lang in target_languages:
-            try:
-                url = "https://api.sarvam.ai/translate"
-                payload = {
-                    "input": text,
-                    "source_language_code": "en-IN",
-                    "target_language_code": target_lang,
-                    "model": "sarvam-translate:v1"
-                }
-                headers = {
-                    "api-subscription-key": SARVAM_API_KEY,
-                    "Content-Type": "application/json"
-                }
-
-                sarvam_response = requests.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    timeout=30
-                )
+        params = api_requests.parse_batch(read_json(), SUPPORTED_LANGUAGES)
+        text = params['text']
 
-                if sarvam_response.status_code == 200:
-                    translation_data = sarvam_response.json()
-                    results[target_lang] = {
-                        "translated_text": translation_data.get('translated_text', ''),
-                        "language_name": SUPPORTED_LANGUAGES.get(target_lang.split('-')[0], {}).get('name', target_lang),
-                        "status": "success"
-                    }
-                else:
-                    results[target_lang] = {
-                        "translated_text": "",
-                        "language_name": SUPPORTED_LANGUAGES.get(target_lang.split('-')[0], {}).get('name', target_lang),
-                        "status": "error",
-                        "error": f"API returned {sarvam_response.status_code}"
-                    }
-                    
-            except Exception as e:
-                results[target_lang] = {
-                    "translated_text": "",
-                    "language_name": SUPPORTED_LANGUAGES.get(target_lang.split('-')[0], {}).get('name', target_lang),
-                    "status": "error",
-                    "error": str(e)
-                }
-        
-        return jsonify({
-            "status": "success",
-            "translations": results,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-        
+        # Translate into every target language concurrently
+        with outbound_priority(resolve_priority(BATCH, params['priority'])):
+            outcomes = translation_fanout.run(
+                lambda target_lang: translate_with_glossary(text, "en-IN", target_lang, timeout=TRANSLATE_LANGUAGE_TIMEOUT),
+                params['target_languages'],
+                item_timeout=TRANSLATE_LANGUAGE_TIMEOUT,
+                deadline=BATCH_TRANSLATE_DEADLINE
+            )
+
+        return api_response(api_requests.batch_result(SUPPORTED_LANGUAGES, params['target_languages'], outcomes))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
     except Exception as e:
         error_msg = f"Batch translation failed: {str(e)}"
         logger.error(f"Batch Translation Error: {e}")
         return jsonify({"status": "error", "error": error_msg}), 500
 
+@app.route('/api/batch-translate/stream', methods=['POST'])
+def batch_translate_stream():
+    """Translate to multiple languages, streaming each language's result as soon as it is ready.
+
+    The response is NDJSON (default) or Server-Sent Events (?format=sse or
+    Accept: text/event-stream): a 'start' event listing the languages, one
+    'translation' event per language in completion order, then a 'summary'.
+    """
+    stream_format = choose_format(request.args.get('format'), request.headers.get('Accept'))
+    if stream_format is None:
+        return jsonify({"status": "error", "error": "format must be 'ndjson' or 'sse'"}), 400
+
+    try:
+        params = api_requests.parse_batch(read_json(), SUPPORTED_LANGUAGES)
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    text = params['text']
+    target_languages = params['target_languages']
+    priority = resolve_priority(BATCH, params['priority'])
+
+    def translate_one(target_lang):
+        # The stream is consumed outside the route, so the priority is set per language
+        with outbound_priority(priority):
+            return translate_with_glossary(text, "en-IN", target_lang, timeout=TRANSLATE_LANGUAGE_TIMEOUT)
+
+    def generate():
+        started = time.perf_counter()
+        succeeded = 0
+        yield encode_event(stream_format, 'start', {"languages": target_languages}, stream_dumps)
+        try:
+            for target_lang, translated_text, error in translation_fanout.iter_results(
+                    translate_one,
+                    target_languages,
+                    item_timeout=TRANSLATE_LANGUAGE_TIMEOUT,
+                    deadline=BATCH_TRANSLATE_DEADLINE):
+                result = api_requests.batch_language_result(SUPPORTED_LANGUAGES, target_lang, translated_text, error)
+                succeeded += error is None
+                result["language"] = target_lang
+                result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield encode_event(stream_format, 'translation', result, stream_dumps)
+        except Exception as e:
+            logger.error(f"Streaming Batch Translation Error: {e}")
+            yield encode_event(stream_format, 'error', {"status": "error", "error": f"Batch translation failed: {str(e)}"}, stream_dumps)
+            return
+        summary = api_requests.stream_summary(len(target_languages), succeeded, time.perf_counter() - started)
+        yield encode_event(stream_format, 'summary', summary, stream_dumps)
+
+    return Response(generate(), mimetype=STREAM_MEDIA_TYPES[stream_format], headers=STREAM_HEADERS)
+
+def translate_consultation_fields(fields, source_lang, target_lang):
+    """Translate consultation fields into one language: glossary first, then packed upstream requests"""
+    translated, remaining, protected = api_requests.split_consultation_fields(glossary, fields, source_lang,
+                                                                              target_lang)
+    chunks = pack_fields(remaining, SARVAM_MAX_INPUT_CHARS) if remaining else []
+    if chunks:
+        restored, lost = api_requests.restore_fields(glossary, translate_packed(chunks, source_lang, target_lang),
+                                                     protected)
+        for name in lost:
+            logger.warning(f"Translation of {name} to {target_lang} lost a protected-term placeholder; "
+                           f"translating unmasked text")
+            restored[name] = sarvam_translate(fields[name], source_lang, target_lang, timeout=TRANSLATE_LANGUAGE_TIMEOUT)
+        translated.update(restored)
+    return translated, len(chunks)
+
+@app.route('/api/translate-consultation', methods=['POST'])
+def translate_consultation():
+    """Translate a whole consultation (all four fields) into several languages with packed requests"""
+    try:
+        params = api_requests.parse_consultation(read_json(), SUPPORTED_LANGUAGES)
+        if not SARVAM_API_KEY:
+            return api_response(api_requests.sarvam_not_configured_result())
+        active = params['active']
+        source_lang = params['source_lang']
+
+        max_requests = len(pack_fields(active, SARVAM_MAX_INPUT_CHARS))
+        logger.info(f"Consultation translation: {len(active)} fields packed into at most {max_requests} "
+                    f"request(s) per language for {len(params['target_languages'])} language(s)")
+
+        # A consultation in progress is live traffic
+        with outbound_priority(resolve_priority(LIVE, params['priority'])):
+            outcomes = translation_fanout.run(
+                lambda target_lang: translate_consultation_fields(active, source_lang, target_lang),
+                params['target_languages'],
+                item_timeout=TRANSLATE_LANGUAGE_TIMEOUT * max_requests,
+                deadline=BATCH_TRANSLATE_DEADLINE
+            )
+
+        return api_response(api_requests.consultation_result(SUPPORTED_LANGUAGES, params, outcomes))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        error_msg = f"Consultation translation failed: {str(e)}"
+        logger.error(f"Consultation Translation Error: {e}")
+        return jsonify({"status": "error", "error": error_msg}), 500
+
 @app.route('/api/test-translate', methods=['POST'])
 def test_translate():
     """Test endpoint for translation service with multiple languages"""
-    test_text = "Hello, how are you today? This is a test of the translation service."
-    target_languages = ['hi-IN', 'mr-IN', 'ta-IN', 'te-IN']
-    
-    try:
-        results = {}
-        for target_lang in target_languages:
-            url = "https://api.sarvam.ai/translate"
-            payload = {
-                "input": test_text,
-                "source_language_code": "en-IN",
-                "target_language_code": target_lang,
-                "model": "sarvam-translate:v1"
-            }
-            headers = {
-                "api-subscription-key": SARVAM_API_KEY,
-                "Content-Type": "application/json"
-            }
+    def probe(target_lang):
+        payload = build_payload(api_requests.TEST_TRANSLATE_TEXT, "en-IN", target_lang, SARVAM_MODEL)
+        # No retries here: the test endpoint reports the raw upstream status
+        sarvam_scheduler.acquire()
+        return sarvam_client.post_translate(payload, timeout=sarvam_guard.timeout(10), max_retries=0)
 
-            sarvam_response = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            results[target_lang] = {
-                "status": sarvam_response.status_code,
-                "language": SUPPORTED_LANGUAGES.get(target_lang.split('-')[0], {}).get('name', target_lang),
-                "preview": sarvam_response.text[:50] if sarvam_response.text else "No response"
-            }
-        
-        return jsonify({
-            "status": "success",
-            "test_text": test_text,
-            "results": results
-        })
+    try:
+        with outbound_priority(BATCH):
+            outcomes = translation_fanout.run(probe, api_requests.TEST_TRANSLATE_LANGUAGES, item_timeout=10,
+                                              deadline=BATCH_TRANSLATE_DEADLINE)
+        return api_response(api_requests.test_translate_result(SUPPORTED_LANGUAGES, outcomes))
     except Exception as e:
         return jsonify({
             "status": "error",
             "error": str(e)
         }), 500
 
+@app.route('/api/translation-stats', methods=['GET'])
+def translation_stats():
+    """Return translation cache, request coalescing and glossary counters"""
+    return jsonify({
+        "status": "success",
+        "cache": translation_cache.snapshot(),
+        "coalescing": translation_flights.snapshot(),
+        "glossary": glossary.snapshot(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+@app.route('/api/translation-cache/purge', methods=['POST'])
+def purge_translation_cache():
+    """Purge cached translations for one target language and/or one model version"""
+    try:
+        data = request.get_json(silent=True) or {}
+
+        language = data.get('language')
+        model = data.get('model')
+
+        # Accept both the short key ('mr') and the full code ('mr-IN')
+        if language in SUPPORTED_LANGUAGES:
+            language = SUPPORTED_LANGUAGES[language]['code']
+        if language and language not in [lang['code'] for lang in SUPPORTED_LANGUAGES.values()]:
+            return jsonify({"status": "error", "error": f"Unsupported language: {language}"}), 400
+
+        if not language and not model and not data.get('all'):
+            return jsonify({
+                "status": "error",
+                "error": "Specify 'language', 'model' or 'all': true"
+            }), 400
+
+        removed = translation_cache.purge(language=language, model=model)
+
+        return jsonify({
+            "status": "success",
+            "purged": removed,
+            "language": language,
+            "model": model,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        error_msg = f"Cache purge failed: {str(e)}"
+        logger.error(f"Cache Purge Error: {e}")
+        return jsonify({"status": "error", "error": error_msg}), 500
+
+# Shares this worker's metrics with the others (see METRICS_MULTIPROC_DIR)
+metrics_collector = None
+if METRICS_MULTIPROC_DIR:
+    metrics_collector = MultiProcessCollector(REGISTRY, METRICS_MULTIPROC_DIR, interval=METRICS_FLUSH_INTERVAL)
+    metrics_collector.start()
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request, upstream and SMS metrics for all workers (or this one)"""
+    body = metrics_collector.render() if metrics_collector else REGISTRY.render()
+    return Response(body, content_type=METRICS_CONTENT_TYPE)
+
+# Reported dependency state for each background probe status
+DEPENDENCY_STATES = {
+    "up": "connected",
+    "down": "unreachable",
+    "unauthorized": "unauthorized",
+    "pending": "checking",
+    "not_configured": "not_configured"
+}
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Enhanced health check endpoint to verify the server is running"""
+    """Health of the server and its upstreams, from in-memory state only (probes run in the background)"""
+    checks = dependency_prober.snapshot()
     health_status = {
         "status": "healthy",
         "service": "Medical Consultation API",
@@ -522,11 +1345,16 @@ def health_check():
             "translation": "enabled",
             "translated_sms": "enabled",
             "pdf_generation": "enabled",
+            "pdf_rendering": pdf_renderer.snapshot(),
             "supported_languages": len(SUPPORTED_LANGUAGES)
         },
-        "dependencies": {
-            "twilio": "connected" if ACCOUNT_SID and AUTH_TOKEN else "misconfigured",
-            "sarvam_ai": "configured" if SARVAM_API_KEY else "not_configured"
+        "dependencies": {name: DEPENDENCY_STATES[check["status"]] for name, check in checks.items()},
+        "dependency_checks": checks,
+        "sarvam_upstream": sarvam_guard.snapshot(),
+        "delivery_log": delivery_log.snapshot(),
+        "outbound_scheduler": {
+            "sarvam": sarvam_scheduler.snapshot(),
+            "twilio": twilio_scheduler.snapshot()
         }
     }
     
@@ -534,6 +1362,14 @@ def health_check():
     if not all([ACCOUNT_SID, AUTH_TOKEN, SARVAM_API_KEY]):
         health_status["status"] = "degraded"
         health_status["message"] = "Some dependencies are not properly configured"
+    elif any(check["status"] in (STATUS_DOWN, STATUS_UNAUTHORIZED) for check in checks.values()):
+        health_status["status"] = "degraded"
+        health_status["message"] = "Unavailable: " + ", ".join(
+            f"{name} ({check['status']})" for name, check in checks.items()
+            if check["status"] in (STATUS_DOWN, STATUS_UNAUTHORIZED))
+    elif health_status["sarvam_upstream"]["open_circuits"]:
+        health_status["status"] = "degraded"
+        health_status["message"] = "Translation is failing fast for: " + ", ".join(health_status["sarvam_upstream"]["open_circuits"])
     
     return jsonify(health_status), 200
 
@@ -546,9 +1382,38 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"status": "error", "error": "Internal server error"}), 500
 
+def warm_up():
+    """Prepare a freshly started worker before it accepts traffic.
+
+    Templates and glossaries are already compiled at import; this builds the
+    Twilio REST client, opens the Sarvam connection pool, fills the memory
+    translation cache from disk and builds the PDF font subsets.
+    """
+    start = time.monotonic()
+    client.messages  # builds the Twilio REST domain objects on first access
+    connections = 0
+    if SARVAM_API_KEY:
+        connections = sarvam_client.warm_up(connections=min(SARVAM_POOL_SIZE, SARVAM_MAX_CONCURRENCY))
+    cached = translation_cache.preload()
+    fonts = pdf_renderer.fonts.warm_up()
+    logger.info(f"Worker warmed up in {time.monotonic() - start:.2f}s: {connections} Sarvam connection(s), "
+                f"{cached} cached translation(s), {fonts} PDF font subset(s)")
+
+def shutdown(timeout=None):
+    """Let background work finish when a worker exits: outbox sends, buffered receipts and fan-out calls"""
+    pending = sms_outbox.pending_count()
+    sms_outbox.stop(timeout)
+    delivery_log.stop(timeout)
+    dependency_prober.stop(timeout)
+    translation_fanout.shutdown(wait=True)
+    sarvam_guard.shutdown(wait=True)
+    if metrics_collector:
+        metrics_collector.stop(timeout)
+    logger.info(f"Worker drained; {pending} SMS job(s) left in the outbox for the remaining workers")
+
 if __name__ == '__main__':
     # Use environment variable for debug mode, default to False in production
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
-    # For production, use debug=False
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
     app.run(debug=debug_mode, port=5000, host='0.0.0.0')
\ No newline at end of file
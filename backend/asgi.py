@@ -0,0 +1,531 @@
+"""ASGI serving mode: the upstream-bound routes run natively on asyncio.
+
+The Sarvam and Twilio calls behind /api/translate, /api/batch-translate
+(and its /stream variant), /api/translate-consultation, /api/test-translate, /api/send_sms and
+/api/send-translated-sms are awaited on pooled aiohttp sessions, so a slow
+upstream call holds a coroutine rather than a thread and one process can
+keep hundreds of them in flight. Every other route is served by the Flask
+app, mounted underneath. Request validation and response bodies come from
+api_requests, shared with app.py, so only the upstream I/O differs here;
+the caches, glossary, templates and SMS outbox are the ones app.py builds.
+
+Run with:  uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.rest import Client
+
+import api_requests
+import app as wsgi
+from consultation_packing import join_chunk, pack_fields, split_chunk, unpack_fields
+from event_stream import MEDIA_TYPES as STREAM_MEDIA_TYPES, STREAM_HEADERS, choose_format, encode_event
+from fanout import FanOutTimeout
+from metrics import HTTP_IN_FLIGHT, HTTP_REQUESTS, TIMEOUTS, TWILIO_IN_FLIGHT, TWILIO_REQUESTS
+from outbound_scheduler import BATCH, LIVE, outbound_priority, priority_for_message_type, resolve_priority
+from sarvam_client import AsyncSarvamClient, SarvamAPIError, build_payload
+from singleflight import AsyncSingleFlight, FlightTimeout
+from translation_cache import make_cache_key
+from twilio_http import rebased_async_client
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent Sarvam connections held by one process
+SARVAM_ASYNC_MAX_CONNECTIONS = int(os.environ.get("SARVAM_ASYNC_MAX_CONNECTIONS", 256))
+# Threads serving the mounted Flask routes
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 10))
+
+sarvam_client = AsyncSarvamClient(
+    wsgi.SARVAM_API_KEY,
+    base_url=wsgi.SARVAM_BASE_URL,
+    limit=SARVAM_ASYNC_MAX_CONNECTIONS,
+    max_retries=wsgi.SARVAM_MAX_RETRIES,
+    backoff_base=wsgi.SARVAM_BACKOFF_BASE
+)
+translation_flights = AsyncSingleFlight()
+
+# Created on startup, inside the event loop that uses them
+twilio = {"client": None, "http": None}
+
+
+def json_response(payload, status_code=200):
+    """Serialize exactly as Flask's jsonify does (sorted keys, compact, trailing newline)"""
+    body = wsgi.app.json.dumps(payload, separators=(',', ':')) + "\n"
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def api_response(result):
+    """Response for a (payload, status code) pair from api_requests, matching app.api_response"""
+    payload, status_code = result
+    response = json_response(payload, status_code)
+    if 'retry_after' in payload:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response
+
+
+async def read_json(request):
+    """The request's JSON body; InvalidRequest when it is malformed"""
+    return api_requests.load_json(await request.body())
+
+
+async def iter_fan_out(fn, keys, item_timeout=None, deadline=None, max_concurrency=None):
+    """Await fn over keys concurrently, yielding (key, result, error) in completion order like FanOut.iter_results.
+
+    At most max_concurrency items (SARVAM_MAX_CONCURRENCY by default) run at
+    once; item_timeout bounds each from the moment it gets a slot, deadline
+    bounds the whole fan-out from now.
+    """
+    slots = asyncio.Semaphore(max_concurrency or wsgi.SARVAM_MAX_CONCURRENCY)
+
+    async def run(key):
+        try:
+            async with slots:
+                return key, await asyncio.wait_for(fn(key), item_timeout), None
+        except asyncio.TimeoutError:
+            logger.warning(f"Fan-out item {key} timed out after {item_timeout}s")
+            TIMEOUTS.inc('fanout')
+            return key, None, FanOutTimeout(key, item_timeout)
+        except Exception as e:
+            return key, None, e
+
+    tasks = {asyncio.ensure_future(run(key)): key for key in keys}
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    overall_end = loop.time() + deadline if deadline else None
+    try:
+        while pending:
+            timeout = max(0.0, overall_end - loop.time()) if overall_end is not None else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+            if not done:
+                for task in [task for task in tasks if task in pending]:
+                    task.cancel()
+                    logger.warning(f"Fan-out item {tasks[task]} timed out after {deadline}s")
+                    TIMEOUTS.inc('fanout')
+                    yield tasks[task], None, FanOutTimeout(tasks[task], deadline)
+                pending = set()
+    finally:
+        # The consumer stopped early (client went away): stop the remaining calls
+        for task in pending:
+            task.cancel()
+
+
+async def fan_out(fn, keys, item_timeout=None, deadline=None, max_concurrency=None):
+    """Await fn over keys concurrently; returns {key: (result, error)} like FanOut.run"""
+    return {key: (result, error) async for key, result, error
+            in iter_fan_out(fn, keys, item_timeout, deadline, max_concurrency)}
+
+
+async def sarvam_translate(text, source_lang, target_lang, timeout=30):
+    """Translate text with Sarvam AI, serving repeated requests from the translation cache"""
+    cached = await asyncio.to_thread(wsgi.translation_cache.get, text, source_lang, target_lang, wsgi.SARVAM_MODEL)
+    if cached is not None:
+        return cached
+
+    # Identical requests already in flight share one upstream call
+    key = make_cache_key(text, source_lang, target_lang, wsgi.SARVAM_MODEL)
+    return await translation_flights.do(key, lambda: fetch_translation(text, source_lang, target_lang, timeout),
+                                        timeout=timeout)
+
+
+async def fetch_translation(text, source_lang, target_lang, timeout):
+    """Call Sarvam AI for one translation and store the result in the cache"""
+    async def attempt(attempt_timeout):
+        sarvam_response = await sarvam_client.translate(text, source_lang, target_lang, wsgi.SARVAM_MODEL,
+                                                        timeout=attempt_timeout,
+                                                        acquire=wsgi.sarvam_scheduler.acquire_async)
+        if sarvam_response.status_code != 200:
+            raise SarvamAPIError(sarvam_response.status_code, sarvam_response.text)
+        return sarvam_response
+
+    # Shares latency history and breakers with the WSGI routes in this process
+    sarvam_response = await wsgi.sarvam_guard.acall(target_lang, attempt, timeout,
+                                                    acquire=wsgi.sarvam_scheduler.acquire_async)
+
+    translated_text = sarvam_response.json().get('translated_text', '')
+    if translated_text:
+        await asyncio.to_thread(wsgi.translation_cache.set, text, source_lang, target_lang,
+                                wsgi.SARVAM_MODEL, translated_text)
+    return translated_text
+
+
+async def translate_packed(chunks, source_lang, target_lang, timeout=None):
+    """Translate packed chunks (see consultation_packing) and unpack them into {name: text}"""
+    timeout = timeout or wsgi.TRANSLATE_LANGUAGE_TIMEOUT
+    translated_pieces = []
+    for chunk in chunks:
+        translated = await sarvam_translate(join_chunk(chunk), source_lang, target_lang, timeout=timeout)
+        parts = split_chunk(translated, len(chunk))
+        if parts is None:
+            logger.warning(f"Packed translation for {target_lang} lost its delimiters; translating pieces individually")
+            parts = await asyncio.gather(*(sarvam_translate(piece[1], source_lang, target_lang, timeout=timeout)
+                                           for piece in chunk))
+        translated_pieces.extend(parts)
+    return unpack_fields(chunks, translated_pieces)
+
+
+async def translate_protected(text, source_lang, target_lang, timeout=30):
+    """Translate text whole, holding protected terms back from the translator as placeholders"""
+    glossary = wsgi.glossary
+    masked, terms = glossary.protect(text)
+    restored = glossary.restore(await sarvam_translate(masked, source_lang, target_lang, timeout=timeout), terms)
+    if restored is None:
+        logger.warning(f"Translation to {target_lang} lost a protected-term placeholder; translating unmasked text")
+        return await sarvam_translate(text, source_lang, target_lang, timeout=timeout)
+    return restored
+
+
+async def translate_with_glossary(text, source_lang, target_lang, timeout=30):
+    """Translate text, answering it locally when the glossary covers it fully"""
+    plan = api_requests.glossary_plan(wsgi.glossary, text, source_lang, target_lang, wsgi.GLOSSARY_SPLIT_PARTIAL)
+    if plan is None:
+        return await translate_protected(text, source_lang, target_lang, timeout=timeout)
+
+    segments, uncovered = plan
+    translated = {}
+    if uncovered:
+        chunks = pack_fields(uncovered, wsgi.SARVAM_MAX_INPUT_CHARS)
+        translated = await translate_packed(chunks, source_lang, target_lang, timeout)
+    return api_requests.assemble_segments(segments, translated)
+
+
+async def translate_consultation_fields(fields, source_lang, target_lang):
+    """Translate consultation fields into one language: glossary first, then packed upstream requests"""
+    translated, remaining, protected = api_requests.split_consultation_fields(wsgi.glossary, fields, source_lang,
+                                                                              target_lang)
+    chunks = pack_fields(remaining, wsgi.SARVAM_MAX_INPUT_CHARS) if remaining else []
+    if chunks:
+        restored, lost = api_requests.restore_fields(wsgi.glossary,
+                                                     await translate_packed(chunks, source_lang, target_lang),
+                                                     protected)
+        for name in lost:
+            logger.warning(f"Translation of {name} to {target_lang} lost a protected-term placeholder; "
+                           f"translating unmasked text")
+            restored[name] = await sarvam_translate(fields[name], source_lang, target_lang,
+                                                    timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT)
+        translated.update(restored)
+    return translated, len(chunks)
+
+
+async def send_via_twilio(to_number, message_body, language=None, delivery_id=None):
+    """Send one SMS through the Messaging Service without blocking the event loop"""
+    # Same Twilio pacing and priority queues as the threaded routes
+    await wsgi.twilio_scheduler.acquire_async()
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        with TWILIO_IN_FLIGHT.track():
+            message = await twilio["client"].messages.create_async(
+                body=message_body,
+                messaging_service_sid=wsgi.MESSAGING_SERVICE_SID,
+                to=to_number,
+                **wsgi.twilio_message_params(delivery_id)
+            )
+        outcome = 'success'
+    except TwilioRestException as e:
+        outcome = str(e.status or 'error')
+        raise
+    finally:
+        TWILIO_REQUESTS.observe(time.perf_counter() - start, outcome)
+    wsgi.record_sms_sent(message_body, language)
+    return message
+
+
+async def send_logged(delivery_id, to_number, message_body, language=None):
+    """send_via_twilio for a reserved delivery, recording the SID or the failure in the delivery log"""
+    try:
+        message = await send_via_twilio(to_number, message_body, language, delivery_id=delivery_id)
+    except Exception as e:
+        await asyncio.to_thread(wsgi.record_delivery_error, delivery_id, e)
+        raise
+    await asyncio.to_thread(wsgi.delivery_log.mark_sent, delivery_id, message.sid, message.status or 'accepted')
+    return message
+
+
+async def queue_sms(sms, message_body, sms_details, key):
+    """Persist an SMS job and build the 202 response for it"""
+    job, created = await asyncio.to_thread(
+        wsgi.sms_outbox.enqueue,
+        sms['to'],
+        message_body,
+        message_type=sms['message_type'],
+        language=sms['language_name'],
+        idempotency_key=key
+    )
+
+    if created:
+        logger.info(f"SMS job {job['job_id']} queued for {sms['to']}")
+    else:
+        logger.info(f"Duplicate SMS request for idempotency key {key}; returning job {job['job_id']}")
+    return api_response(api_requests.sms_queued_result(sms, sms_details, job, created))
+
+
+async def send_consultation_sms(request, translated):
+    """Shared body of /api/send_sms and /api/send-translated-sms (see app.send_consultation_sms)"""
+    try:
+        data = await read_json(request)
+        sms = api_requests.parse_sms(data, translated)
+
+        message_body, sms_details = wsgi.build_sms_body(sms['message_type'], sms['diagnosis'], sms['medicines'],
+                                                        sms['nutrition'], sms['notes'], sms['language_name'])
+
+        key = api_requests.idempotency_key(request.headers, data)
+        if wsgi.use_outbox(data):
+            return await queue_sms(sms, message_body, sms_details, key)
+
+        delivery, created = await asyncio.to_thread(wsgi.reserve_delivery, key, sms['to'], message_body, sms_details,
+                                                    sms['message_type'], sms['language_name'])
+        if not created:
+            return api_response(api_requests.duplicate_delivery_result(delivery))
+
+        with outbound_priority(resolve_priority(priority_for_message_type(sms['message_type']), sms['priority'])):
+            message = await send_logged(delivery['delivery_id'], sms['to'], message_body, sms['language_name'])
+
+        logger.info(f"SMS sent successfully to {sms['to']}"
+                    + (f" in {sms['language_name']}" if translated else "") + f". Message SID: {message.sid}")
+        logger.info(f"Message type: {sms['message_type']}, Length: {len(message_body)} chars, "
+                    f"Segments: {sms_details['segments']} ({sms_details['encoding']})")
+        return api_response(api_requests.sms_sent_result(sms, sms_details, delivery, message.sid))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        return api_response(api_requests.sms_failure_result(e, TwilioRestException))
+
+
+async def send_sms(request):
+    return await send_consultation_sms(request, translated=False)
+
+
+async def send_translated_sms(request):
+    """Send SMS with translated medical content"""
+    return await send_consultation_sms(request, translated=True)
+
+
+async def translate_text(request):
+    """Translate medical consultation data to multiple Indian languages using Sarvam AI"""
+    try:
+        params = api_requests.parse_translate(await read_json(request), wsgi.SUPPORTED_LANGUAGES)
+
+        if not wsgi.SARVAM_API_KEY:
+            return api_response(api_requests.sarvam_not_configured_result())
+
+        logger.info(f"Translation request: {params['source_lang']} -> {params['target_lang']}, "
+                    f"Length: {len(params['text'])}")
+
+        with outbound_priority(resolve_priority(LIVE, params['priority'])):
+            translated_text = await translate_with_glossary(params['text'], params['source_lang'],
+                                                            params['target_lang'])
+
+        logger.info(f"Translation completed successfully for {params['target_lang']}")
+        return api_response(api_requests.translation_result(params, translated_text, wsgi.SUPPORTED_LANGUAGES))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        return api_response(api_requests.translation_failure_result(
+            e, (asyncio.TimeoutError, FlightTimeout), aiohttp.ClientConnectionError))
+
+
+async def batch_translate(request):
+    """Translate to multiple languages at once"""
+    try:
+        params = api_requests.parse_batch(await read_json(request), wsgi.SUPPORTED_LANGUAGES)
+        text = params['text']
+
+        with outbound_priority(resolve_priority(BATCH, params['priority'])):
+            outcomes = await fan_out(
+                lambda target_lang: translate_with_glossary(text, "en-IN", target_lang,
+                                                            timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT),
+                params['target_languages'],
+                item_timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT,
+                deadline=wsgi.BATCH_TRANSLATE_DEADLINE
+            )
+
+        return api_response(api_requests.batch_result(wsgi.SUPPORTED_LANGUAGES, params['target_languages'], outcomes))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        logger.error(f"Batch Translation Error: {e}")
+        return json_response({"status": "error", "error": f"Batch translation failed: {str(e)}"}, 500)
+
+
+async def batch_translate_stream(request):
+    """Translate to multiple languages, streaming each language's result as soon as it is ready (see app.py)"""
+    stream_format = choose_format(request.query_params.get('format'), request.headers.get('accept'))
+    if stream_format is None:
+        return json_response({"status": "error", "error": "format must be 'ndjson' or 'sse'"}, 400)
+
+    try:
+        params = api_requests.parse_batch(await read_json(request), wsgi.SUPPORTED_LANGUAGES)
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    text = params['text']
+    target_languages = params['target_languages']
+    priority = resolve_priority(BATCH, params['priority'])
+
+    async def translate_one(target_lang):
+        # The stream is consumed outside the route, so the priority is set per language
+        with outbound_priority(priority):
+            return await translate_with_glossary(text, "en-IN", target_lang, timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT)
+
+    async def generate():
+        started = time.perf_counter()
+        succeeded = 0
+        yield encode_event(stream_format, 'start', {"languages": target_languages}, wsgi.stream_dumps)
+        try:
+            async for target_lang, translated_text, error in iter_fan_out(
+                    translate_one,
+                    target_languages,
+                    item_timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT,
+                    deadline=wsgi.BATCH_TRANSLATE_DEADLINE):
+                result = api_requests.batch_language_result(wsgi.SUPPORTED_LANGUAGES, target_lang, translated_text,
+                                                            error)
+                succeeded += error is None
+                result["language"] = target_lang
+                result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield encode_event(stream_format, 'translation', result, wsgi.stream_dumps)
+        except Exception as e:
+            logger.error(f"Streaming Batch Translation Error: {e}")
+            yield encode_event(stream_format, 'error',
+                               {"status": "error", "error": f"Batch translation failed: {str(e)}"}, wsgi.stream_dumps)
+            return
+        summary = api_requests.stream_summary(len(target_languages), succeeded, time.perf_counter() - started)
+        yield encode_event(stream_format, 'summary', summary, wsgi.stream_dumps)
+
+    return StreamingResponse(generate(), media_type=STREAM_MEDIA_TYPES[stream_format], headers=STREAM_HEADERS)
+
+
+async def translate_consultation(request):
+    """Translate a whole consultation (all four fields) into several languages with packed requests"""
+    try:
+        params = api_requests.parse_consultation(await read_json(request), wsgi.SUPPORTED_LANGUAGES)
+        if not wsgi.SARVAM_API_KEY:
+            return api_response(api_requests.sarvam_not_configured_result())
+        active = params['active']
+        source_lang = params['source_lang']
+
+        max_requests = len(pack_fields(active, wsgi.SARVAM_MAX_INPUT_CHARS))
+        logger.info(f"Consultation translation: {len(active)} fields packed into at most {max_requests} "
+                    f"request(s) per language for {len(params['target_languages'])} language(s)")
+
+        # A consultation in progress is live traffic
+        with outbound_priority(resolve_priority(LIVE, params['priority'])):
+            outcomes = await fan_out(
+                lambda target_lang: translate_consultation_fields(active, source_lang, target_lang),
+                params['target_languages'],
+                item_timeout=wsgi.TRANSLATE_LANGUAGE_TIMEOUT * max_requests,
+                deadline=wsgi.BATCH_TRANSLATE_DEADLINE
+            )
+
+        return api_response(api_requests.consultation_result(wsgi.SUPPORTED_LANGUAGES, params, outcomes))
+
+    except api_requests.InvalidRequest as e:
+        return api_response(e.result())
+    except Exception as e:
+        logger.error(f"Consultation Translation Error: {e}")
+        return json_response({"status": "error", "error": f"Consultation translation failed: {str(e)}"}, 500)
+
+
+async def test_translate(request):
+    """Test endpoint for translation service with multiple languages"""
+    async def probe(target_lang):
+        # No retries here: the test endpoint reports the raw upstream status
+        payload = build_payload(api_requests.TEST_TRANSLATE_TEXT, "en-IN", target_lang, wsgi.SARVAM_MODEL)
+        await wsgi.sarvam_scheduler.acquire_async()
+        return await sarvam_client.post_translate(payload, timeout=wsgi.sarvam_guard.timeout(10), max_retries=0)
+
+    try:
+        with outbound_priority(BATCH):
+            outcomes = await fan_out(probe, api_requests.TEST_TRANSLATE_LANGUAGES, item_timeout=10,
+                                     deadline=wsgi.BATCH_TRANSLATE_DEADLINE)
+        return api_response(api_requests.test_translate_result(wsgi.SUPPORTED_LANGUAGES, outcomes))
+    except Exception as e:
+        return json_response({"status": "error", "error": str(e)}, 500)
+
+
+class RequestMetricsMiddleware:
+    """Latency and in-flight metrics for the routes served natively here (Flask records its own)"""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        route = scope['path']
+        status = ['500']
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec(route)
+            HTTP_REQUESTS.observe(time.perf_counter() - start, route, scope['method'], status[0])
+
+
+@asynccontextmanager
+async def lifespan(application):
+    await sarvam_client.start()
+    if wsgi.TWILIO_API_BASE_URL:
+        twilio["http"] = rebased_async_client(wsgi.TWILIO_API_BASE_URL)
+    else:
+        twilio["http"] = AsyncTwilioHttpClient()
+    twilio["client"] = Client(wsgi.ACCOUNT_SID, wsgi.AUTH_TOKEN, http_client=twilio["http"])
+    logger.info(f"ASGI server ready; up to {SARVAM_ASYNC_MAX_CONNECTIONS} concurrent Sarvam connections")
+    try:
+        yield
+    finally:
+        await twilio["http"].close()
+        await sarvam_client.close()
+
+
+NATIVE_ROUTES = [
+    Route('/api/send_sms', send_sms, methods=['POST']),
+    Route('/api/send-translated-sms', send_translated_sms, methods=['POST']),
+    Route('/api/translate', translate_text, methods=['POST']),
+    Route('/api/batch-translate', batch_translate, methods=['POST']),
+    Route('/api/batch-translate/stream', batch_translate_stream, methods=['POST']),
+    Route('/api/translate-consultation', translate_consultation, methods=['POST']),
+    Route('/api/test-translate', test_translate, methods=['POST']),
+]
+
+application = Starlette(
+    routes=NATIVE_ROUTES + [
+        # Everything else (PDFs, uploads, stats, metrics, bulk SMS, job status, delivery log, health) is served by Flask
+        Mount('/', WSGIMiddleware(wsgi.app, workers=ASGI_WSGI_THREADS)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(RequestMetricsMiddleware, paths=[route.path for route in NATIVE_ROUTES]),
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(application, port=5000, host='0.0.0.0')
@@ -0,0 +1,292 @@
+"""Local stand-ins for the Sarvam translate API and the Twilio Messages API.
+
+Point the backend at them with
+
+    SARVAM_BASE_URL=http://127.0.0.1:9100 TWILIO_API_BASE_URL=http://127.0.0.1:9100
+
+and every translation and SMS is answered locally instead of by the paid
+APIs. Latency, error rate and 429 behavior are configurable per upstream so
+load tests can reproduce slow, flaky or throttled providers:
+
+    python bench/fake_upstreams.py --port 9100 \\
+        --sarvam-latency lognormal:0.25:0.5 --sarvam-429-rate 0.02 \\
+        --twilio-latency uniform:0.1:0.3 --twilio-error-rate 0.01
+
+Latency specs are fixed:<seconds>, uniform:<low>:<high> or
+lognormal:<median>:<sigma>. GET /stats returns request counts per upstream
+and outcome; POST /stats/reset clears them.
+
+With --status-callbacks, every message created with a StatusCallback URL
+gets queued/sent/delivered receipts POSTed back to that URL, signed with
+--auth-token when given (the backend rejects unsigned receipts unless
+TWILIO_VALIDATE_CALLBACKS=False).
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+TWILIO_MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<sid>AC\w+)/Messages\.json$')
+TWILIO_ACCOUNT_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<sid>AC\w+)\.json$')
+
+
+def parse_latency(spec):
+    """Return a function producing latency samples (seconds) for a spec string"""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(':')] if args else []
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == 'lognormal' and len(values) == 2:
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    raise argparse.ArgumentTypeError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LO:HI or lognormal:MEDIAN:SIGMA")
+
+
+class UpstreamProfile:
+    """Latency and failure behavior of one fake upstream"""
+
+    def __init__(self, name, latency='fixed:0', error_rate=0.0, throttle_rate=0.0, retry_after=1):
+        self.name = name
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+    def outcome(self):
+        """Pick 'throttled', 'error' or 'ok' for the next request"""
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 'throttled'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.started = time.time()
+
+    def record(self, upstream, outcome):
+        with self._lock:
+            per_upstream = self._counts.setdefault(upstream, {})
+            per_upstream[outcome] = per_upstream.get(outcome, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = {upstream: dict(outcomes) for upstream, outcomes in self._counts.items()}
+        return {"uptime_seconds": round(time.time() - self.started, 3), "requests": counts}
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+            self.started = time.time()
+
+
+def fake_translation(payload):
+    return f"[{payload.get('target_language_code', '')}] {payload.get('input', '')}"
+
+
+def fake_message(account_sid, form):
+    now = time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime())
+    sid = 'SM' + uuid.uuid4().hex
+    return {
+        "sid": sid,
+        "account_sid": account_sid,
+        "messaging_service_sid": form.get('MessagingServiceSid'),
+        "to": form.get('To'),
+        "from": form.get('From'),
+        "body": form.get('Body', ''),
+        "status": "accepted",
+        "num_segments": "1",
+        "direction": "outbound-api",
+        "api_version": "2010-04-01",
+        "date_created": now,
+        "date_updated": now,
+        "uri": f"/2010-04-01/Accounts/{account_sid}/Messages/{sid}.json",
+    }
+
+
+def twilio_signature(auth_token, url, params):
+    """X-Twilio-Signature for a form POST: HMAC-SHA1 over the URL plus sorted name/value pairs"""
+    payload = url + ''.join(f"{name}{params[name]}" for name in sorted(params))
+    digest = hmac.new(auth_token.encode('utf-8'), payload.encode('utf-8'), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def send_status_callbacks(server, url, message):
+    """POST the receipts Twilio would send for a delivered message"""
+    for status in ('queued', 'sent', 'delivered'):
+        time.sleep(server.callback_delay)
+        params = {"MessageSid": message['sid'], "SmsSid": message['sid'], "MessageStatus": status,
+                  "SmsStatus": status, "AccountSid": message['account_sid'], "To": message['to'] or '',
+                  "ApiVersion": "2010-04-01"}
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if server.auth_token:
+            headers['X-Twilio-Signature'] = twilio_signature(server.auth_token, url, params)
+        try:
+            with urlopen(Request(url, data=urlencode(params).encode('utf-8'), headers=headers), timeout=10) as response:
+                outcome = f"callback_{response.status}"
+        except Exception as e:
+            outcome = f"callback_{getattr(e, 'code', 'error')}"
+        server.stats.record('twilio', outcome)
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeUpstream/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _failure(self, profile, outcome):
+        """Send the throttled/error response for an outcome; False when the request should succeed"""
+        if outcome == 'ok':
+            return False
+        self.server.stats.record(profile.name, outcome)
+        if outcome == 'throttled':
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": "rate_limited"}},
+                            {'Retry-After': str(profile.retry_after)})
+        else:
+            self._send_json(503, {"error": {"message": "Service temporarily unavailable", "code": "unavailable"}})
+        return True
+
+    def do_HEAD(self):
+        # Connection warm-up and health probes of the Sarvam base URL
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        account = TWILIO_ACCOUNT_PATH.match(self.path.split('?', 1)[0])
+        if self.path == '/stats':
+            self._send_json(200, self.server.stats.snapshot())
+        elif account:
+            # Twilio health probe
+            self._send_json(200, {"sid": account.group('sid'), "status": "active", "friendly_name": "Fake account"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path == '/stats/reset':
+            self.server.stats.reset()
+            self._send_json(200, {"status": "reset"})
+        elif self.path == '/translate':
+            self._translate(body)
+        else:
+            match = TWILIO_MESSAGES_PATH.match(self.path.split('?', 1)[0])
+            if match:
+                self._create_message(match.group('sid'), body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+    def _translate(self, body):
+        profile = self.server.sarvam
+        time.sleep(profile.latency())
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self.server.stats.record(profile.name, 'bad_request')
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        if self._failure(profile, profile.outcome()):
+            return
+        self.server.stats.record(profile.name, 'ok')
+        self._send_json(200, {"request_id": uuid.uuid4().hex, "translated_text": fake_translation(payload),
+                              "source_language_code": payload.get('source_language_code')})
+
+    def _create_message(self, account_sid, body):
+        profile = self.server.twilio
+        time.sleep(profile.latency())
+        if self._failure(profile, profile.outcome()):
+            return
+        form = {name: values[0] for name, values in parse_qs(body.decode('utf-8')).items()}
+        self.server.stats.record(profile.name, 'ok')
+        message = fake_message(account_sid, form)
+        self._send_json(201, message)
+        if self.server.status_callbacks and form.get('StatusCallback'):
+            threading.Thread(target=send_status_callbacks, args=(self.server, form['StatusCallback'], message),
+                             daemon=True).start()
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, sarvam, twilio, verbose=False, status_callbacks=False, auth_token=None,
+                 callback_delay=0.5):
+        super().__init__(address, FakeUpstreamHandler)
+        self.sarvam = sarvam
+        self.twilio = twilio
+        self.verbose = verbose
+        self.status_callbacks = status_callbacks
+        self.auth_token = auth_token
+        self.callback_delay = callback_delay
+        self.stats = Stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Sarvam and Twilio stand-ins for load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    for name, latency in (('sarvam', 'lognormal:0.2:0.4'), ('twilio', 'uniform:0.05:0.2')):
+        parser.add_argument(f'--{name}-latency', type=parse_latency, default=parse_latency(latency),
+                            help=f"latency distribution (default {latency})")
+        parser.add_argument(f'--{name}-error-rate', type=float, default=0.0, help="fraction answered with 503")
+        parser.add_argument(f'--{name}-429-rate', type=float, default=0.0, help="fraction answered with 429")
+        parser.add_argument(f'--{name}-retry-after', type=int, default=1, help="Retry-After seconds on 429")
+    parser.add_argument('--status-callbacks', action='store_true',
+                        help="POST queued/sent/delivered receipts to each message's StatusCallback URL")
+    parser.add_argument('--auth-token', help="sign status callbacks with this Twilio auth token")
+    parser.add_argument('--callback-delay', type=float, default=0.5, help="seconds between receipts (default 0.5)")
+    args = parser.parse_args()
+
+    sarvam = UpstreamProfile('sarvam', args.sarvam_latency, args.sarvam_error_rate,
+                             args.sarvam_429_rate, args.sarvam_retry_after)
+    twilio = UpstreamProfile('twilio', args.twilio_latency, args.twilio_error_rate,
+                             args.twilio_429_rate, args.twilio_retry_after)
+    server = FakeUpstreamServer((args.host, args.port), sarvam, twilio, verbose=args.verbose,
+                                status_callbacks=args.status_callbacks, auth_token=args.auth_token,
+                                callback_delay=args.callback_delay)
+    print(f"Fake Sarvam/Twilio listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""Load generator for the backend API.
+
+Drives /api/translate, /api/batch-translate, /api/send_sms and
+/api/generate-translated-pdf with a fixed number of concurrent workers,
+each holding one keep-alive connection, and reports throughput,
+p50/p95/p99 latency and error rate per scenario as JSON:
+
+    python bench/loadgen.py --url http://127.0.0.1:5000 --concurrency 32 \\
+        --duration 30 --warmup 5 --output bench/results/$(git rev-parse --short HEAD).json
+
+Results carry the git commit they were measured on. Compare two runs with
+
+    python bench/loadgen.py compare before.json after.json
+
+Run the backend against bench/fake_upstreams.py (see its docstring) so no
+traffic reaches the paid Sarvam and Twilio APIs. Translations rotate through
+a pool of texts; use --unique-texts to defeat the translation cache.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+SCENARIOS = ('translate', 'batch-translate', 'send_sms', 'generate-translated-pdf')
+
+LANGUAGES = ('hi-IN', 'mr-IN', 'ta-IN', 'te-IN', 'bn-IN', 'gu-IN', 'kn-IN', 'ml-IN', 'pa-IN')
+
+TEXTS = (
+    "Take one tablet twice a day after meals.",
+    "Viral fever with mild dehydration.",
+    "Drink plenty of fluids and rest for three days.",
+    "Avoid oily and spicy food until the stomach settles.",
+    "Paracetamol 500mg every six hours if the fever is above 100F.",
+    "Return for a follow-up visit if symptoms persist beyond a week.",
+    "Include green leafy vegetables, lentils and fruit in every meal.",
+    "Blood sugar is slightly elevated; reduce sweets and walk daily.",
+)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ScenarioBuilder:
+    """Builds (path, payload) pairs for each scenario"""
+
+    def __init__(self, phone, unique_texts=False, batch_languages=4):
+        self.phone = phone
+        self.unique_texts = unique_texts
+        self.batch_languages = batch_languages
+        self._counter = itertools.count()
+
+    def _text(self):
+        n = next(self._counter)
+        text = TEXTS[n % len(TEXTS)]
+        if self.unique_texts:
+            text = f"{text} (ref {uuid.uuid4().hex[:8]})"
+        return n, text
+
+    def build(self, scenario):
+        n, text = self._text()
+        if scenario == 'translate':
+            return '/api/translate', {"text": text, "sourceLang": "en-IN", "targetLang": LANGUAGES[n % len(LANGUAGES)]}
+        if scenario == 'batch-translate':
+            start = n % len(LANGUAGES)
+            languages = [LANGUAGES[(start + i) % len(LANGUAGES)] for i in range(self.batch_languages)]
+            return '/api/batch-translate', {"text": text, "sourceLang": "en-IN", "targetLanguages": languages}
+        if scenario == 'send_sms':
+            return '/api/send_sms', {"to": self.phone, "message_type": "all", "diagnosis": text,
+                                     "medicines": TEXTS[(n + 1) % len(TEXTS)], "nutrition": TEXTS[(n + 2) % len(TEXTS)],
+                                     "notes": TEXTS[(n + 3) % len(TEXTS)]}
+        if scenario == 'generate-translated-pdf':
+            return '/api/generate-translated-pdf', {"language_name": "Hindi", "language_code": "hi-IN",
+                                                    "diagnosis": text, "medicines": TEXTS[(n + 1) % len(TEXTS)],
+                                                    "nutrition": TEXTS[(n + 2) % len(TEXTS)], "notes": "",
+                                                    "patient_info": {"name": "Load Test", "age": "40"}}
+        raise ValueError(f"Unknown scenario {scenario}")
+
+
+class Recorder:
+    """Per-scenario latencies and outcomes, collected only once warm-up is over"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, scenario, latency, status, error=None):
+        with self._lock:
+            self.latencies.setdefault(scenario, []).append(latency)
+            counts = self.statuses.setdefault(scenario, {})
+            counts[status] = counts.get(status, 0) + 1
+            if error:
+                errors = self.errors.setdefault(scenario, {})
+                errors[error] = errors.get(error, 0) + 1
+
+
+class Worker(threading.Thread):
+    def __init__(self, target, builder, scenarios, recorder, schedule, timeout):
+        super().__init__(daemon=True)
+        self.target = target
+        self.builder = builder
+        self.scenarios = scenarios
+        self.recorder = recorder
+        self.schedule = schedule
+        self.timeout = timeout
+        self.connection = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+        self.connection = cls(self.target.hostname, self.target.port, timeout=self.timeout)
+
+    def _post(self, path, payload):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        if self.connection is None:
+            self._connect()
+        try:
+            self.connection.request('POST', self.target.path.rstrip('/') + path, body, headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except Exception:
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def run(self):
+        for scenario in itertools.cycle(self.scenarios):
+            measure = self.schedule.next_request()
+            if measure is None:
+                break
+            path, payload = self.builder.build(scenario)
+            start = time.perf_counter()
+            try:
+                status = self._post(path, payload)
+                error = None if status < 400 else f"http_{status}"
+            except Exception as e:
+                status, error = 'exception', type(e).__name__
+            latency = time.perf_counter() - start
+            if measure:
+                self.recorder.record(scenario, latency, status, error)
+        if self.connection is not None:
+            self.connection.close()
+
+
+class Schedule:
+    """Decides whether the next request runs, and whether it is measured
+
+    Returns None when the run is over, False during warm-up, True otherwise.
+    """
+
+    def __init__(self, warmup, duration=None, requests=None):
+        self.warmup = warmup
+        self.duration = duration
+        self.requests = requests
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.started = time.perf_counter()
+        self.measure_started = None
+        self.measure_ended = None
+
+    def next_request(self):
+        now = time.perf_counter()
+        elapsed = now - self.started
+        if elapsed < self.warmup:
+            return False
+        with self._lock:
+            if self.measure_started is None:
+                self.measure_started = now
+            if self.requests is not None:
+                if self._issued >= self.requests:
+                    return None
+                self._issued += 1
+                return True
+        if now - self.measure_started >= self.duration:
+            return None
+        return True
+
+
+def summarize(recorder, elapsed):
+    scenarios = {}
+    for scenario in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[scenario])
+        count = len(latencies)
+        errors = sum(recorder.errors.get(scenario, {}).values())
+        scenarios[scenario] = {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / count, 4) if count else None,
+            "latency_ms": {
+                "mean": round(sum(latencies) / count * 1000, 2) if count else None,
+                "p50": round(percentile(latencies, 0.50) * 1000, 2) if count else None,
+                "p95": round(percentile(latencies, 0.95) * 1000, 2) if count else None,
+                "p99": round(percentile(latencies, 0.99) * 1000, 2) if count else None,
+                "max": round(latencies[-1] * 1000, 2) if count else None,
+            },
+            "statuses": {str(status): n for status, n in sorted(recorder.statuses[scenario].items(), key=str)},
+            "errors": recorder.errors.get(scenario, {}),
+        }
+    total = sum(s["requests"] for s in scenarios.values())
+    total_errors = sum(sum(recorder.errors.get(name, {}).values()) for name in scenarios)
+    return {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "error_rate": round(total_errors / total, 4) if total else None,
+        "scenarios": scenarios,
+    }
+
+
+def run(args):
+    target = urlsplit(args.url)
+    builder = ScenarioBuilder(args.phone, unique_texts=args.unique_texts, batch_languages=args.batch_languages)
+    recorder = Recorder()
+    schedule = Schedule(args.warmup, duration=None if args.requests else args.duration, requests=args.requests)
+
+    scenarios = args.scenarios
+    workers = []
+    for index in range(args.concurrency):
+        # Stagger the scenario rotation so every scenario is in flight from the start
+        offset = index % len(scenarios)
+        worker = Worker(target, builder, scenarios[offset:] + scenarios[:offset], recorder, schedule, args.timeout)
+        workers.append(worker)
+        worker.start()
+    for worker in workers:
+        worker.join()
+    ended = time.perf_counter()
+
+    elapsed = ended - schedule.measure_started if schedule.measure_started else 0.0
+    return {
+        "commit": git_commit(),
+        "label": args.label,
+        "started_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "target": args.url,
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": None if args.requests else args.duration,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "scenarios": list(scenarios),
+            "unique_texts": args.unique_texts,
+            "batch_languages": args.batch_languages,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "elapsed_seconds": round(elapsed, 3),
+        "results": summarize(recorder, elapsed),
+    }
+
+
+def _change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(before, after):
+    """Per-scenario deltas between two result files (positive % = larger in 'after')"""
+    rows = {}
+    names = sorted(set(before["results"]["scenarios"]) | set(after["results"]["scenarios"]))
+    for name in names:
+        old = before["results"]["scenarios"].get(name)
+        new = after["results"]["scenarios"].get(name)
+        if not old or not new:
+            rows[name] = {"before": old, "after": new}
+            continue
+        rows[name] = {
+            "throughput_rps": [old["throughput_rps"], new["throughput_rps"],
+                               _change(old["throughput_rps"], new["throughput_rps"])],
+            "error_rate": [old["error_rate"], new["error_rate"]],
+        }
+        for key in ("p50", "p95", "p99"):
+            rows[name][f"{key}_ms"] = [old["latency_ms"][key], new["latency_ms"][key],
+                                       _change(old["latency_ms"][key], new["latency_ms"][key])]
+    return {"before": {"commit": before.get("commit"), "label": before.get("label")},
+            "after": {"commit": after.get("commit"), "label": after.get("label")},
+            "scenarios": rows}
+
+
+def print_table(report, stream=sys.stderr):
+    print(f"{'scenario':<26}{'req':>8}{'rps':>10}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=stream)
+    for name, row in report["results"]["scenarios"].items():
+        latency = row["latency_ms"]
+        print(f"{name:<26}{row['requests']:>8}{row['throughput_rps']:>10}{row['error_rate'] * 100:>8.2f}"
+              f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}", file=stream)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(prog='loadgen.py compare', description="Compare two loadgen result files")
+        parser.add_argument('before')
+        parser.add_argument('after')
+        args = parser.parse_args(argv[1:])
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        json.dump(compare(before, after), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    parser = argparse.ArgumentParser(description="Drive the backend API and report throughput and latency")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="backend base URL")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent workers (one connection each)")
+    parser.add_argument('--duration', type=float, default=30.0, help="measured seconds (ignored with --requests)")
+    parser.add_argument('--requests', type=int, help="stop after this many measured requests")
+    parser.add_argument('--warmup', type=float, default=5.0, help="seconds of unmeasured traffic first")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--phone', default='+15005550006', help="recipient for send_sms")
+    parser.add_argument('--batch-languages', type=int, default=4, help="target languages per batch-translate")
+    parser.add_argument('--unique-texts', action='store_true', help="make every text unique to bypass caches")
+    parser.add_argument('--timeout', type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument('--label', help="free-form label stored with the results")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"Unknown scenarios: {unknown}")
+
+    report = run(args)
+    print_table(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
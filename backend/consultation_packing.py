@@ -0,0 +1,97 @@
+"""Pack consultation fields into as few translation requests as possible.
+
+Fields are joined with a delimiter the translator leaves alone, so one
+upstream call can carry the diagnosis, medicines, nutrition and notes
+together. A field longer than the input limit is split at sentence
+boundaries first. After translation the chunk is split on the delimiter
+again; if the piece count no longer matches, the caller falls back to
+translating that chunk's pieces one by one.
+"""
+import re
+
+CONSULTATION_FIELDS = ('diagnosis', 'medicines', 'nutrition', 'notes')
+
+DELIMITER = "\n|||\n"
+_DELIMITER_RE = re.compile(r"\s*\|\|\|\s*")
+
+# Sentence ends: Latin punctuation, Devanagari danda/double danda, or line breaks
+_SENTENCE_RE = re.compile(r"[^.!?।॥\n]*(?:[.!?।॥]+|\n+|$)\s*")
+
+
+def is_translatable(value):
+    """Whether a field has content worth sending upstream"""
+    return bool(value and value.strip() and value.strip() != 'Not specified')
+
+
+def split_sentences(text, max_chars):
+    """Split text into (piece, trailing_whitespace) tuples no longer than max_chars"""
+    pieces = []
+    for match in _SENTENCE_RE.finditer(text):
+        sentence = match.group(0)
+        if not sentence:
+            continue
+        body = sentence.rstrip()
+        trailing = sentence[len(body):]
+        if not body:
+            if pieces:
+                pieces[-1] = (pieces[-1][0], pieces[-1][1] + trailing)
+            continue
+        # A single over-long sentence is split between words
+        while len(body) > max_chars:
+            cut = body.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append((body[:cut].rstrip(), ' '))
+            body = body[cut:].lstrip()
+        pieces.append((body, trailing))
+    return pieces
+
+
+def pack_fields(fields, max_chars):
+    """Group field text into chunks whose packed length fits max_chars.
+
+    Returns a list of chunks; each chunk is a list of
+    (field_name, piece_text, trailing_whitespace) tuples.
+    """
+    pieces = []
+    for name, value in fields.items():
+        text = value.strip()
+        if len(text) <= max_chars:
+            pieces.append((name, text, ''))
+        else:
+            pieces.extend((name, piece, trailing) for piece, trailing in split_sentences(text, max_chars))
+
+    chunks, current, length = [], [], 0
+    for piece in pieces:
+        added = len(piece[1]) + (len(DELIMITER) if current else 0)
+        if current and length + added > max_chars:
+            chunks.append(current)
+            current, length = [], 0
+            added = len(piece[1])
+        current.append(piece)
+        length += added
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def join_chunk(chunk):
+    """Build the upstream input for one chunk"""
+    return DELIMITER.join(piece[1] for piece in chunk)
+
+
+def split_chunk(translated, expected):
+    """Split a translated chunk back into pieces, or None if the delimiters did not survive"""
+    parts = [part.strip() for part in _DELIMITER_RE.split(translated.strip())]
+    if len(parts) != expected:
+        return None
+    return parts
+
+
+def unpack_fields(chunks, translated_pieces):
+    """Reassemble translated pieces into {field_name: text}"""
+    fields = {}
+    flat = [piece for chunk in chunks for piece in chunk]
+    for (name, _, trailing), translated in zip(flat, translated_pieces):
+        fields[name] = fields.get(name, '') + translated + trailing
+    return {name: value.strip() for name, value in fields.items()}
@@ -0,0 +1,72 @@
+"""SMS bodies and PDF report documents for a consultation.
+
+Shared by the HTTP routes (through the wrappers in app.py) and the offline
+pipeline. Nothing here touches Flask, Twilio or the network, so pipeline
+render processes can import it without starting the web app.
+"""
+import logging
+
+from sms_encoding import fit_to_segments
+
+logger = logging.getLogger(__name__)
+
+
+def format_sms_message(templates, message_type, diagnosis, medicines, nutrition, notes):
+    """Format SMS message based on the type of content being sent"""
+    return templates.render_sms(message_type, diagnosis, medicines, nutrition, notes)
+
+
+def format_translated_sms_message(templates, message_type, diagnosis, medicines, nutrition, notes, language_name):
+    """Format SMS message for translated content, with the boilerplate in the same language"""
+    return templates.render_sms(message_type, diagnosis, medicines, nutrition, notes, language=language_name)
+
+
+def build_sms_body(templates, message_type, diagnosis, medicines, nutrition, notes, language_name=None,
+                   max_segments=6):
+    """Render an SMS (translated when language_name is given) that fits the segment budget"""
+    if language_name:
+        def render(**fields):
+            return format_translated_sms_message(templates, message_type, language_name=language_name, **fields)
+    else:
+        def render(**fields):
+            return format_sms_message(templates, message_type, **fields)
+
+    fields = {"diagnosis": diagnosis, "medicines": medicines, "nutrition": nutrition, "notes": notes}
+    # Only the summary message has sections that can be dropped
+    optional_fields = ('nutrition', 'notes') if message_type == 'all' else ()
+    message_body, sms_details = fit_to_segments(
+        render,
+        fields,
+        max_segments,
+        shorten_fields=('nutrition',),
+        optional_fields=optional_fields
+    )
+
+    if sms_details['compacted']:
+        logger.warning(f"SMS compacted to {sms_details['segments']} {sms_details['encoding']} segments: "
+                       f"{', '.join(sms_details['compacted'])}")
+    return message_body, sms_details
+
+
+def build_pdf_document(templates, data):
+    """Localized title, headings and content for a translated PDF report"""
+    language_name = data.get('language_name', 'Unknown Language')
+    patient_info = data.get('patient_info') or {}
+    labels = templates.pdf_labels(language_name)
+    return {
+        "title": labels['title'],
+        "headings": labels['headings'],
+        "labels": {
+            "patient_information": labels['patient_information'],
+            "generated_on": labels['generated_on']
+        },
+        "language": language_name,
+        "language_code": templates.resolve(data.get('language_code') or language_name),
+        "sections": {
+            "diagnosis": data.get('diagnosis', ''),
+            "nutrition": data.get('nutrition', ''),
+            "notes": data.get('notes', ''),
+            "medicines": data.get('medicines', '')
+        },
+        "patient_info": patient_info if isinstance(patient_info, dict) else {}
+    }
@@ -0,0 +1,347 @@
+"""Durable log of outbound SMS deliveries and their Twilio delivery receipts.
+
+Every SMS the API sends gets a row in a SQLite file (WAL mode) before the
+Twilio call is made. The row doubles as the idempotency record: a repeated
+request with the same Idempotency-Key, or with the same recipient and body
+inside the dedup window (a double-tapped Send button), maps onto the
+existing delivery instead of sending a second message. Message bodies are
+not stored, only a hash of recipient and body.
+
+Twilio status callbacks are buffered in memory and written by a background
+flusher in one transaction per batch, so a burst of receipts costs a few
+commits instead of one per callback. Receipts still buffered when a process
+dies are lost; Twilio's message log stays authoritative for those.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from metrics import SMS_RECEIPT_FLUSH, SMS_STATUS_CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Reserved before the Twilio call; replaced by Twilio's status once it answers
+STATUS_PENDING = 'pending'
+# Twilio rejected the request (no message was created)
+STATUS_ERROR = 'error'
+
+# Twilio message statuses in lifecycle order; receipts never move a delivery backwards
+STATUS_RANKS = {
+    STATUS_PENDING: 0,
+    'accepted': 1,
+    'scheduled': 1,
+    'queued': 2,
+    'sending': 3,
+    'sent': 4,
+    'delivered': 5,
+    'undelivered': 5,
+    'failed': 5,
+    'canceled': 5,
+    STATUS_ERROR: 5,
+    'read': 6,
+}
+
+# A delivery in one of these states does not block a repeat of the same message
+UNDELIVERED_STATUSES = (STATUS_ERROR, 'failed', 'undelivered', 'canceled')
+
+
+def status_rank(status):
+    return STATUS_RANKS.get(status, 0)
+
+
+def message_fingerprint(to_number, body):
+    return hashlib.sha256(f"{to_number}\n{body}".encode('utf-8')).hexdigest()
+
+
+class DeliveryLog:
+    """SQLite-backed delivery records plus a buffered writer for status receipts"""
+
+    def __init__(self, db_path, flush_interval=1.0, flush_batch_size=200, max_buffer=5000, pending_timeout=300):
+        self.db_path = db_path
+        self.pending_timeout = pending_timeout
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.max_buffer = max_buffer
+
+        self._lock = threading.Lock()
+        self._buffer_lock = threading.Lock()
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"receipts": 0, "flushed": 0, "flushes": 0, "flush_errors": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sms_deliveries (
+                delivery_id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                fingerprint TEXT NOT NULL,
+                source TEXT NOT NULL,
+                to_number TEXT NOT NULL,
+                message_type TEXT,
+                language TEXT,
+                segments INTEGER,
+                encoding TEXT,
+                status TEXT NOT NULL,
+                status_rank INTEGER NOT NULL DEFAULT 0,
+                message_sid TEXT UNIQUE,
+                error_code TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sms_delivery_events (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_sid TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error_code TEXT,
+                received_at TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_sms_deliveries_to ON sms_deliveries (to_number, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_sms_deliveries_created ON sms_deliveries (created_at)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sms_deliveries_fingerprint ON sms_deliveries (fingerprint, created_at)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sms_delivery_events_sid ON sms_delivery_events (message_sid, event_id)"
+        )
+
+    def reserve(self, to_number, body, message_type=None, language=None, segments=None, encoding=None,
+                idempotency_key=None, dedup_window=0, source='api'):
+        """Record a send that is about to happen and return (delivery, created).
+
+        An existing delivery with the same idempotency key, or (without a key
+        and with dedup_window > 0) the same recipient and body created in the
+        last dedup_window seconds, is returned with created=False instead.
+        A reservation left pending for longer than pending_timeout (its
+        process died before Twilio answered) is given up and replaced.
+        """
+        fingerprint = message_fingerprint(to_number, body)
+        now = datetime.utcnow()
+        delivery_id = uuid.uuid4().hex
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot both miss the duplicate
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if idempotency_key:
+                    existing = self._db.execute(
+                        "SELECT * FROM sms_deliveries WHERE idempotency_key = ?", (idempotency_key,)
+                    ).fetchone()
+                elif dedup_window > 0:
+                    existing = self._db.execute(
+                        "SELECT * FROM sms_deliveries WHERE fingerprint = ? AND created_at >= ? "
+                        f"AND status NOT IN ({', '.join('?' * len(UNDELIVERED_STATUSES))}) "
+                        "ORDER BY created_at DESC LIMIT 1",
+                        (fingerprint, (now - timedelta(seconds=dedup_window)).isoformat()) + UNDELIVERED_STATUSES
+                    ).fetchone()
+                else:
+                    existing = None
+
+                if (existing is not None and existing['status'] == STATUS_PENDING
+                        and existing['created_at'] < (now - timedelta(seconds=self.pending_timeout)).isoformat()):
+                    self._db.execute(
+                        "UPDATE sms_deliveries SET status = ?, status_rank = ?, error = ?, idempotency_key = NULL, "
+                        "updated_at = ? WHERE delivery_id = ?",
+                        (STATUS_ERROR, status_rank(STATUS_ERROR), "Abandoned before Twilio answered",
+                         now.isoformat(), existing['delivery_id'])
+                    )
+                    existing = None
+
+                if existing is None:
+                    self._db.execute(
+                        "INSERT INTO sms_deliveries (delivery_id, idempotency_key, fingerprint, source, to_number, "
+                        "message_type, language, segments, encoding, status, status_rank, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (delivery_id, idempotency_key, fingerprint, source, to_number, message_type, language,
+                         segments, encoding, STATUS_PENDING, status_rank(STATUS_PENDING),
+                         now.isoformat(), now.isoformat())
+                    )
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+        if existing is not None:
+            return dict(existing), False
+        return self.get(delivery_id), True
+
+    def mark_sent(self, delivery_id, message_sid, status='accepted'):
+        """Attach the Twilio message SID and initial status to a reserved delivery.
+
+        A receipt flushed first (the callback can beat the API response) may
+        have moved the delivery further along; only the SID is recorded then.
+        """
+        rank = status_rank(status)
+        with self._lock:
+            self._db.execute(
+                "UPDATE sms_deliveries SET message_sid = ?, "
+                "status = CASE WHEN status_rank <= ? THEN ? ELSE status END, "
+                "error = CASE WHEN status_rank <= ? THEN NULL ELSE error END, "
+                "status_rank = MAX(status_rank, ?), updated_at = ? WHERE delivery_id = ?",
+                (message_sid, rank, status, rank, rank, datetime.utcnow().isoformat(), delivery_id)
+            )
+
+    def mark_error(self, delivery_id, error, error_code=None):
+        """Record that Twilio refused the send; the idempotency key is released so a retry can go out"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE sms_deliveries SET status = ?, status_rank = ?, error = ?, error_code = ?, "
+                "idempotency_key = NULL, updated_at = ? WHERE delivery_id = ?",
+                (STATUS_ERROR, status_rank(STATUS_ERROR), error, error_code,
+                 datetime.utcnow().isoformat(), delivery_id)
+            )
+
+    def get(self, delivery_id, with_events=False):
+        """Return a delivery as a dict (optionally with its receipts), or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sms_deliveries WHERE delivery_id = ?", (delivery_id,)).fetchone()
+            if row is None:
+                return None
+            delivery = dict(row)
+            if with_events:
+                delivery['events'] = [dict(event) for event in self._db.execute(
+                    "SELECT status, error_code, received_at FROM sms_delivery_events "
+                    "WHERE message_sid = ? ORDER BY event_id", (row['message_sid'] or '',)
+                )]
+        return delivery
+
+    def query(self, to_number=None, since=None, until=None, status=None, limit=100):
+        """Deliveries newest first, filtered by recipient, created_at range [since, until) and status"""
+        clauses = []
+        params = []
+        if to_number:
+            clauses.append("to_number = ?")
+            params.append(to_number)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM sms_deliveries {where}ORDER BY created_at DESC LIMIT ?", params + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending_expires_in(self, delivery):
+        """Seconds until a pending reservation is old enough for reserve() to give it up"""
+        age = (datetime.utcnow() - datetime.fromisoformat(delivery['created_at'])).total_seconds()
+        return max(0.0, self.pending_timeout - age)
+
+    def ingest(self, message_sid, status, error_code=None, delivery_id=None):
+        """Buffer one delivery receipt; it is written with the next batch.
+
+        delivery_id (from the callback URL) attaches the SID to a delivery
+        whose sender died after Twilio accepted the message but before
+        mark_sent recorded it.
+        """
+        SMS_STATUS_CALLBACKS.inc(status if status in STATUS_RANKS else 'other')
+        with self._buffer_lock:
+            self._buffer.append((message_sid, status, error_code or None, datetime.utcnow().isoformat(),
+                                 delivery_id))
+            self.stats["receipts"] += 1
+            buffered = len(self._buffer)
+        if buffered >= self.max_buffer:
+            # The flusher is falling behind; write from the request thread rather than grow without bound
+            self.flush()
+        elif buffered >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every buffered receipt in one transaction; returns the number written"""
+        with self._buffer_lock:
+            if not self._buffer:
+                return 0
+            events = list(self._buffer)
+            self._buffer.clear()
+
+        # Only the most advanced status per message needs to touch its delivery row
+        latest = {}
+        orphans = {}
+        for message_sid, status, error_code, received_at, delivery_id in events:
+            current = latest.get(message_sid)
+            if current is None or status_rank(status) >= status_rank(current[0]):
+                latest[message_sid] = (status, error_code, received_at)
+            if delivery_id:
+                orphans[message_sid] = delivery_id
+
+        start = time.perf_counter()
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.executemany(
+                    "INSERT INTO sms_delivery_events (message_sid, status, error_code, received_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [event[:4] for event in events]
+                )
+                self._db.executemany(
+                    "UPDATE sms_deliveries SET message_sid = ? WHERE delivery_id = ? AND message_sid IS NULL "
+                    "AND NOT EXISTS (SELECT 1 FROM sms_deliveries WHERE message_sid = ?)",
+                    [(message_sid, delivery_id, message_sid) for message_sid, delivery_id in orphans.items()]
+                )
+                self._db.executemany(
+                    "UPDATE sms_deliveries SET status = ?, status_rank = ?, error_code = COALESCE(?, error_code), "
+                    "updated_at = ? WHERE message_sid = ? AND status_rank <= ?",
+                    [(status, status_rank(status), error_code, received_at, message_sid, status_rank(status))
+                     for message_sid, (status, error_code, received_at) in latest.items()]
+                )
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                with self._buffer_lock:
+                    self._buffer.extendleft(reversed(events))
+                    self.stats["flush_errors"] += 1
+                logger.error(f"Delivery receipt flush of {len(events)} event(s) failed: {e}")
+                return 0
+        SMS_RECEIPT_FLUSH.observe(time.perf_counter() - start)
+        with self._buffer_lock:
+            self.stats["flushed"] += len(events)
+            self.stats["flushes"] += 1
+        return len(events)
+
+    def _flusher(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        """Start the background receipt flusher"""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flusher, name="sms-receipts", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def snapshot(self):
+        with self._buffer_lock:
+            return dict(self.stats, buffered=len(self._buffer))
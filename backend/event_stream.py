@@ -0,0 +1,37 @@
+"""Framing for streamed API responses: NDJSON lines or Server-Sent Events.
+
+Each event is a type plus a JSON object. NDJSON writes one object per line
+with the type under "type"; SSE writes an "event:" line and a "data:" line.
+Clients pick the format with ?format=ndjson|sse or an Accept header of
+text/event-stream; NDJSON is the default.
+"""
+NDJSON = 'ndjson'
+SSE = 'sse'
+
+MEDIA_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    SSE: 'text/event-stream',
+}
+
+# Keep reverse proxies from buffering the stream and caches from storing it
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+
+def choose_format(requested=None, accept=None):
+    """Stream format from an explicit ?format= value or the Accept header"""
+    if requested:
+        requested = requested.lower()
+        return requested if requested in MEDIA_TYPES else None
+    if accept and MEDIA_TYPES[SSE] in accept:
+        return SSE
+    return NDJSON
+
+
+def encode_event(stream_format, event_type, payload, dumps):
+    """One framed event as text; dumps serializes the payload to single-line JSON"""
+    if stream_format == SSE:
+        return f"event: {event_type}\ndata: {dumps(payload)}\n\n"
+    return dumps(dict(payload, type=event_type)) + "\n"
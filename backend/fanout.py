@@ -0,0 +1,127 @@
+"""Bounded concurrent fan-out with per-item and overall deadlines.
+
+Used to translate one text into several languages at once without letting a
+single slow language hold up the others, and without exceeding the upstream
+concurrency we are allowed. A running thread cannot be interrupted, so
+each item's deadline is also published to the code it runs (time_left)
+for its own upstream timeouts, which frees the worker once it has passed.
+"""
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+# (key, monotonic end, limit in seconds) of the fan-out item running in this context
+_current_item = contextvars.ContextVar('fanout_item', default=None)
+
+
+class FanOutTimeout(Exception):
+    """Raised (as a result value) for items that missed their deadline"""
+
+    def __init__(self, key, seconds):
+        super().__init__(f"Timed out after {seconds:g}s")
+        self.key = key
+        self.seconds = seconds
+
+
+def time_left(limit):
+    """Seconds the current fan-out item has left, capped at limit.
+
+    Outside a fan-out this is limit itself. Raises FanOutTimeout once the
+    item's deadline has passed.
+    """
+    item = _current_item.get()
+    if item is None:
+        return limit
+    key, end, seconds = item
+    left = end - time.monotonic()
+    if left <= 0:
+        raise FanOutTimeout(key, seconds)
+    return min(limit, left)
+
+
+class FanOut:
+    """Runs one callable over many keys on a shared, bounded worker pool"""
+
+    def __init__(self, max_workers, thread_name_prefix='fanout'):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=thread_name_prefix)
+
+    def iter_results(self, fn, keys, item_timeout=None, deadline=None):
+        """Yield (key, result, error) tuples in completion order.
+
+        item_timeout bounds each call from the moment it starts running,
+        deadline bounds the whole fan-out from now. Items that miss either
+        are reported with a FanOutTimeout error; fn should bound its own
+        blocking calls with time_left() so its worker is released as well.
+        """
+        started = {}
+        overall_end = time.monotonic() + deadline if deadline else None
+
+        def run(key):
+            started[key] = now = time.monotonic()
+            limits = []
+            if overall_end is not None:
+                limits.append((overall_end, deadline))
+            if item_timeout is not None:
+                limits.append((now + item_timeout, item_timeout))
+            if limits:
+                end, seconds = min(limits)
+                _current_item.set((key, end, seconds))
+            return fn(key)
+
+        futures = {}
+        for key in keys:
+            # Carry context variables (priority, request ids) into the worker
+            ctx = contextvars.copy_context()
+            futures[self._executor.submit(ctx.run, run, key)] = key
+        pending = set(futures)
+
+        while pending:
+            now = time.monotonic()
+            wake_at = []
+            if overall_end is not None:
+                wake_at.append(overall_end)
+            if item_timeout is not None:
+                wake_at.append(now + item_timeout)
+                wake_at.extend(started[futures[f]] + item_timeout
+                               for f in pending if futures[f] in started)
+            timeout = max(0.0, min(wake_at) - now) if wake_at else None
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                key = futures[future]
+                error = future.exception()
+                yield key, (None if error else future.result()), error
+
+            now = time.monotonic()
+            for future in list(pending):
+                key = futures[future]
+                if overall_end is not None and now >= overall_end:
+                    limit = deadline
+                elif (item_timeout is not None and key in started and
+                      now >= started[key] + item_timeout):
+                    limit = item_timeout
+                else:
+                    continue
+                pending.discard(future)
+                future.cancel()
+                logger.warning(f"Fan-out item {key} timed out after {limit}s")
+                TIMEOUTS.inc('fanout')
+                yield key, None, FanOutTimeout(key, limit)
+
+    def run(self, fn, keys, item_timeout=None, deadline=None):
+        """Run fn over keys and return {key: (result, error)}"""
+        return {
+            key: (result, error)
+            for key, result, error in self.iter_results(fn, keys, item_timeout, deadline)
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,230 @@
+"""Local medical glossary for zero-latency translation of known phrases.
+
+Each target language has a phrase table (backend/glossaries/<code>.json)
+that is compiled into an Aho-Corasick automaton, so finding every known
+phrase in a text costs one pass over the text regardless of how many
+phrases the glossary holds. Protected terms (drug names and the like, from
+backend/glossaries/protected.json) match in every language and map to
+themselves, which keeps them away from the upstream translator: text that
+goes upstream has them swapped for numbered placeholders (protect) that are
+swapped back in the translation (restore).
+"""
+import json
+import logging
+import os
+import re
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PROTECTED_FILE = 'protected.json'
+
+PLACEHOLDER = "[[{}]]"
+# Translators may add spaces inside the brackets or write the number in native digits
+_PLACEHOLDER_RE = re.compile(r"\[\[\s*(\d+)\s*\]\]")
+
+
+def _fold(text):
+    """Lower-case text without changing its length, so offsets stay valid"""
+    return ''.join(lower if len(lower) == 1 else char
+                   for char, lower in ((char, char.lower()) for char in text))
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over a {phrase: value} table"""
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._terminal = [None]   # (length, value) for a phrase ending at this state
+        self._dict_link = [0]     # nearest proper suffix state that is terminal
+
+        for phrase, value in phrases.items():
+            key = _fold(phrase.strip())
+            if key:
+                self._insert(key, value)
+        self._build()
+
+    def _insert(self, key, value):
+        state = 0
+        for char in key:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._dict_link.append(0)
+            state = nxt
+        self._terminal[state] = (len(key), value)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                link = self._fail[nxt]
+                self._dict_link[nxt] = link if self._terminal[link] else self._dict_link[link]
+
+    def find(self, text):
+        """Return leftmost-longest, non-overlapping, word-bounded matches as (start, end, value)"""
+        folded = _fold(text)
+        length = len(folded)
+        best = [None] * length    # longest match (end, value) starting at each offset
+
+        state = 0
+        for index, char in enumerate(folded):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            match_state = state if self._terminal[state] else self._dict_link[state]
+            end = index + 1
+            while match_state:
+                size, value = self._terminal[match_state]
+                start = end - size
+                if self._is_word_bounded(folded, start, end):
+                    if best[start] is None or best[start][0] < end:
+                        best[start] = (end, value)
+                match_state = self._dict_link[match_state]
+
+        matches = []
+        position = 0
+        for start in range(length):
+            if start >= position and best[start] is not None:
+                end, value = best[start]
+                matches.append((start, end, value))
+                position = end
+        return matches
+
+    @staticmethod
+    def _is_word_bounded(text, start, end):
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        return not before.isalnum() and not after.isalnum()
+
+
+class Glossary:
+    """Per-language phrase tables compiled into matchers"""
+
+    def __init__(self, tables=None, protected=()):
+        self.protected = list(protected)
+        self.tables = {}
+        self._matchers = {}
+        self._protected_matcher = PhraseMatcher({term: term for term in self.protected}) if self.protected else None
+        self.stats = {"full": 0, "partial": 0, "none": 0}
+        for language, phrases in (tables or {}).items():
+            self.add_table(language, phrases)
+
+    def add_table(self, language, phrases):
+        """Compile (or recompile) the phrase table for one target language"""
+        table = {term: term for term in self.protected}
+        table.update(phrases)
+        self.tables[language] = table
+        self._matchers[language] = PhraseMatcher(table)
+
+    @classmethod
+    def load(cls, directory):
+        """Load protected.json and every <language-code>.json in directory"""
+        protected = []
+        tables = {}
+        if not os.path.isdir(directory):
+            logger.warning(f"Glossary directory not found: {directory}")
+            return cls()
+
+        protected_path = os.path.join(directory, PROTECTED_FILE)
+        if os.path.exists(protected_path):
+            with open(protected_path, encoding='utf-8') as f:
+                protected = json.load(f).get('terms', [])
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json') or name == PROTECTED_FILE:
+                continue
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                data = json.load(f)
+            language = data.get('language', name[:-len('.json')])
+            tables[language] = data.get('phrases', {})
+
+        glossary = cls(tables, protected)
+        logger.info(f"Loaded glossary for {len(tables)} languages, {len(protected)} protected terms")
+        return glossary
+
+    def segment(self, text, target_lang):
+        """Split text into (span, translation) pairs; translation is None where the glossary has no entry"""
+        matcher = self._matchers.get(target_lang)
+        if matcher is None and self.protected:
+            matcher = self._matchers[target_lang] = self._protected_matcher
+        if matcher is None:
+            return [(text, None)]
+
+        segments = []
+        position = 0
+        for start, end, value in matcher.find(text):
+            if start > position:
+                segments.append((text[position:start], None))
+            segments.append((text[start:end], value))
+            position = end
+        if position < len(text) or not segments:
+            segments.append((text[position:], None))
+        return segments
+
+    def protect(self, text):
+        """Swap protected terms for numbered placeholders; returns (masked text, [term per placeholder])"""
+        if self._protected_matcher is None:
+            return text, []
+        parts = []
+        terms = []
+        position = 0
+        for start, end, term in self._protected_matcher.find(text):
+            parts.append(text[position:start])
+            parts.append(PLACEHOLDER.format(len(terms)))
+            terms.append(term)
+            position = end
+        if not terms:
+            return text, []
+        parts.append(text[position:])
+        return ''.join(parts), terms
+
+    @staticmethod
+    def restore(text, terms):
+        """Put protected terms back into a translation of protect()'s output; None if a placeholder was lost"""
+        if not terms:
+            return text
+        found = set()
+
+        def replace(match):
+            index = int(match.group(1))
+            if index >= len(terms):
+                return match.group(0)
+            found.add(index)
+            return terms[index]
+
+        restored = _PLACEHOLDER_RE.sub(replace, text)
+        return restored if len(found) == len(terms) else None
+
+    @staticmethod
+    def needs_translation(span):
+        """Whether an uncovered span has any words in it"""
+        return any(char.isalpha() for char in span)
+
+    def record(self, segments):
+        """Count full, partial and missed lookups for the stats endpoint"""
+        covered = any(translation is not None for _, translation in segments)
+        uncovered = any(translation is None and self.needs_translation(span) for span, translation in segments)
+        kind = 'none' if not covered else ('partial' if uncovered else 'full')
+        self.stats[kind] += 1
+        return kind
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["languages"] = sorted(self.tables)
+        stats["phrases"] = sum(len(table) for table in self.tables.values())
+        stats["protected_terms"] = len(self.protected)
+        return stats
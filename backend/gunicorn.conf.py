@@ -0,0 +1,80 @@
+"""Production server settings.
+
+Run from backend/:  gunicorn -c gunicorn.conf.py
+
+Workers are forked before the app is imported (no preload), so each one
+opens its own SQLite handles, connection pools and outbox threads, then
+warms up before it accepts its first request. SIGTERM stops accepting,
+lets in-flight requests finish within GUNICORN_GRACEFUL_TIMEOUT and then
+drains the worker's outbox sends. Workers are recycled after roughly
+GUNICORN_MAX_REQUESTS requests to cap memory growth.
+
+Workers share their metrics through METRICS_MULTIPROC_DIR (a fresh
+directory per server start unless it is set), so a scrape of /api/metrics
+that reaches any worker reports the whole server.
+
+For the asyncio routes (asgi.py) set
+GUNICORN_APP=asgi:application and GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+wsgi_app = os.environ.get("GUNICORN_APP", "app:app")
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Must outlast the batch translation deadline (BATCH_TRANSLATE_DEADLINE, 45s by default)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 60))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Jitter keeps all workers from restarting at the same moment
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+preload_app = False
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+# Metrics directory created for this server (removed again on exit)
+_own_metrics_dir = None
+
+
+def on_starting(server):
+    # Runs in the master before any worker is forked; workers inherit the variable
+    global _own_metrics_dir
+    metrics_dir = os.environ.get("METRICS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Totals left by a previous server would be counted again
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            if name.startswith("metrics_") or name == "archive.json":
+                os.remove(os.path.join(metrics_dir, name))
+    else:
+        _own_metrics_dir = os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="consult-metrics-")
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(_own_metrics_dir, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    # Runs after the worker has imported the app and before it accepts connections
+    app = sys.modules.get("app")
+    if app is not None:
+        app.warm_up()
+
+
+def worker_exit(server, worker):
+    # Absent when the worker failed to boot
+    app = sys.modules.get("app")
+    if app is not None:
+        app.shutdown(timeout=graceful_timeout)
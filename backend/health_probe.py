@@ -0,0 +1,113 @@
+"""Background reachability checks for the upstream APIs, cached for /api/health.
+
+A daemon thread calls each probe every `interval` seconds and stores the
+outcome, so the health endpoint only reads memory and answers instantly
+even while an upstream is hanging. A probe is a callable taking a timeout
+that returns a status ("up", "unauthorized", "down") and optional details,
+or raises when the upstream cannot be reached.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+from metrics import DEPENDENCY_PROBES
+
+logger = logging.getLogger(__name__)
+
+STATUS_UP = 'up'
+STATUS_DOWN = 'down'
+STATUS_UNAUTHORIZED = 'unauthorized'
+STATUS_PENDING = 'pending'
+STATUS_NOT_CONFIGURED = 'not_configured'
+
+
+class DependencyProber:
+    """Runs upstream probes on a timer and keeps the latest result of each"""
+
+    def __init__(self, probes, interval=30.0, timeout=5.0):
+        # probes: {name: probe callable, or None when the dependency is not configured}
+        self.probes = {name: probe for name, probe in probes.items() if probe is not None}
+        self.interval = interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._results = {
+            name: {"status": STATUS_PENDING if probe is not None else STATUS_NOT_CONFIGURED}
+            for name, probe in probes.items()
+        }
+        self._checked_at = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe(self, name):
+        """Run one probe now and store its outcome"""
+        start = time.perf_counter()
+        details = {}
+        try:
+            status, details = self.probes[name](self.timeout)
+            error = None
+        except Exception as e:
+            status, error = STATUS_DOWN, str(e)
+        elapsed = time.perf_counter() - start
+        DEPENDENCY_PROBES.observe(elapsed, name, status)
+
+        with self._lock:
+            previous = self._results[name]
+            failures = 0 if status == STATUS_UP else previous.get("consecutive_failures", 0) + 1
+            result = dict(details, status=status, latency_ms=round(elapsed * 1000, 1),
+                          checked_at=datetime.utcnow().isoformat(), consecutive_failures=failures)
+            if error:
+                result["error"] = error
+            self._results[name] = result
+            self._checked_at[name] = time.monotonic()
+        # Log transitions only, not every failed round of a long outage
+        if status != previous["status"]:
+            if status != STATUS_UP:
+                logger.warning(f"Dependency {name} is {status}" + (f": {error}" if error else ""))
+            elif previous["status"] != STATUS_PENDING:
+                logger.info(f"Dependency {name} is up again")
+        return result
+
+    def _run(self):
+        # Jitter the first round so workers started together do not probe in lockstep
+        self._stop.wait(random.uniform(0, min(self.interval, 1.0)))
+        while not self._stop.is_set():
+            for name in self.probes:
+                if self._stop.is_set():
+                    return
+                self.probe(name)
+            self._stop.wait(self.interval * random.uniform(0.9, 1.1))
+
+    def start(self):
+        """Start probing in the background"""
+        if self._thread or not self.probes or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dependency-probes", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def status(self, name):
+        with self._lock:
+            return self._results[name]["status"]
+
+    def snapshot(self):
+        """Latest result of every dependency, with how long ago it was checked"""
+        now = time.monotonic()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+            for name, checked_at in self._checked_at.items():
+                results[name]["age_seconds"] = round(now - checked_at, 1)
+        return results
+
+    def up_values(self):
+        """{(name,): 1 or 0} for the dependency_up gauge; dependencies never checked are left out"""
+        with self._lock:
+            return {(name,): int(result["status"] == STATUS_UP) for name, result in self._results.items()
+                    if name in self._checked_at}
@@ -0,0 +1,182 @@
+"""Pre-localized message templates for SMS and PDF output.
+
+The fixed boilerplate (headings, advice lines, report titles) for every
+supported language lives in backend/locales/<code>.json. At startup each
+message_type x language layout is filled with that language's boilerplate
+and compiled into a list of (literal, field) parts, so rendering a message
+is a single join over the parts with no upstream call for fixed text.
+"""
+import json
+import logging
+import os
+from string import Formatter
+
+from sms_encoding import truncate_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'en-IN'
+
+# Layouts reference boilerplate keys with single braces and message fields
+# with double braces, so compiling leaves only the message fields behind.
+SMS_LAYOUTS = {
+    'diagnosis': "{diagnosis_heading}{suffix}: {{diagnosis}}\n{diagnosis_advice}",
+    'medicines': "{medicines_heading}{suffix}: {{medicines}}\n{medicines_advice}",
+    'nutrition': "{nutrition_heading}{suffix}: {{nutrition}}\n{nutrition_advice}",
+    'notes': "{notes_heading}{suffix}: {{notes}}\n{notes_advice}",
+}
+SUMMARY_HEADER = "{summary_heading}{suffix}:"
+SUMMARY_SECTIONS = (
+    ('diagnosis', "{diagnosis_label}: {{diagnosis}}"),
+    ('medicines', "{medicines_label}: {{medicines}}"),
+    ('nutrition', "{nutrition_label}: {{nutrition}}"),
+    ('notes', "{notes_label}: {{notes}}"),
+)
+SUMMARY_FOOTER = "{summary_advice}"
+
+# Nutrition plans are shortened for SMS brevity
+NUTRITION_LIMITS = {'nutrition': 150, 'all': 100}
+
+PDF_SECTIONS = ('diagnosis', 'medicines', 'nutrition', 'notes')
+
+_formatter = Formatter()
+
+
+class CompiledTemplate:
+    """A template pre-split into literal text and field references"""
+
+    __slots__ = ('parts',)
+
+    def __init__(self, template):
+        self.parts = tuple((literal, field) for literal, field, _, _ in _formatter.parse(template))
+
+    def render(self, values):
+        return ''.join(literal + (values[field] if field is not None else '')
+                       for literal, field in self.parts)
+
+
+def _escape(value):
+    return value.replace('{', '{{').replace('}', '}}')
+
+
+class TemplateRegistry:
+    """Compiled SMS and PDF templates for every locale"""
+
+    def __init__(self, locales, language_names=None, tagged_strings=None):
+        if DEFAULT_LANGUAGE not in locales:
+            raise ValueError(f"Locale {DEFAULT_LANGUAGE} is required")
+        self.language_names = dict(language_names or {})
+        self._aliases = {}
+        self._strings = {}
+        self._sms = {}
+        self._summary = {}
+
+        english = locales[DEFAULT_LANGUAGE]
+        for code, strings in locales.items():
+            missing = sorted(set(english) - set(strings))
+            if missing:
+                logger.warning(f"Locale {code} is missing {missing}; using English for those strings")
+            merged = dict(english, **strings)
+            self._strings[code] = merged
+            self._compile(code, merged, suffix='')
+            self._register_aliases(code)
+
+        # English boilerplate tagged with the language name, for languages without a locale;
+        # tagged_strings holds the few lines that read differently there
+        self._compile('*', dict(self._strings[DEFAULT_LANGUAGE], **(tagged_strings or {})),
+                      suffix=' ({language_name})')
+
+    def _register_aliases(self, code):
+        self._aliases[code.lower()] = code
+        self._aliases[code.split('-')[0].lower()] = code
+        name = self.language_names.get(code)
+        if name:
+            self._aliases[name.lower()] = code
+
+    def _compile(self, key, strings, suffix):
+        values = {name: _escape(value) for name, value in strings.items()}
+        values['suffix'] = suffix
+
+        sms = {message_type: CompiledTemplate(layout.format(**values))
+               for message_type, layout in SMS_LAYOUTS.items()}
+        if suffix:
+            sms['fallback'] = CompiledTemplate(f"{values['fallback'].rstrip('.')}{suffix}.")
+        else:
+            sms['fallback'] = CompiledTemplate(values['fallback'])
+        self._sms[key] = sms
+        self._summary[key] = (
+            CompiledTemplate(SUMMARY_HEADER.format(**values)),
+            tuple((field, CompiledTemplate(layout.format(**values))) for field, layout in SUMMARY_SECTIONS),
+            CompiledTemplate(SUMMARY_FOOTER.format(**values)),
+        )
+
+    @classmethod
+    def load(cls, directory, supported_languages=None):
+        """Load every <code>.json locale file from directory"""
+        locales = {}
+        tagged_strings = {}
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                data = json.load(f)
+            code = data.get('language', name[:-len('.json')])
+            locales[code] = data['strings']
+            if code == DEFAULT_LANGUAGE:
+                tagged_strings = data.get('tagged_strings', {})
+
+        language_names = {}
+        for language in (supported_languages or {}).values():
+            language_names[language['code']] = language['name']
+            if language['code'] not in locales:
+                logger.warning(f"No message locale for {language['code']}; English boilerplate will be used")
+
+        registry = cls(locales, language_names, tagged_strings)
+        logger.info(f"Compiled message templates for {len(locales)} locales")
+        return registry
+
+    def resolve(self, language):
+        """Map 'hi', 'hi-IN' or 'Hindi' to a locale code, or None if there is no locale"""
+        if not language:
+            return None
+        return self._aliases.get(language.strip().lower())
+
+    def strings(self, language):
+        """Boilerplate strings for a language (English when there is no locale)"""
+        return self._strings.get(self.resolve(language) or DEFAULT_LANGUAGE)
+
+    def render_sms(self, message_type, diagnosis, medicines, nutrition, notes, language=None):
+        """Render an SMS body. Unknown languages get English boilerplate tagged with the language name."""
+        code = self.resolve(language) if language else DEFAULT_LANGUAGE
+        key = code or '*'
+        values = {
+            "diagnosis": diagnosis or '',
+            "medicines": medicines or '',
+            "nutrition": truncate_text(nutrition or '', NUTRITION_LIMITS.get(message_type, 150)),
+            "notes": notes or '',
+            "language_name": language or '',
+        }
+
+        if message_type == 'all':
+            header, sections, footer = self._summary[key]
+            lines = [header.render(values)]
+            lines.extend(template.render(values) for field, template in sections
+                         if values[field] and values[field] != 'Not specified')
+            lines.append(footer.render(values))
+            return '\n'.join(lines)
+
+        template = self._sms[key].get(message_type) or self._sms[key]['fallback']
+        return template.render(values)
+
+    def pdf_labels(self, language):
+        """Title and section headings for a PDF report; English titles name a language without a locale"""
+        strings = self.strings(language)
+        title = strings['report_title']
+        if language and self.resolve(language) is None:
+            title = f"{title} ({language})"
+        return {
+            "title": title,
+            "headings": {section: strings[f'{section}_label'] for section in PDF_SECTIONS},
+            "patient_information": strings['patient_information'],
+            "generated_on": strings['generated_on'],
+        }
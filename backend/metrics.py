@@ -0,0 +1,454 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Recording is lock-free on the hot path: every metric keeps one shard per
+thread, and a thread only ever writes its own shard. The single lock is
+taken the first time a thread touches a metric (to register its shard),
+when a thread exits (its shard is folded into the metric's base totals, so
+short-lived threads do not pile up shards) and when /api/metrics merges the
+shards for a scrape.
+
+With a MultiProcessCollector, the worker processes of one server share
+their totals through files in a directory and any worker answers a scrape
+for all of them. Without one, each process reports only itself and every
+series carries a pid label, so each worker has to be scraped on its own.
+"""
+import bisect
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _ShardHandle:
+    """Held only by a thread's thread-local, so it is released when the thread exits"""
+
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # id(shard) -> shard of each live thread; totals of exited threads are folded into _base
+        self._shards = {}
+        self._base = {}
+
+    def _shard(self):
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = self._local.handle = _ShardHandle({})
+            with self._lock:
+                self._shards[id(handle.shard)] = handle.shard
+            weakref.finalize(handle, self._retire, handle.shard).atexit = False
+        return handle.shard
+
+    def _retire(self, shard):
+        """Fold the shard of a thread that exited into the base totals"""
+        with self._lock:
+            self._shards.pop(id(shard), None)
+            self._fold(self._base, list(shard.items()))
+
+    def _merged(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            totals = self._copy(self._base)
+        for shard in shards:
+            self._fold(totals, list(shard.items()))
+        return totals
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+    def render(self, constant_labels=(), totals=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(constant_labels, totals))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic counter, labelled by position: counter.inc('hi-IN')"""
+
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    @staticmethod
+    def _fold(totals, items):
+        for key, value in items:
+            totals[key] = totals.get(key, 0) + value
+
+    @staticmethod
+    def _copy(totals):
+        return dict(totals)
+
+    def _samples(self, constant_labels, totals=None):
+        for key, value in sorted((self._merged() if totals is None else totals).items()):
+            yield f'{self.name}{{{self._label_text(key, constant_labels)}}} {_format_value(value)}'
+
+    def value(self, *labelvalues):
+        return self._merged().get(labelvalues, 0)
+
+
+class Gauge(Counter):
+    """Up/down gauge; inc and dec from any thread sum to the current value"""
+
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def track(self, *labelvalues):
+        """Context manager that holds the gauge up for the duration of a block"""
+        return _Tracked(self, labelvalues)
+
+
+class _Tracked:
+    __slots__ = ('gauge', 'labelvalues')
+
+    def __init__(self, gauge, labelvalues):
+        self.gauge = gauge
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.gauge.inc(*self.labelvalues)
+
+    def __exit__(self, *exc):
+        self.gauge.dec(*self.labelvalues)
+
+
+class CallbackGauge(_Metric):
+    """Gauge read from a callback at scrape time; fn returns {labelvalues_tuple: value}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, fn):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def _samples(self, constant_labels, totals=None):
+        for key, value in sorted(self.fn().items()):
+            yield f'{self.name}{{{self._label_text(key, constant_labels)}}} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    """Bucketed latency histogram: histogram.observe(seconds, 'hi-IN', '200')"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        shard = self._shard()
+        entry = shard.get(labelvalues)
+        if entry is None:
+            # per-bucket counts (the last slot is +Inf), then sum
+            entry = shard[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *labelvalues):
+        """Context manager that observes the duration of a block"""
+        return _Timer(self, labelvalues)
+
+    def _fold(self, totals, items):
+        for key, (counts, total) in items:
+            merged = totals.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            for index, count in enumerate(list(counts)):
+                merged[0][index] += count
+            merged[1] += total
+
+    @staticmethod
+    def _copy(totals):
+        return {key: [list(counts), total] for key, (counts, total) in totals.items()}
+
+    def _samples(self, constant_labels, totals=None):
+        bounds = self.buckets + (float('inf'),)
+        for key, (counts, total) in sorted((self._merged() if totals is None else totals).items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = self._label_text(key, (('le', _format_value(float(bound))),) + tuple(constant_labels))
+                yield f'{self.name}_bucket{{{labels}}} {cumulative}'
+            labels = self._label_text(key, constant_labels)
+            yield f'{self.name}_sum{{{labels}}} {_format_value(round(total, 6))}'
+            yield f'{self.name}_count{{{labels}}} {cumulative}'
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'start')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class Registry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def callback_gauge(self, name, documentation, labelnames, fn):
+        return self.register(CallbackGauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics)
+
+    def render(self):
+        """This process's metrics, each series labelled with the pid"""
+        constant_labels = (('pid', os.getpid()),)
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render(constant_labels))
+        return '\n'.join(lines) + '\n'
+
+    def render_totals(self, totals):
+        """Metrics from merged {name: totals} (see MultiProcessCollector); callback gauges are read live"""
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render((), totals.get(metric.name, {}) if hasattr(metric, '_fold') else None))
+        return '\n'.join(lines) + '\n'
+
+
+class MultiProcessCollector:
+    """Shares the registry's totals between the worker processes of one server through a directory.
+
+    Each process writes its totals to metrics_<pid>.json every `interval`
+    seconds and when it stops; a scrape merges every process's file, so
+    whichever worker the load balancer picks reports the whole server.
+    Files of exited workers are folded into archive.json (their gauges are
+    dropped), which keeps counters monotonic across worker restarts. Up to
+    `interval` seconds of another worker's recent activity may be missing
+    from a scrape.
+    """
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, registry, directory, interval=5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _sharded(self):
+        return {metric.name: metric for metric in self.registry.metrics() if hasattr(metric, '_fold')}
+
+    def flush(self):
+        """Write this process's totals to its file"""
+        state = {name: [[list(key), value] for key, value in metric._merged().items()]
+                 for name, metric in self._sharded().items()}
+        self._write(self.path, state)
+
+    @staticmethod
+    def _write(path, state):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable metrics file {path}: {e}")
+            return {}
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _fold_state(self, totals, state, metrics, skip_gauges=False):
+        for name, items in state.items():
+            metric = metrics.get(name)
+            if metric is None or (skip_gauges and metric.kind == 'gauge'):
+                continue
+            metric._fold(totals.setdefault(name, {}), [(tuple(key), value) for key, value in items])
+
+    def collect(self):
+        """Merged {name: totals} of every worker process, live and exited"""
+        self.flush()
+        metrics = self._sharded()
+        totals = {}
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, self.ARCHIVE)
+            archive = self._read(archive_path)
+            retired = []
+            for name in sorted(os.listdir(self.directory)):
+                if not (name.startswith('metrics_') and name.endswith('.json')):
+                    continue
+                path = os.path.join(self.directory, name)
+                state = self._read(path)
+                if self._is_alive(int(name[len('metrics_'):-len('.json')])):
+                    self._fold_state(totals, state, metrics)
+                else:
+                    retired.append((path, state))
+
+            if retired:
+                merged = {}
+                self._fold_state(merged, archive, metrics)
+                for _, state in retired:
+                    self._fold_state(merged, state, metrics, skip_gauges=True)
+                archive = {name: [[list(key), value] for key, value in items.items()]
+                           for name, items in merged.items()}
+                self._write(archive_path, archive)
+                for path, _ in retired:
+                    os.remove(path)
+            self._fold_state(totals, archive, metrics)
+        return totals
+
+    def render(self):
+        return self.registry.render_totals(self.collect())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Metrics flush failed: {e}")
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the flush thread and write the final totals for the next scrape to archive"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route, method and status',
+    ('route', 'method', 'status'))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled', ('route',))
+
+SARVAM_REQUESTS = REGISTRY.histogram(
+    'sarvam_request_duration_seconds', 'Sarvam translate call latency per attempt by target language and outcome',
+    ('target_language', 'outcome'))
+SARVAM_IN_FLIGHT = REGISTRY.gauge(
+    'sarvam_requests_in_flight', 'Sarvam calls currently waiting on the upstream')
+SARVAM_RETRIES = REGISTRY.counter(
+    'sarvam_retries_total', 'Sarvam attempts that were retried, by target language and reason',
+    ('target_language', 'reason'))
+HEDGED_REQUESTS = REGISTRY.counter(
+    'hedged_requests_total', 'Hedged upstream requests by upstream and outcome (sent, won, no_budget, no_capacity)',
+    ('upstream', 'outcome'))
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    'circuit_rejections_total', 'Calls rejected by an open circuit breaker', ('upstream', 'key'))
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'circuit_transitions_total', 'Circuit breaker state changes by the state entered', ('upstream', 'key', 'state'))
+
+TWILIO_REQUESTS = REGISTRY.histogram(
+    'twilio_request_duration_seconds', 'Twilio message create latency by outcome', ('outcome',))
+TWILIO_IN_FLIGHT = REGISTRY.gauge(
+    'twilio_requests_in_flight', 'Twilio calls currently waiting on the upstream')
+
+TIMEOUTS = REGISTRY.counter(
+    'timeouts_total', 'Operations abandoned on a timeout, by where the timeout fired', ('source',))
+OUTBOUND_QUEUE_DEPTH = REGISTRY.gauge(
+    'outbound_queue_depth', 'Calls waiting for an outbound token by upstream and priority class', ('upstream', 'priority'))
+OUTBOUND_QUEUE_WAIT = REGISTRY.histogram(
+    'outbound_queue_wait_seconds', 'Time spent waiting for an outbound token by upstream and priority class',
+    ('upstream', 'priority'))
+OUTBOUND_QUEUE_TIMEOUTS = REGISTRY.counter(
+    'outbound_queue_timeouts_total', 'Calls that gave up waiting for an outbound token', ('upstream', 'priority'))
+
+SMS_MESSAGES = REGISTRY.counter(
+    'sms_messages_sent_total', 'SMS messages accepted by Twilio by language', ('language',))
+SMS_CHARACTERS = REGISTRY.counter(
+    'sms_characters_sent_total', 'Characters in SMS bodies accepted by Twilio by language', ('language',))
+SMS_SEGMENTS = REGISTRY.counter(
+    'sms_segments_sent_total', 'Billable SMS segments accepted by Twilio by language and encoding',
+    ('language', 'encoding'))
+SMS_STATUS_CALLBACKS = REGISTRY.counter(
+    'sms_status_callbacks_total', 'Twilio delivery receipts received by message status', ('status',))
+SMS_RECEIPT_FLUSH = REGISTRY.histogram(
+    'sms_receipt_flush_duration_seconds', 'Time to write one batch of buffered delivery receipts')
+
+UPLOADS = REGISTRY.counter(
+    'uploads_total', 'Uploaded files by outcome (stored, deduplicated)', ('outcome',))
+UPLOAD_BYTES = REGISTRY.counter(
+    'upload_bytes_total', 'Bytes received in uploaded files by outcome (stored, deduplicated)', ('outcome',))
+
+DEPENDENCY_PROBES = REGISTRY.histogram(
+    'dependency_probe_duration_seconds', 'Background reachability checks of upstream APIs by dependency and status',
+    ('dependency', 'status'))
@@ -0,0 +1,297 @@
+"""Priority-aware pacing for outbound Twilio and Sarvam calls.
+
+Every upstream has one PriorityScheduler: a token bucket sized to the
+upstream's quota (shared by all worker processes when it is a
+SharedTokenBucket) plus one FIFO queue per priority class. A call takes a
+token immediately when nobody is queued; otherwise it queues, and freed
+tokens always go to the head of the highest non-empty class, so within a
+process a burst of batch translations cannot delay a live consultation.
+Each class has its own bound on queueing delay, after which the caller
+gets QueueTimeout instead of waiting indefinitely.
+
+The queues are per process, but the bucket is not: across processes,
+priority comes from reserves. Each class may only draw the bucket down to
+its reserve, a share of the burst kept for the classes above it, so a
+batch run in one worker still leaves tokens that a live call in another
+can take at once. The reserves need a burst above one token to have
+room to work with.
+
+The priority of a call is taken from the current context (set by the
+route with outbound_priority()), so it follows the work into fan-out
+workers and hedged requests without being passed through every helper.
+Both blocking threads and asyncio tasks can wait on the same scheduler;
+with a SharedTokenBucket the asyncio side takes its tokens on a worker
+thread, since each one is a SQLite write transaction.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from collections import deque
+
+from metrics import OUTBOUND_QUEUE_DEPTH, OUTBOUND_QUEUE_TIMEOUTS, OUTBOUND_QUEUE_WAIT
+from rate_limit import SharedTokenBucket, TokenBucket
+
+# Highest priority first
+LIVE = 'live'
+URGENT = 'urgent'
+ROUTINE = 'routine'
+BATCH = 'batch'
+PRIORITY_CLASSES = (LIVE, URGENT, ROUTINE, BATCH)
+
+DEFAULT_PRIORITY = ROUTINE
+
+# SMS message types that carry treatment instructions go first
+MESSAGE_TYPE_PRIORITIES = {
+    'all': URGENT,
+    'diagnosis': URGENT,
+    'medicines': URGENT,
+    'nutrition': ROUTINE,
+    'notes': ROUTINE,
+}
+
+# max_wait values: the priority class's own bound, or no bound at all (background senders)
+CLASS_LIMIT = object()
+NO_LIMIT = None
+
+_current_priority = contextvars.ContextVar('outbound_priority', default=DEFAULT_PRIORITY)
+
+
+class QueueTimeout(Exception):
+    """Raised when a call waited longer than its class allows for an outbound token"""
+
+    def __init__(self, upstream, priority, waited):
+        super().__init__(f"{upstream} is at capacity; {priority} request waited {waited:.1f}s")
+        self.upstream = upstream
+        self.priority = priority
+        self.waited = waited
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+def resolve_priority(default, requested=None):
+    """The route's priority class, lowered (never raised) by a client-requested class"""
+    if requested in PRIORITY_CLASSES and PRIORITY_CLASSES.index(requested) > PRIORITY_CLASSES.index(default):
+        return requested
+    return default
+
+
+def priority_for_message_type(message_type):
+    return MESSAGE_TYPE_PRIORITIES.get(message_type, ROUTINE)
+
+
+@contextlib.contextmanager
+def outbound_priority(priority):
+    """Run a block with outbound calls scheduled at the given priority class"""
+    token = _current_priority.set(priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _Ticket:
+    __slots__ = ('priority', 'granted', 'event', 'future', 'loop')
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+        self.event = None
+        self.future = None
+        self.loop = None
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class PriorityScheduler:
+    """Token bucket for one upstream with strict-priority queueing and bounded waits"""
+
+    def __init__(self, upstream, rate, burst=None, max_waits=None, bucket=None, reserves=None):
+        self.upstream = upstream
+        # bucket: a SharedTokenBucket to pace several processes together; a private TokenBucket by default
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.max_waits = {priority: None for priority in PRIORITY_CLASSES}
+        self.max_waits.update(max_waits or {})
+        # reserves: {priority: share of the burst (0-1) this class leaves to the classes above it}.
+        # Only the burst beyond one token can be held back, or the class could never send.
+        headroom = max(0.0, self.bucket.capacity - 1)
+        self.reserves = {priority: min(1.0, max(0.0, (reserves or {}).get(priority, 0.0))) * headroom
+                         for priority in PRIORITY_CLASSES}
+        self._queues = {priority: deque() for priority in PRIORITY_CLASSES}
+        # Taking a shared token can wait on another process's transaction: keep it off the event loop
+        self._offload = isinstance(self.bucket, SharedTokenBucket)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {priority: {"granted": 0, "timeouts": 0} for priority in PRIORITY_CLASSES}
+
+    def _queued_locked(self):
+        return any(self._queues.values())
+
+    def _dispatch_locked(self):
+        """Hand available tokens to queued tickets, highest class first.
+
+        Returns the seconds until the next token if tickets are still
+        waiting, otherwise None.
+        """
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue:
+                wait = self.bucket.try_acquire(1, self.reserves[priority])
+                if wait:
+                    return wait
+                queue.popleft().grant()
+                OUTBOUND_QUEUE_DEPTH.dec(self.upstream, priority)
+        return None
+
+    def _enter(self, priority, max_wait):
+        """Take a token now, or enqueue a ticket; returns (ticket or None, priority, deadline)"""
+        if priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+        if max_wait is CLASS_LIMIT:
+            max_wait = self.max_waits[priority]
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        with self._lock:
+            if not self._queued_locked() and self.bucket.try_acquire(1, self.reserves[priority]) == 0.0:
+                return None, priority, deadline
+            ticket = _Ticket(priority)
+            self._queues[priority].append(ticket)
+            OUTBOUND_QUEUE_DEPTH.inc(self.upstream, priority)
+        return ticket, priority, deadline
+
+    def _poll(self, ticket, deadline):
+        """Dispatch freed tokens; returns None once granted, False past the deadline, else seconds to sleep"""
+        with self._lock:
+            wait = self._dispatch_locked()
+            if ticket.granted:
+                return None
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                self._abandon_locked(ticket)
+                return False
+        # Whoever wakes first hands the next token out, so no waiter sleeps past it
+        return min(wait, remaining) if remaining is not None else wait
+
+    def _abandon_locked(self, ticket):
+        try:
+            self._queues[ticket.priority].remove(ticket)
+            OUTBOUND_QUEUE_DEPTH.dec(self.upstream, ticket.priority)
+        except ValueError:
+            pass
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if not ticket.granted:
+                self._abandon_locked(ticket)
+
+    def _finish(self, priority, started, granted):
+        waited = time.monotonic() - started
+        OUTBOUND_QUEUE_WAIT.observe(waited, self.upstream, priority)
+        # Not self._lock, which is held across shared-bucket transactions
+        with self._stats_lock:
+            self.stats[priority]["granted" if granted else "timeouts"] += 1
+        if not granted:
+            OUTBOUND_QUEUE_TIMEOUTS.inc(self.upstream, priority)
+            raise QueueTimeout(self.upstream, priority, waited)
+        return waited
+
+    def acquire(self, priority=None, max_wait=CLASS_LIMIT):
+        """Block until this call may go upstream; returns seconds spent queued.
+
+        priority defaults to the current context's class, max_wait to the
+        class limit (NO_LIMIT waits indefinitely). Raises QueueTimeout.
+        """
+        started = time.monotonic()
+        ticket, priority, deadline = self._enter(priority or current_priority(), max_wait)
+        if ticket is None:
+            return self._finish(priority, started, True)
+
+        ticket.event = threading.Event()
+        while True:
+            sleep = self._poll(ticket, deadline)
+            if sleep is None:
+                return self._finish(priority, started, True)
+            if sleep is False:
+                return self._finish(priority, started, False)
+            ticket.event.wait(sleep)
+
+    async def _run(self, fn, *args):
+        """Run a scheduler step from the event loop, on a worker thread when it touches the shared bucket"""
+        if not self._offload:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _enter_async(self, loop, priority, max_wait):
+        if not self._offload:
+            return self._enter(priority, max_wait)
+        entering = loop.run_in_executor(None, self._enter, priority, max_wait)
+        try:
+            return await asyncio.shield(entering)
+        except asyncio.CancelledError:
+            # _enter still completes on its thread: give back the queue place it may take
+            entering.add_done_callback(lambda done: self._abandon_entered(loop, done))
+            raise
+
+    def _abandon_entered(self, loop, entered):
+        if entered.cancelled() or entered.exception() is not None:
+            return
+        ticket = entered.result()[0]
+        if ticket is not None:
+            loop.run_in_executor(None, self._abandon, ticket)
+
+    async def acquire_async(self, priority=None, max_wait=CLASS_LIMIT):
+        """asyncio counterpart of acquire()"""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        ticket, priority, deadline = await self._enter_async(loop, priority or current_priority(), max_wait)
+        if ticket is None:
+            return self._finish(priority, started, True)
+
+        ticket.loop = loop
+        ticket.future = loop.create_future()
+        try:
+            while True:
+                sleep = await self._run(self._poll, ticket, deadline)
+                if sleep is None:
+                    return self._finish(priority, started, True)
+                if sleep is False:
+                    return self._finish(priority, started, False)
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.future), sleep)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            loop.run_in_executor(None, self._abandon, ticket)
+            raise
+
+    def depth(self):
+        with self._lock:
+            return {priority: len(queue) for priority, queue in self._queues.items()}
+
+    def snapshot(self):
+        # Health checks read this: no self._lock, which is held across shared-bucket transactions
+        queues = {priority: len(queue) for priority, queue in self._queues.items()}
+        with self._stats_lock:
+            stats = {priority: dict(counts) for priority, counts in self.stats.items()}
+        return {
+            "rate_per_second": self.bucket.rate,
+            "burst": self.bucket.capacity,
+            "reserved_tokens": {priority: round(reserve, 2) for priority, reserve in self.reserves.items()},
+            "tokens": round(self.bucket.available, 2),
+            "queue_depth": queues,
+            "max_wait_seconds": dict(self.max_waits),
+            "granted": {priority: counts["granted"] for priority, counts in stats.items()},
+            "timeouts": {priority: counts["timeouts"] for priority, counts in stats.items()},
+        }
@@ -0,0 +1,390 @@
+"""Server-side PDF rendering for translated consultation reports.
+
+Reports are rendered with fpdf2 and stored on disk under the SHA-256 of
+the whole document (content and localized title, headings and labels), so
+a reprint or re-download is streamed straight from the cache without
+rendering again, and a changed template string gets a new file.
+
+Indic scripts need a Noto font per script, looked up in PDF_FONT_DIR.
+No fonts ship with the code: without NotoSans<Script>-Regular.ttf for a
+report's script, rendering raises FontNotAvailable (a 503 from the API).
+Each font is subset once per process to its script's Unicode block (with
+its shaping tables kept), so every document only parses and embeds a
+small font instead of the full family file.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from fontTools import subset
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+
+try:
+    import uharfbuzz  # noqa: F401  (enables fpdf2 text shaping)
+    TEXT_SHAPING = True
+except ImportError:
+    TEXT_SHAPING = False
+
+logger = logging.getLogger(__name__)
+# fontTools logs every subsetting step at INFO
+logging.getLogger('fontTools').setLevel(logging.WARNING)
+
+RENDERER_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+
+LATIN = 'latin'
+
+# Script -> Noto family file stem; <stem>-Regular.ttf is required, <stem>-Bold.ttf is optional
+SCRIPT_FONTS = {
+    LATIN: 'NotoSans',
+    'devanagari': 'NotoSansDevanagari',
+    'bengali': 'NotoSansBengali',
+    'gurmukhi': 'NotoSansGurmukhi',
+    'gujarati': 'NotoSansGujarati',
+    'oriya': 'NotoSansOriya',
+    'tamil': 'NotoSansTamil',
+    'telugu': 'NotoSansTelugu',
+    'kannada': 'NotoSansKannada',
+    'malayalam': 'NotoSansMalayalam',
+}
+
+# The Indic blocks are laid out 0x80 apart starting at U+0900, in this order
+INDIC_BLOCKS = ('devanagari', 'bengali', 'gurmukhi', 'gujarati', 'oriya',
+                'tamil', 'telugu', 'kannada', 'malayalam')
+INDIC_START = 0x0900
+INDIC_END = INDIC_START + 0x80 * len(INDIC_BLOCKS)
+
+LANGUAGE_SCRIPTS = {
+    'hi-IN': 'devanagari',
+    'mr-IN': 'devanagari',
+    'bn-IN': 'bengali',
+    'pa-IN': 'gurmukhi',
+    'gu-IN': 'gujarati',
+    'od-IN': 'oriya',
+    'ta-IN': 'tamil',
+    'te-IN': 'telugu',
+    'kn-IN': 'kannada',
+    'ml-IN': 'malayalam',
+    'en-IN': LATIN,
+}
+
+# Kept in every subset: ASCII, Latin-1, dandas, joiners, dotted circle, punctuation, rupee sign
+COMMON_CODEPOINTS = (
+    set(range(0x20, 0x7F)) | set(range(0xA0, 0x100)) | {0x0964, 0x0965, 0x200C, 0x200D, 0x25CC, 0x20B9}
+    | set(range(0x2010, 0x2028))
+)
+EXTRA_RANGES = {
+    'devanagari': range(0xA8E0, 0xA900),
+    LATIN: range(0x0100, 0x0250),
+}
+
+
+class FontNotAvailable(Exception):
+    """Raised when the text needs a script whose font file is not installed"""
+
+
+def script_of(char):
+    """Indic script of a character, or None for anything else"""
+    codepoint = ord(char)
+    if INDIC_START <= codepoint < INDIC_END:
+        return INDIC_BLOCKS[(codepoint - INDIC_START) // 0x80]
+    return None
+
+
+def scripts_in(texts):
+    """Set of Indic scripts used anywhere in texts"""
+    scripts = set()
+    for text in texts:
+        for char in text:
+            if INDIC_START <= ord(char) < INDIC_END:
+                scripts.add(script_of(char))
+    return scripts
+
+
+def latin1(text):
+    """Replace characters the built-in Helvetica font cannot encode"""
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def content_hash(document, salt=''):
+    """SHA-256 over the canonical JSON of a report document, template strings included"""
+    payload = json.dumps(
+        {"document": document, "salt": salt},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class FontLibrary:
+    """Script fonts found in a directory, subset once per process on first use"""
+
+    def __init__(self, font_dir, subset_dir):
+        self.font_dir = font_dir
+        self.subset_dir = subset_dir
+        self._lock = threading.Lock()
+        self._subsets = {}
+        self.available = {}
+        for script, stem in SCRIPT_FONTS.items():
+            styles = {}
+            for style, suffix in (('', 'Regular'), ('B', 'Bold')):
+                path = os.path.join(font_dir, f'{stem}-{suffix}.ttf')
+                if os.path.exists(path):
+                    styles[style] = path
+            if '' in styles:
+                self.available[script] = styles
+
+        missing = sorted(set(SCRIPT_FONTS) - set(self.available))
+        logger.info(f"PDF fonts available for {sorted(self.available)}; missing {missing}")
+        if not TEXT_SHAPING and len(self.available) > 1:
+            logger.warning("uharfbuzz is not installed; Indic text in PDFs will not be shaped")
+
+    def signature(self):
+        """Identifies the installed fonts, so cached PDFs are re-rendered when they change"""
+        return ','.join(sorted(self.available))
+
+    def family(self, script):
+        return f'noto-{script}'
+
+    def path(self, script, style=''):
+        """Path to the subset font for a script, building it the first time"""
+        key = (script, style)
+        path = self._subsets.get(key)
+        if path is not None:
+            return path
+        with self._lock:
+            path = self._subsets.get(key)
+            if path is None:
+                path = self._subsets[key] = self._build_subset(script, self.available[script][style])
+        return path
+
+    def _build_subset(self, script, source):
+        stat = os.stat(source)
+        tag = hashlib.sha1(f'{source}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(source))[0]
+        target = os.path.join(self.subset_dir, f'{name}.{tag}.ttf')
+        if os.path.exists(target):
+            return target
+
+        unicodes = set(COMMON_CODEPOINTS) | set(EXTRA_RANGES.get(script, ()))
+        if script != LATIN:
+            start = INDIC_START + 0x80 * INDIC_BLOCKS.index(script)
+            unicodes.update(range(start, start + 0x80))
+
+        options = subset.Options()
+        options.layout_features = ['*']
+        options.name_IDs = ['*']
+        options.notdef_outline = True
+        font = subset.load_font(source, options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=unicodes)
+        subsetter.subset(font)
+
+        os.makedirs(self.subset_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.subset_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            subset.save_font(font, tmp_path, options)
+            os.replace(tmp_path, target)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"Subset {os.path.basename(source)}: {stat.st_size} -> {os.path.getsize(target)} bytes")
+        return target
+
+    def warm_up(self):
+        """Build every subset now rather than on the first report that needs it"""
+        for script, styles in self.available.items():
+            for style in styles:
+                self.path(script, style)
+        return len(self._subsets)
+
+    def add_to(self, pdf, scripts, primary):
+        """Register the fonts a document needs and return the primary family name.
+
+        Returns None when the document is Latin-only and no Latin font is
+        installed, in which case the caller falls back to Helvetica.
+        """
+        if not scripts and LATIN not in self.available:
+            return None
+        # Drug names and patient details stay in Latin script, so Indic documents need it too
+        required = scripts | {LATIN}
+        missing = sorted(script for script in required if script not in self.available)
+        if missing:
+            files = [f'{SCRIPT_FONTS[script]}-Regular.ttf' for script in missing]
+            raise FontNotAvailable(f"PDF font not installed for {', '.join(missing)}: "
+                                   f"add {', '.join(files)} to {self.font_dir}")
+
+        primary = primary if primary in required else LATIN
+        families = []
+        for script in [primary] + sorted(required - {primary}):
+            family = self.family(script)
+            for style in self.available[script]:
+                pdf.add_font(family, style=style, fname=self.path(script, style))
+            families.append(family)
+        if len(families) > 1:
+            pdf.set_fallback_fonts(families[1:], exact_match=False)
+        if TEXT_SHAPING:
+            pdf.set_text_shaping(True)
+        return families[0]
+
+
+class PDFRenderer:
+    """Renders report documents to a content-addressed cache directory"""
+
+    def __init__(self, cache_dir, font_dir, max_files=1000):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        os.makedirs(cache_dir, exist_ok=True)
+        self.fonts = FontLibrary(font_dir, os.path.join(cache_dir, 'fonts'))
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "pruned": 0}
+
+    def key(self, document):
+        # Everything drawn (title, headings, labels) or used to pick fonts (language code) is in the document
+        salt = f'v{RENDERER_VERSION}:{self.fonts.signature()}'
+        return content_hash(document, salt)
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.pdf')
+
+    def lookup(self, digest):
+        """Cached PDF path for a digest, or None"""
+        path = self.path_for(digest)
+        try:
+            os.utime(path)  # keeps recently served reports out of the pruning window
+        except FileNotFoundError:
+            return None
+        return path
+
+    def render(self, document):
+        """Return (digest, path, cached) for a document, rendering it on a cache miss.
+
+        document holds title, headings, labels, language, language_code,
+        sections and patient_info as prepared by the API.
+        """
+        digest = self.key(document)
+        path = self.lookup(digest)
+        if path is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return digest, path, True
+
+        data = self._build(document)
+        path = self.path_for(digest)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self.stats["misses"] += 1
+        self._prune()
+        return digest, path, False
+
+    def _build(self, document):
+        title = document['title']
+        labels = document['labels']
+        headings = document['headings']
+        patient_lines = [f"{str(key).replace('_', ' ').title()}: {value}"
+                         for key, value in document['patient_info'].items() if value not in (None, '')]
+        sections = [(headings.get(section, section.title()), text)
+                    for section, text in document['sections'].items() if text]
+
+        texts = [title, labels['patient_information'], labels['generated_on']] + patient_lines
+        texts += [part for section in sections for part in section]
+
+        primary = LANGUAGE_SCRIPTS.get(document.get('language_code'), LATIN)
+        pdf = FPDF(format='A4')
+        pdf.set_auto_page_break(auto=True, margin=15)
+        family = self.fonts.add_to(pdf, scripts_in(texts), primary)
+        if family is None:
+            family, bold = 'Helvetica', 'B'
+            title, labels = latin1(title), {name: latin1(value) for name, value in labels.items()}
+            patient_lines = [latin1(line) for line in patient_lines]
+            sections = [(latin1(heading), latin1(text)) for heading, text in sections]
+        else:
+            primary = primary if primary in self.fonts.available else LATIN
+            bold = 'B' if 'B' in self.fonts.available[primary] else ''
+
+        pdf.set_title(title)
+        pdf.add_page()
+        pdf.set_font(family, bold, 18)
+        pdf.multi_cell(0, 10, title, align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_font(family, '', 9)
+        generated = datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+        pdf.cell(0, 6, f"{labels['generated_on']}: {generated}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.ln(4)
+
+        if patient_lines:
+            self._heading(pdf, family, bold, labels['patient_information'])
+            pdf.set_font(family, '', 11)
+            for line in patient_lines:
+                pdf.multi_cell(0, 6, line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.ln(3)
+
+        for heading, text in sections:
+            self._heading(pdf, family, bold, heading)
+            pdf.set_font(family, '', 11)
+            pdf.multi_cell(0, 6, text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.ln(3)
+
+        return bytes(pdf.output())
+
+    @staticmethod
+    def _heading(pdf, family, bold, text):
+        pdf.set_font(family, bold, 13)
+        pdf.multi_cell(0, 8, text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_draw_color(180, 180, 180)
+        pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y())
+        pdf.ln(2)
+
+    def _prune(self):
+        """Drop the least recently used PDFs beyond max_files (None keeps every PDF)"""
+        if self.max_files is None:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pdf'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except FileNotFoundError:
+                    continue
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            self.stats["pruned"] += excess
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["fonts"] = sorted(self.fonts.available)
+        stats["text_shaping"] = TEXT_SHAPING
+        return stats
+
+
+def stream_file(f, chunk_size=CHUNK_SIZE):
+    """Yield an open file in chunks so the response is sent with chunked transfer, then close it"""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,471 @@
+"""Offline batch pipeline: a JSONL file of consultations -> translations, SMS bodies and PDFs.
+
+    python pipeline.py consultations.jsonl --out-dir followups/ --languages hi-IN,ta-IN
+
+Each input line is one consultation with the fields the API takes:
+
+    {"id": "c-1042", "to": "+9198...", "diagnosis": "...", "medicines": "...",
+     "nutrition": "...", "notes": "...", "message_type": "all",
+     "patient_info": {"name": "..."}, "languages": ["hi-IN"]}
+
+("languages" overrides --languages for that record.) Records stream
+through three stages joined by bounded queues, so memory stays flat
+whatever the size of the input:
+
+    translate  threads running the same glossary, packing and Sarvam code as
+               /api/translate-consultation, at batch priority: a run next to a
+               live server draws on the shared Sarvam budget but leaves its
+               reserved share (OUTBOUND_RESERVE_BATCH) to consultations
+    render     a process pool building SMS bodies and PDFs (the CPU-bound part)
+    write      one line per consultation appended to <out-dir>/results.jsonl
+
+Progress is checkpointed to <out-dir>/checkpoint.json after every
+--checkpoint-every records. Rerunning the same command after a crash or
+Ctrl-C resumes where the checkpoint stopped; --restart starts over. PDFs
+are content-addressed, so re-rendered reports are not written twice.
+
+The translate stage imports app.py, so run from backend/ with the server's
+environment (.env): Sarvam settings are shared with the server and the
+Twilio credentials must be present. Nothing is sent by SMS and the SMS
+outbox is not drained by this process.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from consultation_packing import CONSULTATION_FIELDS, is_translatable
+from consultation_render import build_pdf_document, build_sms_body
+from message_templates import TemplateRegistry
+from pdf_renderer import PDFRenderer
+
+logger = logging.getLogger('pipeline')
+
+CHECKPOINT_FILE = 'checkpoint.json'
+RESULTS_FILE = 'results.jsonl'
+
+# Queue items that are not consultations
+DONE = object()
+
+# Per-process state of the render workers (set by init_render_worker)
+_render = {}
+
+
+def load_app():
+    """Import the web app's translation stack without starting its SMS outbox workers"""
+    os.environ.setdefault("SMS_OUTBOX_DISPATCH", "False")
+    import app
+    return app
+
+
+def init_render_worker(locales_dir, supported_languages, pdf_dir, font_dir, max_segments):
+    """Build the templates and PDF renderer once per render process"""
+    _render['templates'] = TemplateRegistry.load(locales_dir, supported_languages)
+    _render['pdf'] = PDFRenderer(pdf_dir, font_dir, max_files=None) if pdf_dir else None
+    _render['max_segments'] = max_segments
+
+
+def render_record(record, translations):
+    """Runs in a render process: the SMS body and PDF for every language of one consultation"""
+    templates = _render['templates']
+    message_type = record.get('message_type', 'all')
+    results = {}
+    for code, outcome in translations.items():
+        if outcome['status'] != 'success':
+            results[code] = outcome
+            continue
+        fields = outcome['fields']
+        language_name = outcome['language_name']
+        try:
+            # English goes out with the untranslated templates, like /api/send_sms
+            body, details = build_sms_body(templates, message_type, fields['diagnosis'], fields['medicines'],
+                                           fields['nutrition'], fields['notes'],
+                                           None if outcome['untranslated'] else language_name,
+                                           max_segments=_render['max_segments'])
+        except Exception as e:
+            results[code] = {"status": "error", "stage": "sms", "language_name": language_name, "error": str(e)}
+            continue
+        result = {
+            "status": "success",
+            "language_name": language_name,
+            "translated": fields,
+            "sms": {"body": body, "segments": details['segments'], "encoding": details['encoding'],
+                    "compacted": details['compacted']}
+        }
+        if _render['pdf'] is not None:
+            try:
+                document = build_pdf_document(templates, dict(fields, language_name=language_name, language_code=code,
+                                                              patient_info=record.get('patient_info')))
+                digest, path, cached = _render['pdf'].render(document)
+                result["pdf"] = {"id": digest, "path": path, "cached": cached}
+            except Exception as e:
+                # The SMS is still usable without its report
+                result["status"] = "partial"
+                result["pdf"] = {"error": str(e)}
+        results[code] = result
+    return results
+
+
+class CompletionTracker:
+    """Finished input lines: a contiguous high-water mark plus the finished lines beyond it.
+
+    Lines finish out of order, but never further ahead than the stages can
+    hold, so the set beyond the mark stays small.
+    """
+
+    def __init__(self, through=0, after=()):
+        self.through = through
+        self.after = set(after)
+
+    def is_done(self, line):
+        return line <= self.through or line in self.after
+
+    def mark(self, line):
+        self.after.add(line)
+        while self.through + 1 in self.after:
+            self.through += 1
+            self.after.remove(self.through)
+
+
+class Pipeline:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.input_path = os.path.abspath(args.input)
+        self.checkpoint_path = os.path.join(args.out_dir, CHECKPOINT_FILE)
+        self.results_path = os.path.join(args.out_dir, RESULTS_FILE)
+        self.pdf_dir = None if args.no_pdf else (args.pdf_dir or os.path.join(args.out_dir, 'pdf'))
+
+        self.translate_queue = queue.Queue(maxsize=args.queue_size)
+        self.render_queue = queue.Queue(maxsize=args.queue_size)
+        self.write_queue = queue.Queue(maxsize=args.queue_size)
+        # Bounds the consultations submitted to the render pool but not yet written
+        self.render_slots = threading.BoundedSemaphore(args.render_workers * 2)
+        self.stop = threading.Event()
+
+        self.tracker = CompletionTracker()
+        self.stats = {"records": 0, "succeeded": 0, "partial": 0, "failed": 0, "skipped": 0}
+        self.results_bytes = 0
+
+    # Checkpoint
+
+    def load_checkpoint(self):
+        if self.args.restart or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint['input'] != self.input_path:
+            raise SystemExit(f"{self.checkpoint_path} belongs to {checkpoint['input']}; "
+                             f"use another --out-dir or --restart")
+        self.tracker = CompletionTracker(checkpoint['completed_through'], checkpoint['completed_after'])
+        self.stats.update(checkpoint['stats'])
+        self.results_bytes = checkpoint['results_bytes']
+        logger.info(f"Resuming after line {self.tracker.through} ({self.stats['records']} consultation(s) done)")
+
+    def save_checkpoint(self, results):
+        results.flush()
+        os.fsync(results.fileno())
+        checkpoint = {
+            "input": self.input_path,
+            "completed_through": self.tracker.through,
+            "completed_after": sorted(self.tracker.after),
+            "results_bytes": results.tell(),
+            "stats": self.stats,
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Stages
+
+    def _put(self, target, item):
+        """Blocking put that gives up once the run is stopping"""
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self):
+        """Stream input lines that the checkpoint does not cover into the translate stage"""
+        try:
+            with open(self.input_path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if self.tracker.is_done(line_number):
+                        continue
+                    if not line.strip():
+                        item = (line_number, None, None)
+                    else:
+                        try:
+                            record = json.loads(line)
+                            if not isinstance(record, dict):
+                                raise ValueError("expected a JSON object")
+                            item = (line_number, record, None)
+                        except ValueError as e:
+                            item = (line_number, None, f"Invalid JSON: {e}")
+                    target = self.translate_queue if item[1] is not None else self.write_queue
+                    if not self._put(target, item):
+                        return
+        finally:
+            for _ in range(self.args.translate_workers):
+                self._put(self.translate_queue, DONE)
+
+    def translate_language(self, fields, source_lang, target_lang):
+        """Translate one consultation into one language, retrying while Sarvam is busy or failing"""
+        app = self.app
+        active = {name: value for name, value in fields.items() if is_translatable(value)}
+        if target_lang == source_lang or not active:
+            return dict(fields)
+
+        for attempt in range(self.args.max_retries + 1):
+            try:
+                with app.outbound_priority(app.BATCH):
+                    translated, _ = app.translate_consultation_fields(active, source_lang, target_lang)
+                return dict(fields, **translated)
+            except (app.QueueTimeout, app.CircuitOpenError) as e:
+                if attempt == self.args.max_retries:
+                    raise
+                time.sleep(getattr(e, 'retry_after', 1.0))
+            except Exception as e:
+                if attempt == self.args.max_retries or not app.is_upstream_failure(e):
+                    raise
+                time.sleep(self.args.retry_delay * (2 ** attempt))
+
+    def translate_record(self, record):
+        """{language code: translation result} for one consultation; raises ValueError for a malformed record"""
+        app = self.app
+        source_lang = record.get('sourceLang', self.args.source_lang)
+        languages = record.get('languages') or self.args.languages
+        if not isinstance(source_lang, str):
+            raise ValueError("sourceLang must be a language code")
+        if not isinstance(languages, list) or not all(isinstance(code, str) for code in languages):
+            raise ValueError("languages must be a list of language codes")
+        fields = {name: record.get(name, '') or '' for name in CONSULTATION_FIELDS}
+        if not all(isinstance(value, str) for value in fields.values()):
+            raise ValueError(f"{', '.join(CONSULTATION_FIELDS)} must be strings")
+
+        translations = {}
+        for code in list(dict.fromkeys(languages)):
+            language_name = app.SUPPORTED_LANGUAGES.get(code.split('-')[0], {}).get('name', code)
+            if code not in self.supported_codes:
+                translations[code] = {"status": "error", "stage": "translate", "language_name": language_name,
+                                      "error": f"Unsupported language: {code}"}
+                continue
+            try:
+                translations[code] = {
+                    "status": "success",
+                    "language_name": language_name,
+                    "untranslated": code == source_lang,
+                    "fields": self.translate_language(fields, source_lang, code)
+                }
+            except Exception as e:
+                error = f"API returned {e.status_code}" if isinstance(e, app.SarvamAPIError) else str(e)
+                translations[code] = {"status": "error", "stage": "translate", "language_name": language_name,
+                                      "error": error}
+        return translations
+
+    def translate(self):
+        # DONE is always handed on, or dispatch and write would wait for this worker forever
+        try:
+            while True:
+                item = self.translate_queue.get()
+                if item is DONE:
+                    return
+                line_number, record, _ = item
+                try:
+                    translations = self.translate_record(record)
+                except Exception as e:
+                    logger.error(f"Line {line_number}: translation failed: {e}")
+                    if not self._put(self.write_queue, (line_number, record, None, f"Translation failed: {e}")):
+                        return
+                    continue
+                if not self._put(self.render_queue, (line_number, record, translations)):
+                    return
+        finally:
+            self._put(self.render_queue, DONE)
+
+    def dispatch(self, pool):
+        """Feed translated consultations to the render pool, at most render_workers * 2 at a time"""
+        finished = 0
+        while finished < self.args.translate_workers:
+            item = self.render_queue.get()
+            if item is DONE:
+                finished += 1
+                continue
+            line_number, record, translations = item
+            while not self.render_slots.acquire(timeout=0.5):
+                if self.stop.is_set():
+                    return
+            future = pool.submit(render_record, record, translations)
+            future.add_done_callback(lambda future, line_number=line_number, record=record:
+                                     self._rendered(future, line_number, record))
+        # Every slot back means every submitted consultation has been handed to the writer
+        for _ in range(self.args.render_workers * 2):
+            self.render_slots.acquire()
+        self._put(self.write_queue, DONE)
+
+    def _rendered(self, future, line_number, record):
+        try:
+            languages = future.result()
+            error = None
+        except Exception as e:
+            languages, error = None, f"Render failed: {e}"
+        self._put(self.write_queue, (line_number, record, languages, error))
+        self.render_slots.release()
+
+    def write(self, results):
+        """Append results and checkpoint; runs on the main thread until every stage is finished"""
+        since_checkpoint = 0
+        started = time.monotonic()
+        while True:
+            item = self.write_queue.get()
+            if item is DONE:
+                break
+            if len(item) == 3:
+                # Blank or unparseable input line, straight from the reader
+                line_number, _, error = item
+                if error is None:
+                    self.stats["skipped"] += 1
+                    self.tracker.mark(line_number)
+                    continue
+                record, languages = {}, None
+            else:
+                line_number, record, languages, error = item
+
+            statuses = [result['status'] for result in (languages or {}).values()]
+            if error is None and statuses and all(status == 'success' for status in statuses):
+                status = 'success'
+                self.stats["succeeded"] += 1
+            elif error is None and set(statuses) & {'success', 'partial'}:
+                status = 'partial'
+                self.stats["partial"] += 1
+            else:
+                status = 'error'
+                self.stats["failed"] += 1
+                error = error or "No language could be processed"
+
+            result = {"line": line_number, "id": record.get('id'), "to": record.get('to'), "status": status,
+                      "languages": languages or {}}
+            if error and status == 'error':
+                result["error"] = error
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.stats["records"] += 1
+            self.tracker.mark(line_number)
+
+            since_checkpoint += 1
+            if since_checkpoint >= self.args.checkpoint_every:
+                self.save_checkpoint(results)
+                since_checkpoint = 0
+                rate = self.stats["records"] / max(time.monotonic() - started, 1e-9)
+                logger.info(f"{self.stats['records']} consultation(s) written through line {self.tracker.through} "
+                            f"({rate:.1f}/s this run)")
+        self.save_checkpoint(results)
+
+    def run(self):
+        os.makedirs(self.args.out_dir, exist_ok=True)
+        self.load_checkpoint()
+        self.supported_codes = {language['code'] for language in self.app.SUPPORTED_LANGUAGES.values()}
+
+        # Results written after the last checkpoint belong to lines that will be processed again
+        mode = 'r+b' if self.results_bytes and os.path.exists(self.results_path) else 'wb'
+        with open(self.results_path, mode) as raw:
+            raw.truncate(self.results_bytes if mode == 'r+b' else 0)
+            raw.seek(0, os.SEEK_END)
+            results = _TextAppender(raw)
+
+            app = self.app
+            pool = ProcessPoolExecutor(
+                max_workers=self.args.render_workers,
+                # spawn: the parent already runs the app's threads, which fork would copy mid-flight
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_render_worker,
+                initargs=(app.LOCALES_DIR, app.SUPPORTED_LANGUAGES, self.pdf_dir, app.PDF_FONT_DIR,
+                          app.SMS_MAX_SEGMENTS)
+            )
+            threads = [threading.Thread(target=self.read, name='pipeline-read', daemon=True)]
+            threads += [threading.Thread(target=self.translate, name=f'pipeline-translate-{i}', daemon=True)
+                        for i in range(self.args.translate_workers)]
+            threads.append(threading.Thread(target=self.dispatch, args=(pool,), name='pipeline-render', daemon=True))
+            for thread in threads:
+                thread.start()
+
+            try:
+                self.write(results)
+            except KeyboardInterrupt:
+                self.stop.set()
+                self.save_checkpoint(results)
+                logger.warning(f"Interrupted; checkpoint saved through line {self.tracker.through}")
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown(wait=True)
+        return dict(self.stats, completed_through=self.tracker.through)
+
+
+class _TextAppender:
+    """Binary results file that accepts str lines (utf-8), so offsets from tell() are exact bytes"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def write(self, text):
+        self.raw.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.raw.flush()
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def tell(self):
+        return self.raw.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate, render SMS and render PDFs for a JSONL file of consultations")
+    parser.add_argument('input', help="JSONL file, one consultation per line")
+    parser.add_argument('--out-dir', required=True, help="results.jsonl, checkpoint.json and pdf/ are written here")
+    parser.add_argument('--languages', default='hi-IN',
+                        help="comma-separated target languages for records without 'languages' (default hi-IN)")
+    parser.add_argument('--source-lang', default='en-IN', help="source language for records without 'sourceLang'")
+    parser.add_argument('--translate-workers', type=int, default=4, help="concurrent consultations in translation")
+    parser.add_argument('--render-workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="render processes (default: CPUs - 1)")
+    parser.add_argument('--queue-size', type=int, default=32, help="capacity of each queue between stages")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="records between checkpoints")
+    parser.add_argument('--max-retries', type=int, default=3, help="retries of a language when Sarvam is busy or failing")
+    parser.add_argument('--retry-delay', type=float, default=2.0, help="first retry delay in seconds (doubles)")
+    parser.add_argument('--pdf-dir', help="where PDFs are written (default <out-dir>/pdf)")
+    parser.add_argument('--no-pdf', action='store_true', help="skip PDF rendering")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    args = parser.parse_args()
+    args.languages = [code.strip() for code in args.languages.split(',') if code.strip()]
+
+    app = load_app()
+    if not app.SARVAM_API_KEY:
+        logger.warning("SARVAM_API_KEY is not set; every non-source language will fail to translate")
+
+    started = time.monotonic()
+    try:
+        summary = Pipeline(app, args).run()
+    except KeyboardInterrupt:
+        return 130
+    summary["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Token buckets used to pace outbound upstream calls.
+
+TokenBucket keeps its level in memory, so it paces one process.
+SharedTokenBucket keeps the level in a SQLite file (WAL mode), so every
+worker process on the host draws from one budget and the configured rate
+is the rate of the whole deployment rather than of each worker.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1, reserve=0.0):
+        """Take tokens if available right now; return the wait needed otherwise (0 on success).
+
+        reserve tokens are left in the bucket: the caller only succeeds while
+        the level stays at or above it afterwards.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            if self._tokens >= tokens + reserve:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens + reserve - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available. Returns False if timeout expires first."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait > remaining:
+                    return False
+            time.sleep(wait)
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            return self._tokens
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose level is stored in SQLite and shared by every process that opens the same file"""
+
+    def __init__(self, db_path, name, rate, capacity=None):
+        super().__init__(rate, capacity)
+        self.db_path = db_path
+        self.name = name
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS token_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # (level, wall-clock time) as this process last saw it, for reporting without a transaction
+        self._seen = (self.capacity, time.time())
+
+    def _take(self, tokens, reserve=0.0):
+        """Refill from the stored level and take tokens if there are enough; returns (level, wait)"""
+        # Wall-clock time: the monotonic clocks of different processes are not comparable
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT tokens, updated_at FROM token_buckets WHERE name = ?",
+                                       (self.name,)).fetchone()
+                level = self.capacity if row is None else min(
+                    self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+                wait = 0.0 if level >= tokens + reserve else (tokens + reserve - level) / self.rate
+                if wait == 0.0:
+                    level -= tokens
+                self._db.execute(
+                    "INSERT INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (self.name, level, now)
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._seen = (level, now)
+        return level, wait
+
+    def try_acquire(self, tokens=1, reserve=0.0):
+        try:
+            return self._take(tokens, reserve)[1]
+        except sqlite3.Error as e:
+            # Pacing this process alone beats failing the call
+            logger.warning(f"Shared token bucket {self.name} unavailable, pacing locally: {e}")
+            return super().try_acquire(tokens, reserve)
+
+    @property
+    def available(self):
+        """The shared level as of this process's last acquire, refilled to now.
+
+        An estimate (other processes may have drawn since), read from memory
+        so that health checks never queue behind or take the write lock.
+        """
+        level, seen_at = self._seen
+        return min(self.capacity, level + max(0.0, time.time() - seen_at) * self.rate)
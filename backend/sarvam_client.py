@@ -0,0 +1,330 @@
+"""Pooled keep-alive HTTP client for the Sarvam AI API.
+
+One HTTPAdapter (and therefore one urllib3 connection pool) is shared by
+every thread, so TCP and TLS handshakes are paid once per connection rather
+than once per translation. Each thread gets its own requests.Session mounted
+on that adapter, which keeps per-session state out of shared memory.
+
+AsyncSarvamClient is the asyncio counterpart used by the ASGI server: one
+aiohttp session per event loop, with the same retry and backoff policy.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import SARVAM_IN_FLIGHT, SARVAM_REQUESTS, SARVAM_RETRIES, TIMEOUTS
+
+try:
+    import aiohttp
+except ImportError:  # only needed by the ASGI server
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class SarvamAPIError(Exception):
+    """Raised when the Sarvam API answers with a non-200 status"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Sarvam API error: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def parse_retry_after(value):
+    """Return the Retry-After delay in seconds, or None if absent/invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def build_payload(text, source_lang, target_lang, model):
+    return {
+        "input": text,
+        "source_language_code": source_lang,
+        "target_language_code": target_lang,
+        "model": model
+    }
+
+
+class _RetryPolicy:
+    """Retry/backoff settings shared by the sync and async clients"""
+
+    def __init__(self, api_key, base_url, max_retries, backoff_base, backoff_max, retry_after_max):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.translate_url = f"{self.base_url}/translate"
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+
+    @property
+    def headers(self):
+        return {
+            "api-subscription-key": self.api_key or "",
+            "Content-Type": "application/json"
+        }
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from synchronizing
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _fits(delay, deadline):
+        # Only retry when the backoff still leaves time for the next attempt
+        return delay < deadline - time.monotonic()
+
+    @staticmethod
+    def _retry_abandoned(error, deadline):
+        """Log why a retry is not made after its token wait; True when it is abandoned"""
+        if error is not None:
+            logger.warning(f"Sarvam retry abandoned, no outbound token: {error}")
+            return True
+        return deadline - time.monotonic() <= 0
+
+    def _retry_delay(self, status_code, headers, attempt):
+        """Seconds to wait before retrying a retryable status, or None to give up"""
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after is None:
+            return self._backoff(attempt)
+        if retry_after > self.retry_after_max:
+            # Waiting that long would exceed any reasonable client deadline
+            return None
+        return retry_after
+
+
+class SarvamClient(_RetryPolicy):
+    """Thread-safe Sarvam client with connection pooling and retry/backoff"""
+
+    def __init__(self, api_key, base_url="https://api.sarvam.ai", pool_connections=4,
+                 pool_maxsize=16, max_retries=2, backoff_base=0.25, backoff_max=4.0,
+                 retry_after_max=10.0):
+        super().__init__(api_key, base_url, max_retries, backoff_base, backoff_max, retry_after_max)
+
+        self._adapter = HTTPAdapter(pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize, max_retries=0)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def post_translate(self, payload, timeout=30, max_retries=None, acquire=None):
+        """POST a translate payload, retrying 429/5xx and connection errors.
+
+        timeout covers the whole call, backoff and retries included: each
+        attempt gets what is left of it, and no retry is made once the
+        backoff would not leave time for another attempt. acquire, when
+        given, is called before every retry to take an outbound token, and
+        the retry is given up if it raises. Returns the final
+        requests.Response (which may still be an error status once retries
+        are exhausted). Read timeouts are not retried, since the request may
+        already be in progress upstream.
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        target = payload.get('target_language_code', 'unknown')
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            failure = None
+            SARVAM_IN_FLIGHT.inc()
+            try:
+                response = self.session.post(self.translate_url, json=payload,
+                                             timeout=max(deadline - time.monotonic(), 0.001))
+            except requests.exceptions.ConnectionError as e:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, 'connection_error')
+                if attempt >= retries:
+                    raise
+                delay = self._backoff(attempt)
+                if not self._fits(delay, deadline):
+                    raise
+                failure = e
+                SARVAM_RETRIES.inc(target, 'connection_error')
+                logger.warning(f"Sarvam connection error ({e}); retrying in {delay:.2f}s")
+            except requests.exceptions.Timeout:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, 'timeout')
+                TIMEOUTS.inc('sarvam')
+                raise
+            else:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, str(response.status_code))
+                if response.status_code not in RETRYABLE_STATUSES or attempt >= retries:
+                    return response
+                delay = self._retry_delay(response.status_code, response.headers, attempt)
+                if delay is None or not self._fits(delay, deadline):
+                    return response
+                SARVAM_RETRIES.inc(target, str(response.status_code))
+                logger.warning(f"Sarvam returned {response.status_code}; retrying in {delay:.2f}s")
+                # Reading the body releases the connection and keeps it for a retry that is given up
+                response.content
+            finally:
+                SARVAM_IN_FLIGHT.dec()
+
+            attempt += 1
+            time.sleep(delay)
+            if acquire is not None:
+                try:
+                    acquire()
+                    error = None
+                except Exception as e:
+                    error = e
+                if self._retry_abandoned(error, deadline):
+                    if failure is not None:
+                        raise failure
+                    return response
+
+    def translate(self, text, source_lang, target_lang, model, timeout=30, acquire=None):
+        """Request a translation and return the raw response"""
+        return self.post_translate(build_payload(text, source_lang, target_lang, model), timeout=timeout,
+                                   acquire=acquire)
+
+    def warm_up(self, connections=1, timeout=3):
+        """Open keep-alive connections to the API ahead of the first translation.
+
+        Returns the number of connections opened; failures are logged, not raised.
+        """
+        def connect(_):
+            try:
+                self.session.head(self.base_url, timeout=timeout).close()
+                return True
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Sarvam warm-up failed: {e}")
+                return False
+
+        # Concurrent requests are needed to open more than one pooled connection
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='sarvam-warm-up') as executor:
+            return sum(executor.map(connect, range(connections)))
+
+
+class SarvamResponse:
+    """A fully read upstream response with the parts of requests.Response the routes use"""
+
+    __slots__ = ('status_code', 'text', 'headers')
+
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncSarvamClient(_RetryPolicy):
+    """asyncio Sarvam client: one pooled aiohttp session, same retry/backoff as SarvamClient"""
+
+    def __init__(self, api_key, base_url="https://api.sarvam.ai", limit=256, max_retries=2,
+                 backoff_base=0.25, backoff_max=4.0, retry_after_max=10.0):
+        super().__init__(api_key, base_url, max_retries, backoff_base, backoff_max, retry_after_max)
+        self.limit = limit
+        self._session = None
+
+    async def start(self):
+        """Open the session; must be called from the event loop that will use it"""
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for the async Sarvam client")
+        connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=30)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def post_translate(self, payload, timeout=30, max_retries=None, acquire=None):
+        """POST a translate payload, retrying 429/5xx and connection errors.
+
+        timeout covers the whole call, retries included, and acquire (a
+        coroutine function) is awaited before every retry, as in
+        SarvamClient.post_translate. Returns the final SarvamResponse. Read
+        timeouts raise asyncio.TimeoutError and are not retried.
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        target = payload.get('target_language_code', 'unknown')
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            failure = None
+            SARVAM_IN_FLIGHT.inc()
+            try:
+                attempt_timeout = aiohttp.ClientTimeout(total=max(deadline - time.monotonic(), 0.001))
+                async with self._session.post(self.translate_url, json=payload,
+                                              timeout=attempt_timeout) as response:
+                    result = SarvamResponse(response.status, await response.text(), response.headers)
+            except asyncio.TimeoutError as e:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, 'timeout')
+                TIMEOUTS.inc('sarvam')
+                # Connect timeouts never reached upstream, so they are safe to retry
+                if not isinstance(e, aiohttp.ConnectionTimeoutError) or attempt >= retries:
+                    raise
+                delay = self._backoff(attempt)
+                if not self._fits(delay, deadline):
+                    raise
+                failure = e
+                SARVAM_RETRIES.inc(target, 'timeout')
+                logger.warning(f"Sarvam connect timeout; retrying in {delay:.2f}s")
+            except aiohttp.ClientConnectionError as e:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, 'connection_error')
+                if attempt >= retries:
+                    raise
+                delay = self._backoff(attempt)
+                if not self._fits(delay, deadline):
+                    raise
+                failure = e
+                SARVAM_RETRIES.inc(target, 'connection_error')
+                logger.warning(f"Sarvam connection error ({e}); retrying in {delay:.2f}s")
+            else:
+                SARVAM_REQUESTS.observe(time.perf_counter() - start, target, str(result.status_code))
+                if result.status_code not in RETRYABLE_STATUSES or attempt >= retries:
+                    return result
+                delay = self._retry_delay(result.status_code, result.headers, attempt)
+                if delay is None or not self._fits(delay, deadline):
+                    return result
+                SARVAM_RETRIES.inc(target, str(result.status_code))
+                logger.warning(f"Sarvam returned {result.status_code}; retrying in {delay:.2f}s")
+            finally:
+                SARVAM_IN_FLIGHT.dec()
+
+            attempt += 1
+            await asyncio.sleep(delay)
+            if acquire is not None:
+                try:
+                    await acquire()
+                    error = None
+                except Exception as e:
+                    error = e
+                if self._retry_abandoned(error, deadline):
+                    if failure is not None:
+                        raise failure
+                    return result
+
+    async def translate(self, text, source_lang, target_lang, model, timeout=30, acquire=None):
+        """Request a translation and return the SarvamResponse"""
+        return await self.post_translate(build_payload(text, source_lang, target_lang, model), timeout=timeout,
+                                         acquire=acquire)
@@ -0,0 +1,187 @@
+"""Coalesce identical concurrent calls so only one is in flight per key.
+
+The first caller for a key (the leader) runs the function; callers that
+arrive while it is running wait for the leader and receive its result or
+re-raise its exception. If the leader goes away without an outcome
+(interrupted or cancelled), waiters run the call again themselves. A
+waiter gives up with FlightTimeout once its own timeout runs out.
+AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+import asyncio
+import threading
+import time
+
+# Outcome of a flight whose leader exited without a result or an exception
+_RETRY = object()
+
+
+class FlightTimeout(TimeoutError):
+    """Raised to a waiter whose timeout ran out before the leader finished"""
+
+    def __init__(self, seconds):
+        super().__init__(f"Timed out after {seconds:g}s waiting for an identical call")
+        self.seconds = seconds
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _RETRY
+        self.error = None
+        self.waiters = 0
+
+
+def _new_stats():
+    # Every call ends as exactly one of: leader, coalesced (got a leader's outcome) or timeouts
+    return {
+        "calls": 0,
+        "leaders": 0,
+        "coalesced": 0,
+        "timeouts": 0,
+        "errors": 0,
+        "max_waiters": 0,
+    }
+
+
+def _finish_snapshot(stats):
+    stats["coalesce_rate"] = round(stats["coalesced"] / stats["calls"], 4) if stats["calls"] else 0.0
+    return stats
+
+
+class SingleFlight:
+    """Per-key call coalescing across threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = _new_stats()
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() unless an identical call is already running, then share its outcome.
+
+        timeout bounds how long this caller waits for someone else's call;
+        a call it leads itself is bounded by fn.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self.stats["calls"] += 1
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    self.stats["leaders"] += 1
+                    break
+                flight.waiters += 1
+                if flight.waiters > self.stats["max_waiters"]:
+                    self.stats["max_waiters"] = flight.waiters
+
+            try:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                done = flight.done.wait(remaining)
+            finally:
+                with self._lock:
+                    flight.waiters -= 1
+            if not done:
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise FlightTimeout(timeout)
+            if flight.error is None and flight.result is _RETRY:
+                continue
+            with self._lock:
+                self.stats["coalesced"] += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        # Whatever happens in fn, waiters are released: with its result, its
+        # exception, or _RETRY when it was interrupted by a BaseException
+        try:
+            result = fn()
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def snapshot(self):
+        """Return counters plus the current in-flight and waiter counts"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._flights)
+            stats["waiting"] = sum(flight.waiters for flight in self._flights.values())
+        return _finish_snapshot(stats)
+
+
+class AsyncSingleFlight:
+    """Per-key coroutine coalescing on a single event loop"""
+
+    def __init__(self):
+        self._flights = {}    # key -> [future, waiters]
+        self.stats = _new_stats()
+
+    async def do(self, key, fn, timeout=None):
+        """Await fn() unless an identical call is already running, then share its outcome.
+
+        timeout bounds how long this caller waits for someone else's call.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        self.stats["calls"] += 1
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            flight[1] += 1
+            self.stats["max_waiters"] = max(self.stats["max_waiters"], flight[1])
+            # asyncio.wait never cancels the future, so neither a cancelled nor a
+            # timed-out waiter cancels the leader's call
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                done, _ = await asyncio.wait((flight[0],), timeout=remaining)
+            finally:
+                flight[1] -= 1
+            if not done:
+                self.stats["timeouts"] += 1
+                raise FlightTimeout(timeout)
+            if flight[0].exception() is not None:
+                self.stats["coalesced"] += 1
+                raise flight[0].exception()
+            result = flight[0].result()
+            if result is not _RETRY:
+                self.stats["coalesced"] += 1
+                return result
+
+        future = loop.create_future()
+        self._flights[key] = [future, 0]
+        self.stats["leaders"] += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # Mark the exception retrieved so an unawaited future does not log it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+            if not future.done():
+                # Cancelled: waiters make the call themselves instead of inheriting the cancellation
+                future.set_result(_RETRY)
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._flights)
+        stats["waiting"] = sum(flight[1] for flight in self._flights.values())
+        return _finish_snapshot(stats)
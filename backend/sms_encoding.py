@@ -0,0 +1,185 @@
+"""SMS encoding detection, exact segment counting and segment-budget compaction.
+
+A message that contains only GSM 03.38 characters is sent as GSM-7: 160
+septets in a single segment, 153 per segment once concatenated, with the
+extension characters costing two septets each. Anything else (Devanagari,
+Tamil, Telugu, emoji, ...) forces UCS-2: 70 UTF-16 code units in a single
+segment, 67 per concatenated segment.
+"""
+import unicodedata
+
+GSM7 = 'GSM-7'
+UCS2 = 'UCS-2'
+
+# Twilio rejects bodies longer than this regardless of encoding
+MAX_BODY_CHARS = 1600
+
+ELLIPSIS = '...'
+
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = frozenset("^{}\\[~]|€\f")
+
+SEGMENT_LIMITS = {
+    GSM7: (160, 153),
+    UCS2: (70, 67),
+}
+
+# Characters that glue the following consonant into the same Indic cluster
+_VIRAMAS = frozenset(
+    "\u094d\u09cd\u0a4d\u0acd\u0b4d\u0bcd\u0c4d\u0ccd\u0d4d"
+)
+_JOINERS = frozenset("\u200c\u200d")
+
+
+def detect_encoding(text):
+    """Return GSM7 if every character is in the GSM 03.38 alphabet, else UCS2"""
+    for char in text:
+        if char not in GSM7_BASIC and char not in GSM7_EXTENDED:
+            return UCS2
+    return GSM7
+
+
+def _unit_costs(text, encoding):
+    """Cost of each character in septets (GSM-7) or UTF-16 code units (UCS-2)"""
+    if encoding == GSM7:
+        return [2 if char in GSM7_EXTENDED else 1 for char in text]
+    return [2 if ord(char) > 0xFFFF else 1 for char in text]
+
+
+def count_segments(text, encoding=None):
+    """Return the exact number of SMS segments needed for text"""
+    if not text:
+        return 0
+    encoding = encoding or detect_encoding(text)
+    single, multi = SEGMENT_LIMITS[encoding]
+    costs = _unit_costs(text, encoding)
+    if sum(costs) <= single:
+        return 1
+
+    # Escape sequences and surrogate pairs are never split across segments
+    segments, used = 1, 0
+    for cost in costs:
+        if used + cost > multi:
+            segments += 1
+            used = 0
+        used += cost
+    return segments
+
+
+def describe(text):
+    """Return encoding, segment and length details for an SMS body"""
+    encoding = detect_encoding(text)
+    return {
+        "encoding": encoding,
+        "segments": count_segments(text, encoding),
+        "characters": len(text),
+    }
+
+
+def graphemes(text):
+    """Split text into user-perceived characters.
+
+    Approximates extended grapheme clusters: combining marks, joiners and
+    variation selectors attach to the previous cluster, and a consonant
+    after a virama stays in the same Indic conjunct.
+    """
+    clusters = []
+    for char in text:
+        if clusters:
+            previous = clusters[-1][-1]
+            if (unicodedata.category(char).startswith('M') or char in _JOINERS or
+                    '\ufe00' <= char <= '\ufe0f' or previous in _VIRAMAS or previous == '\u200d'):
+                clusters[-1] += char
+                continue
+        clusters.append(char)
+    return clusters
+
+
+def truncate_text(text, limit, ellipsis=ELLIPSIS):
+    """Shorten text to at most `limit` graphemes, preferring a word boundary"""
+    clusters = graphemes(text)
+    if len(clusters) <= limit:
+        return text
+    keep = max(0, limit - len(ellipsis))
+    cut = ''.join(clusters[:keep])
+    # Back up to the last whitespace unless that would discard most of the text
+    boundary = cut.rstrip().rfind(' ')
+    if boundary >= len(cut) // 2:
+        cut = cut[:boundary]
+    return cut.rstrip(' ,;:-') + ellipsis
+
+
+def _fits(text, max_segments):
+    return len(text) <= MAX_BODY_CHARS and count_segments(text) <= max_segments
+
+
+def fit_to_segments(render, fields, max_segments, shorten_fields=(), optional_fields=()):
+    """Render a message that fits within max_segments.
+
+    render(**fields) builds the message. When it is too long, each field in
+    shorten_fields is trimmed at word/grapheme boundaries to the longest
+    prefix that fits, then each field in optional_fields is dropped, and as a
+    last resort the rendered body itself is cut at a grapheme boundary.
+    Returns (body, details) where details includes the encoding, segment
+    count and which steps were applied.
+    """
+    fields = dict(fields)
+    body = render(**fields)
+    compacted = []
+
+    for name in shorten_fields:
+        if _fits(body, max_segments):
+            break
+        value = fields.get(name) or ''
+        if not value or value == 'Not specified':
+            continue
+        # Longest grapheme prefix of this field that still fits
+        lo, hi = 0, len(graphemes(value))
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            candidate = render(**dict(fields, **{name: truncate_text(value, mid)}))
+            if _fits(candidate, max_segments):
+                best = mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        if best:
+            fields[name] = truncate_text(value, best)
+            body = render(**fields)
+            compacted.append(f"shortened:{name}")
+
+    for name in optional_fields:
+        if _fits(body, max_segments):
+            break
+        if fields.get(name):
+            fields[name] = ''
+            body = render(**fields)
+            compacted.append(f"dropped:{name}")
+
+    if not _fits(body, max_segments):
+        encoding = detect_encoding(body)
+        single, multi = SEGMENT_LIMITS[encoding]
+        budget = single if max_segments <= 1 else multi * max_segments
+        limit = min(MAX_BODY_CHARS, budget)
+        clusters = graphemes(body)
+        lo, hi = 0, min(len(clusters), limit)
+        best = 0
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if _fits(''.join(clusters[:mid]) + ELLIPSIS, max_segments):
+                best = mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        body = truncate_text(body, best + len(ELLIPSIS))
+        compacted.append("truncated")
+
+    details = describe(body)
+    details["max_segments"] = max_segments
+    details["compacted"] = compacted
+    return body, details
+
@@ -0,0 +1,254 @@
+"""Durable SMS outbox drained by background dispatch workers.
+
+Jobs are persisted in a SQLite file (WAL mode) before the API answers, so a
+restart never loses a queued message. Workers claim jobs with a lease; a job
+whose worker died is re-claimed once the lease expires, which makes delivery
+at-least-once. Idempotency keys map repeated POSTs onto the existing job.
+
+Leases of jobs still being sent are renewed in the background, so a send
+that is slow (or waiting for its rate-limit token) is never re-claimed by
+another worker while it runs. Every claim carries a lease token, and a
+worker only records the outcome of a job whose lease it still holds.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+
+class PermanentSendError(Exception):
+    """Raised by a send function when retrying cannot succeed"""
+
+
+class RetryLater(Exception):
+    """Raised by a send function when the job must not be attempted yet; it is requeued without using an attempt"""
+
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
+
+
+class SMSOutbox:
+    """SQLite-backed job queue with a pool of dispatch threads"""
+
+    def __init__(self, db_path, send_fn, workers=2, lease_seconds=60, max_attempts=5,
+                 poll_interval=1.0, retry_delay=5.0):
+        self.db_path = db_path
+        self.send_fn = send_fn
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        # job_id -> lease token of the jobs this process is sending
+        self._active = {}
+        self._keeper = None
+        self._keeper_stop = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sms_jobs (
+                job_id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                to_number TEXT NOT NULL,
+                body TEXT NOT NULL,
+                message_type TEXT,
+                language TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                message_sid TEXT,
+                error TEXT,
+                available_at REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        columns = {row['name'] for row in self._db.execute("PRAGMA table_info(sms_jobs)")}
+        if 'lease_token' not in columns:
+            # Outboxes created before leases were tokened
+            self._db.execute("ALTER TABLE sms_jobs ADD COLUMN lease_token TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_sms_jobs_ready ON sms_jobs (status, available_at)")
+
+    def enqueue(self, to_number, body, message_type=None, language=None, idempotency_key=None):
+        """Persist a job and return (job, created). Duplicate keys return the existing job."""
+        now = datetime.utcnow().isoformat()
+        job_id = uuid.uuid4().hex
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO sms_jobs (job_id, idempotency_key, to_number, body, message_type, language, "
+                    "status, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, idempotency_key, to_number, body, message_type, language,
+                     STATUS_QUEUED, time.time(), now, now)
+                )
+        except sqlite3.IntegrityError:
+            # Another request (possibly in another worker process) used this key first
+            with self._lock:
+                existing = self._db.execute(
+                    "SELECT * FROM sms_jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+            return dict(existing), False
+        self._wakeup.set()
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        """Return a job as a dict, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sms_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self):
+        """Lease the next ready job, including jobs whose lease expired"""
+        now = time.time()
+        lease_token = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM sms_jobs WHERE status IN (?, ?) AND available_at <= ? "
+                    "ORDER BY available_at LIMIT 1",
+                    (STATUS_QUEUED, STATUS_SENDING, now)
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE sms_jobs SET status = ?, attempts = attempts + 1, available_at = ?, lease_token = ?, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (STATUS_SENDING, now + self.lease_seconds, lease_token, datetime.utcnow().isoformat(),
+                     row['job_id'])
+                )
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+            self._active[row['job_id']] = lease_token
+        job = dict(row)
+        job['attempts'] += 1
+        job['lease_token'] = lease_token
+        return job
+
+    def _finish(self, job, status, message_sid=None, error=None, available_at=None, refund_attempt=False):
+        """Record a job's outcome if this worker still holds its lease; returns whether it did"""
+        with self._lock:
+            self._active.pop(job['job_id'], None)
+            updated = self._db.execute(
+                "UPDATE sms_jobs SET status = ?, message_sid = COALESCE(?, message_sid), error = ?, "
+                "available_at = COALESCE(?, available_at), attempts = attempts - ?, lease_token = NULL, "
+                "updated_at = ? WHERE job_id = ? AND lease_token = ?",
+                (status, message_sid, error, available_at, int(refund_attempt), datetime.utcnow().isoformat(),
+                 job['job_id'], job['lease_token'])
+            ).rowcount
+        if not updated:
+            logger.warning(f"SMS job {job['job_id']} lost its lease before finishing; "
+                           f"its {status} outcome was not recorded")
+        return bool(updated)
+
+    def renew_leases(self):
+        """Push back the lease expiry of every job this process is still sending"""
+        with self._lock:
+            if not self._active:
+                return 0
+            available_at = time.time() + self.lease_seconds
+            return self._db.executemany(
+                "UPDATE sms_jobs SET available_at = ? WHERE job_id = ? AND lease_token = ? AND status = ?",
+                [(available_at, job_id, lease_token, STATUS_SENDING) for job_id, lease_token in self._active.items()]
+            ).rowcount
+
+    def _keep_leases(self):
+        # Renew well before expiry so a slow commit or a busy database cannot let a lease lapse
+        while not self._keeper_stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew_leases()
+            except sqlite3.Error as e:
+                logger.error(f"SMS outbox lease renewal failed: {e}")
+
+    def _dispatch(self, job):
+        try:
+            message_sid = self.send_fn(job)
+        except PermanentSendError as e:
+            logger.error(f"SMS job {job['job_id']} failed permanently: {e}")
+            self._finish(job, STATUS_FAILED, error=str(e))
+            return
+        except RetryLater as e:
+            logger.info(f"SMS job {job['job_id']} deferred for {e.delay:.0f}s: {e}")
+            self._finish(job, STATUS_QUEUED, error=str(e), available_at=time.time() + e.delay,
+                         refund_attempt=True)
+            return
+        except Exception as e:
+            if job['attempts'] >= self.max_attempts:
+                logger.error(f"SMS job {job['job_id']} failed after {job['attempts']} attempts: {e}")
+                self._finish(job, STATUS_FAILED, error=str(e))
+            else:
+                delay = self.retry_delay * (2 ** (job['attempts'] - 1))
+                logger.warning(f"SMS job {job['job_id']} attempt {job['attempts']} failed, retrying in {delay}s: {e}")
+                self._finish(job, STATUS_QUEUED, error=str(e), available_at=time.time() + delay)
+            return
+        logger.info(f"SMS job {job['job_id']} sent to {job['to_number']}. Message SID: {message_sid}")
+        self._finish(job, STATUS_SENT, message_sid=message_sid)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"SMS outbox claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._dispatch(job)
+
+    def start(self):
+        """Start the dispatch workers"""
+        if self._threads:
+            return
+        self._stop.clear()
+        self._keeper_stop.clear()
+        self._keeper = threading.Thread(target=self._keep_leases, name="sms-outbox-leases", daemon=True)
+        self._keeper.start()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"sms-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"SMS outbox started with {self.workers} dispatch workers")
+
+    def stop(self, timeout=None):
+        """Stop the workers after their current job"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        # Leases are renewed until the last send has finished
+        self._keeper_stop.set()
+        if self._keeper:
+            self._keeper.join(timeout)
+            self._keeper = None
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM sms_jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_SENDING)
+            ).fetchone()[0]
@@ -0,0 +1,8 @@
+"""Tests import the backend's flat modules, so run them from anywhere with:
+
+    python -m pytest backend/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
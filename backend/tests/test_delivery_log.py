@@ -0,0 +1,68 @@
+from delivery_log import STATUS_ERROR, STATUS_PENDING, DeliveryLog
+
+
+def make_log(tmp_path, **kwargs):
+    return DeliveryLog(str(tmp_path / 'deliveries.db'), **kwargs)
+
+
+def test_idempotency_key_maps_a_repeat_onto_the_first_delivery(tmp_path):
+    log = make_log(tmp_path)
+    first, created = log.reserve('+919800000000', 'Take rest', idempotency_key='k-1')
+    assert created and first['status'] == STATUS_PENDING
+
+    repeat, created = log.reserve('+919800000000', 'Take rest', idempotency_key='k-1')
+    assert not created
+    assert repeat['delivery_id'] == first['delivery_id']
+
+
+def test_dedup_window_ignores_failed_sends(tmp_path):
+    log = make_log(tmp_path)
+    first, _ = log.reserve('+919800000000', 'Take rest', dedup_window=60)
+    log.mark_sent(first['delivery_id'], 'SM1')
+    repeat, created = log.reserve('+919800000000', 'Take rest', dedup_window=60)
+    assert not created and repeat['delivery_id'] == first['delivery_id']
+
+    log.mark_error(first['delivery_id'], "Twilio refused", error_code='21211')
+    retry, created = log.reserve('+919800000000', 'Take rest', dedup_window=60)
+    assert created and retry['delivery_id'] != first['delivery_id']
+    assert log.get(first['delivery_id'])['status'] == STATUS_ERROR
+
+
+def test_receipts_never_move_a_delivery_backwards(tmp_path):
+    log = make_log(tmp_path)
+    delivery, _ = log.reserve('+919800000000', 'Take rest')
+    log.mark_sent(delivery['delivery_id'], 'SM1')
+
+    # Callbacks arrive out of order, across two flushes
+    log.ingest('SM1', 'delivered')
+    log.ingest('SM1', 'sent')
+    assert log.flush() == 2
+    log.ingest('SM1', 'sending')
+    log.flush()
+
+    stored = log.get(delivery['delivery_id'], with_events=True)
+    assert stored['status'] == 'delivered'
+    assert [event['status'] for event in stored['events']] == ['delivered', 'sent', 'sending']
+
+
+def test_late_mark_sent_keeps_a_status_from_an_earlier_receipt(tmp_path):
+    log = make_log(tmp_path)
+    delivery, _ = log.reserve('+919800000000', 'Take rest')
+
+    # The status callback (carrying the delivery id) is flushed before the API response is recorded
+    log.ingest('SM1', 'delivered', delivery_id=delivery['delivery_id'])
+    log.flush()
+    log.mark_sent(delivery['delivery_id'], 'SM1', status='accepted')
+
+    stored = log.get(delivery['delivery_id'])
+    assert stored['message_sid'] == 'SM1'
+    assert stored['status'] == 'delivered'
+
+
+def test_mark_sent_records_the_sid_and_initial_status(tmp_path):
+    log = make_log(tmp_path)
+    delivery, _ = log.reserve('+919800000000', 'Take rest')
+    log.mark_sent(delivery['delivery_id'], 'SM2', status='queued')
+
+    stored = log.get(delivery['delivery_id'])
+    assert (stored['message_sid'], stored['status']) == ('SM2', 'queued')
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from fanout import FanOut, FanOutTimeout, time_left
+from outbound_scheduler import BATCH, current_priority, outbound_priority
+
+
+@pytest.fixture
+def fanout():
+    pool = FanOut(max_workers=2)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+def test_results_and_errors_are_reported_per_key(fanout):
+    def translate(lang):
+        if lang == 'ta-IN':
+            raise RuntimeError("503")
+        return f"[{lang}]"
+
+    outcomes = fanout.run(translate, ['hi-IN', 'ta-IN', 'bn-IN'])
+    assert outcomes['hi-IN'] == ('[hi-IN]', None)
+    assert outcomes['bn-IN'] == ('[bn-IN]', None)
+    assert isinstance(outcomes['ta-IN'][1], RuntimeError)
+
+
+def test_slow_language_does_not_hold_up_the_others(fanout):
+    release = threading.Event()
+
+    def translate(lang):
+        if lang == 'ta-IN':
+            release.wait(1)
+        return lang
+
+    started = time.monotonic()
+    outcomes = fanout.run(translate, ['hi-IN', 'ta-IN'], item_timeout=0.1)
+    release.set()
+    assert time.monotonic() - started < 0.5
+    assert outcomes['hi-IN'] == ('hi-IN', None)
+    assert isinstance(outcomes['ta-IN'][1], FanOutTimeout)
+    assert outcomes['ta-IN'][1].seconds == 0.1
+
+
+def test_item_timeout_starts_when_the_item_gets_a_worker(fanout):
+    # Three 0.1s items on two workers: the third starts late but still has its full 0.15s
+    outcomes = fanout.run(lambda lang: time.sleep(0.1) or lang, ['a', 'b', 'c'], item_timeout=0.15)
+    assert all(error is None for _, error in outcomes.values())
+
+
+def test_overall_deadline_bounds_the_whole_fan_out(fanout):
+    release = threading.Event()
+    started = time.monotonic()
+    outcomes = fanout.run(lambda lang: release.wait(1), ['a', 'b', 'c'], deadline=0.1)
+    release.set()
+    assert time.monotonic() - started < 0.5
+    assert all(isinstance(error, FanOutTimeout) for _, error in outcomes.values())
+
+
+def test_items_see_their_deadline_and_the_callers_context(fanout):
+    seen = {}
+
+    def translate(lang):
+        seen[lang] = (time_left(30), current_priority())
+        return lang
+
+    with outbound_priority(BATCH):
+        fanout.run(translate, ['hi-IN'], item_timeout=5)
+    left, priority = seen['hi-IN']
+    assert 4 < left <= 5
+    assert priority == BATCH
+    assert time_left(30) == 30
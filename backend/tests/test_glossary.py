@@ -0,0 +1,48 @@
+import os
+
+from glossary import Glossary, PhraseMatcher
+
+GLOSSARY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'glossaries')
+
+
+def make_glossary():
+    return Glossary({'hi-IN': {"Fever": "बुखार", "High fever": "तेज बुखार", "Cough": "खांसी"}},
+                    protected=["Paracetamol", "Dolo 650"])
+
+
+def test_matches_are_leftmost_longest_and_whole_words():
+    matcher = PhraseMatcher({"fever": "F", "high fever": "HF", "he": "X"})
+    assert matcher.find("High Fever, then fever") == [(0, 10, "HF"), (17, 22, "F")]
+    assert matcher.find("feverish") == []
+
+
+def test_segment_splits_known_phrases_from_the_rest():
+    glossary = make_glossary()
+    assert glossary.segment("High fever and cough", 'hi-IN') == [
+        ("High fever", "तेज बुखार"), (" and ", None), ("cough", "खांसी")]
+    assert glossary.record(glossary.segment("High fever and cough", 'hi-IN')) == 'partial'
+    assert glossary.record(glossary.segment("Fever, cough.", 'hi-IN')) == 'full'
+    assert glossary.record(glossary.segment("Sore throat", 'hi-IN')) == 'none'
+
+
+def test_protected_terms_map_to_themselves_in_every_language():
+    glossary = make_glossary()
+    assert glossary.segment("Take Dolo 650 twice", 'ta-IN') == [
+        ("Take ", None), ("Dolo 650", "Dolo 650"), (" twice", None)]
+
+
+def test_protect_and_restore_round_trip():
+    glossary = make_glossary()
+    masked, terms = glossary.protect("Paracetamol 500mg, then Dolo 650")
+    assert masked == "[[0]] 500mg, then [[1]]"
+    assert terms == ["Paracetamol", "Dolo 650"]
+    # Translators may pad the placeholders
+    assert Glossary.restore("[[ 1 ]] के बाद [[0]] 500mg", terms) == "Dolo 650 के बाद Paracetamol 500mg"
+    assert Glossary.restore("[[0]] 500mg", terms) is None
+
+
+def test_shipped_glossaries_load():
+    glossary = Glossary.load(GLOSSARY_DIR)
+    assert 'hi-IN' in glossary.tables
+    assert glossary.segment("Fever", 'hi-IN') == [("Fever", "बुखार")]
+    assert "Paracetamol" in glossary.protected
@@ -0,0 +1,42 @@
+from health_probe import STATUS_DOWN, STATUS_NOT_CONFIGURED, STATUS_PENDING, STATUS_UP, DependencyProber
+
+
+def test_unprobed_and_unconfigured_dependencies():
+    prober = DependencyProber({'sarvam': lambda timeout: (STATUS_UP, {}), 'twilio': None})
+    assert prober.status('sarvam') == STATUS_PENDING
+    assert prober.status('twilio') == STATUS_NOT_CONFIGURED
+    assert prober.up_values() == {}
+
+
+def test_failures_are_counted_until_the_dependency_recovers():
+    outcomes = [ConnectionError("refused"), (STATUS_DOWN, {"http_status": 503}), (STATUS_UP, {"http_status": 200})]
+
+    def probe(timeout):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    prober = DependencyProber({'sarvam': probe}, timeout=2)
+    first = prober.probe('sarvam')
+    assert first["status"] == STATUS_DOWN
+    assert first["error"] == "refused"
+    assert first["consecutive_failures"] == 1
+
+    assert prober.probe('sarvam')["consecutive_failures"] == 2
+    assert prober.up_values() == {('sarvam',): 0}
+
+    recovered = prober.probe('sarvam')
+    assert recovered["status"] == STATUS_UP
+    assert recovered["consecutive_failures"] == 0
+    assert recovered["http_status"] == 200
+    assert "error" not in recovered
+    assert prober.up_values() == {('sarvam',): 1}
+    assert "age_seconds" in prober.snapshot()['sarvam']
+
+
+def test_probes_get_the_configured_timeout():
+    seen = []
+    prober = DependencyProber({'twilio': lambda timeout: seen.append(timeout) or (STATUS_UP, {})}, timeout=3)
+    prober.probe('twilio')
+    assert seen == [3]
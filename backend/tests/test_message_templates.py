@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from message_templates import TemplateRegistry
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'locales')
+
+
+@pytest.fixture(scope='module')
+def templates():
+    return TemplateRegistry.load(LOCALES_DIR, {'hi': {'code': 'hi-IN', 'name': 'Hindi'}})
+
+
+def test_untranslated_sms_keeps_the_original_wording(templates):
+    assert (templates.render_sms('medicines', '', 'Paracetamol', '', '') ==
+            "Prescribed Medicines: Paracetamol\nTake as directed by doctor.")
+
+
+def test_language_without_a_locale_gets_tagged_english(templates):
+    assert (templates.render_sms('medicines', '', 'Paracetamol', '', '', language='Konkani') ==
+            "Prescribed Medicines (Konkani): Paracetamol\nTake as directed by your doctor.")
+    assert templates.render_sms('unknown', '', '', '', '', language='Konkani') == \
+        "Medical consultation information (Konkani)."
+
+
+def test_localized_sms_uses_the_locale_boilerplate(templates):
+    body = templates.render_sms('medicines', '', 'पैरासिटामोल', '', '', language='Hindi')
+    assert body == templates.render_sms('medicines', '', 'पैरासिटामोल', '', '', language='hi-IN')
+    assert templates.strings('hi')['medicines_advice'] in body
+
+
+def test_pdf_title_names_a_language_without_a_locale(templates):
+    assert templates.pdf_labels('Konkani')['title'] == "Medical Consultation Report (Konkani)"
+    assert templates.pdf_labels('en-IN')['title'] == "Medical Consultation Report"
+    assert templates.pdf_labels('Hindi')['title'] == templates.strings('hi-IN')['report_title']
@@ -0,0 +1,115 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from outbound_scheduler import (BATCH, LIVE, ROUTINE, URGENT, PriorityScheduler, QueueTimeout, outbound_priority,
+                                resolve_priority)
+from rate_limit import SharedTokenBucket
+
+
+def test_shared_bucket_wait_does_not_block_the_event_loop(tmp_path):
+    db_path = str(tmp_path / 'rate_limit.db')
+    scheduler = PriorityScheduler('test', 10, bucket=SharedTokenBucket(db_path, 'test', 10))
+
+    # Another process holds the bucket's write lock for a while
+    other = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other.execute, ("COMMIT",)).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        started = time.monotonic()
+        await scheduler.acquire_async(LIVE)
+        task.cancel()
+        return ticks, time.monotonic() - started
+
+    ticks, waited = asyncio.run(main())
+    assert 0.25 <= waited < 2
+    assert ticks >= 5
+
+
+def test_snapshot_does_not_wait_for_the_shared_bucket(tmp_path):
+    db_path = str(tmp_path / 'rate_limit.db')
+    scheduler = PriorityScheduler('test', 10, burst=5, bucket=SharedTokenBucket(db_path, 'test', 10, 5))
+    scheduler.acquire(LIVE)
+
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        snapshot = scheduler.snapshot()
+        assert time.monotonic() - started < 0.1
+    finally:
+        other.execute("COMMIT")
+    assert 4 <= snapshot["tokens"] <= 5
+    assert snapshot["granted"][LIVE] == 1
+
+
+def test_reserves_keep_tokens_for_higher_classes_in_other_processes(tmp_path):
+    db_path = str(tmp_path / 'rate_limit.db')
+    reserves = {BATCH: 0.5}
+
+    # Two workers pacing the same upstream through one shared bucket
+    def worker():
+        return PriorityScheduler('test', 0.01, burst=11, max_waits={BATCH: 0, LIVE: 0}, reserves=reserves,
+                                 bucket=SharedTokenBucket(db_path, 'test', 0.01, 11))
+
+    batch_worker, live_worker = worker(), worker()
+    with outbound_priority(BATCH):
+        for _ in range(6):
+            batch_worker.acquire()
+        with pytest.raises(QueueTimeout):
+            batch_worker.acquire()
+
+    for _ in range(5):
+        live_worker.acquire(LIVE)
+    with pytest.raises(QueueTimeout):
+        live_worker.acquire(LIVE)
+
+
+def test_freed_tokens_go_to_the_highest_waiting_class():
+    scheduler = PriorityScheduler('test', 20, burst=1)
+    scheduler.acquire(LIVE)
+    order = []
+
+    def wait(priority):
+        scheduler.acquire(priority)
+        order.append(priority)
+
+    threads = [threading.Thread(target=wait, args=(priority,)) for priority in (BATCH, ROUTINE)]
+    threads[0].start()
+    time.sleep(0.01)
+    threads[1].start()
+    time.sleep(0.01)
+    threads.append(threading.Thread(target=wait, args=(LIVE,)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join()
+    assert order == [LIVE, ROUTINE, BATCH]
+
+
+def test_class_wait_limit_raises_queue_timeout():
+    scheduler = PriorityScheduler('test', 1, burst=1, max_waits={BATCH: 0.05})
+    scheduler.acquire(BATCH)
+    with pytest.raises(QueueTimeout) as excinfo:
+        scheduler.acquire(BATCH)
+    assert excinfo.value.priority == BATCH
+    assert scheduler.snapshot()["timeouts"][BATCH] == 1
+    assert scheduler.depth()[BATCH] == 0
+
+
+def test_clients_can_lower_but_not_raise_their_priority():
+    assert resolve_priority(URGENT, BATCH) == BATCH
+    assert resolve_priority(BATCH, LIVE) == BATCH
+    assert resolve_priority(ROUTINE, 'bogus') == ROUTINE
@@ -0,0 +1,59 @@
+import copy
+
+import pytest
+
+from pdf_renderer import FontNotAvailable, PDFRenderer, scripts_in
+
+
+def make_document(**overrides):
+    document = {
+        "title": "Medical Report",
+        "headings": {"diagnosis": "Diagnosis", "medicines": "Medicines"},
+        "labels": {"patient_information": "Patient Information", "generated_on": "Generated on"},
+        "language": "English",
+        "language_code": "en-IN",
+        "sections": {"diagnosis": "Viral fever", "medicines": "Paracetamol 500mg", "notes": ""},
+        "patient_info": {"name": "Asha", "age": 34},
+    }
+    document.update(overrides)
+    return document
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    return PDFRenderer(str(tmp_path / 'cache'), str(tmp_path / 'no-fonts'))
+
+
+def test_key_covers_template_strings(renderer):
+    document = make_document()
+    assert renderer.key(document) == renderer.key(copy.deepcopy(document))
+
+    retitled = make_document(title="Consultation Summary")
+    relabelled = make_document(labels={"patient_information": "Patient", "generated_on": "Generated on"})
+    reheaded = make_document(headings={"diagnosis": "Findings", "medicines": "Medicines"})
+    keys = {renderer.key(doc) for doc in (document, retitled, relabelled, reheaded)}
+    assert len(keys) == 4
+
+
+def test_reprint_is_served_from_the_cache(renderer):
+    digest, path, cached = renderer.render(make_document())
+    assert not cached
+    with open(path, 'rb') as f:
+        assert f.read(5) == b'%PDF-'
+
+    again, same_path, cached = renderer.render(make_document())
+    assert (again, same_path, cached) == (digest, path, True)
+    assert renderer.lookup(digest) == path
+    assert renderer.snapshot()["hits"] == 1
+
+
+def test_indic_report_without_its_font_is_refused(renderer):
+    document = make_document(language="Hindi", language_code="hi-IN", sections={"diagnosis": "वायरल बुखार"})
+    with pytest.raises(FontNotAvailable) as excinfo:
+        renderer.render(document)
+    assert "NotoSansDevanagari-Regular.ttf" in str(excinfo.value)
+
+
+def test_scripts_in_finds_each_indic_block():
+    assert scripts_in(["fever", "बुखार", "காய்ச்சல்"]) == {'devanagari', 'tamil'}
+    assert scripts_in(["fever"]) == set()
@@ -0,0 +1,107 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from pipeline import DONE, CompletionTracker, Pipeline
+
+
+def test_tracker_advances_over_out_of_order_lines():
+    tracker = CompletionTracker()
+    for line in (1, 3, 4, 6):
+        tracker.mark(line)
+    assert (tracker.through, tracker.after) == (1, {3, 4, 6})
+    assert tracker.is_done(3) and not tracker.is_done(2)
+
+    tracker.mark(2)
+    assert (tracker.through, tracker.after) == (4, {6})
+    tracker.mark(5)
+    assert (tracker.through, tracker.after) == (6, set())
+
+
+def make_pipeline(tmp_path, restart=False, app=None):
+    args = SimpleNamespace(input=str(tmp_path / 'consultations.jsonl'), out_dir=str(tmp_path), no_pdf=True,
+                           pdf_dir=None, queue_size=100, render_workers=1, translate_workers=1,
+                           restart=restart, source_lang='en-IN', languages=['hi-IN'])
+    return Pipeline(app, args)
+
+
+def write_input(tmp_path, lines):
+    with open(tmp_path / 'consultations.jsonl', 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    return items
+
+
+def test_resume_skips_lines_finished_before_the_checkpoint(tmp_path):
+    write_input(tmp_path, [json.dumps({"id": f"c-{n}", "diagnosis": "fever"}) for n in range(1, 7)])
+    first = make_pipeline(tmp_path)
+    for line in (1, 2, 4):
+        first.tracker.mark(line)
+    first.stats["records"] = 3
+    with open(first.results_path, 'wb') as results:
+        results.write(b'{"line": 1}\n{"line": 2}\n{"line": 4}\n')
+        first.save_checkpoint(results)
+
+    resumed = make_pipeline(tmp_path)
+    resumed.load_checkpoint()
+    assert (resumed.tracker.through, resumed.tracker.after) == (2, {4})
+    assert resumed.stats["records"] == 3
+    assert resumed.results_bytes == 36
+
+    resumed.read()
+    lines = [item[0] for item in drain(resumed.translate_queue) if isinstance(item, tuple)]
+    assert lines == [3, 5, 6]
+
+
+def test_restart_ignores_the_checkpoint(tmp_path):
+    write_input(tmp_path, [json.dumps({"id": "c-1"})])
+    first = make_pipeline(tmp_path)
+    first.tracker.mark(1)
+    with open(first.results_path, 'wb') as results:
+        first.save_checkpoint(results)
+
+    restarted = make_pipeline(tmp_path, restart=True)
+    restarted.load_checkpoint()
+    assert restarted.tracker.through == 0
+
+
+def test_checkpoint_of_another_input_is_refused(tmp_path):
+    write_input(tmp_path, [json.dumps({"id": "c-1"})])
+    first = make_pipeline(tmp_path)
+    with open(first.results_path, 'wb') as results:
+        first.save_checkpoint(results)
+
+    other = make_pipeline(tmp_path)
+    other.input_path = str(tmp_path / 'other.jsonl')
+    with pytest.raises(SystemExit):
+        other.load_checkpoint()
+
+
+def test_malformed_record_fails_alone_and_the_stage_still_finishes(tmp_path):
+    # Only the source language is requested, so no translation call is made
+    app = SimpleNamespace(SUPPORTED_LANGUAGES={'en': {'code': 'en-IN', 'name': 'English'}},
+                          SarvamAPIError=RuntimeError)
+    pipeline = make_pipeline(tmp_path, app=app)
+    pipeline.supported_codes = {'en-IN'}
+    for item in ((1, {"id": "c-1", "languages": [5]}, None),
+                 (2, {"id": "c-2", "languages": "en-IN"}, None),
+                 (3, {"id": "c-3", "diagnosis": ["fever"]}, None),
+                 (4, {"id": "c-4", "diagnosis": "fever", "languages": ["en-IN"]}, None),
+                 DONE):
+        pipeline.translate_queue.put(item)
+
+    pipeline.translate()
+
+    failed = drain(pipeline.write_queue)
+    assert [(line, record['id']) for line, record, _, _ in failed] == [(1, 'c-1'), (2, 'c-2'), (3, 'c-3')]
+    assert all(error.startswith("Translation failed:") for _, _, _, error in failed)
+    translated = drain(pipeline.render_queue)
+    assert translated[-1] is DONE
+    assert translated[0][0] == 4
+    assert translated[0][2]['en-IN']['untranslated']
@@ -0,0 +1,65 @@
+import pytest
+import requests
+
+from outbound_scheduler import QueueTimeout
+from sarvam_client import SarvamClient
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, json, timeout):
+        self.posts += 1
+        return FakeResponse(self.statuses.pop(0))
+
+
+def make_client(statuses):
+    client = SarvamClient('key', base_url='http://sarvam.test', max_retries=3, backoff_base=0.001)
+    client._local.session = FakeSession(statuses)
+    return client
+
+
+def test_every_retry_takes_an_outbound_token():
+    client = make_client([503, 429, 200])
+    tokens = []
+    response = client.post_translate({'target_language_code': 'hi-IN'}, timeout=5,
+                                     acquire=lambda: tokens.append(1))
+    assert response.status_code == 200
+    assert client.session.posts == 3
+    # The first attempt's token is taken by the caller
+    assert len(tokens) == 2
+
+
+def test_retry_is_given_up_without_a_token():
+    client = make_client([503, 200])
+
+    def acquire():
+        raise QueueTimeout('sarvam', 'batch', 1.0)
+
+    response = client.post_translate({'target_language_code': 'hi-IN'}, timeout=5, acquire=acquire)
+    assert response.status_code == 503
+    assert client.session.posts == 1
+
+
+def test_connection_errors_are_raised_when_the_retry_gets_no_token():
+    client = make_client([])
+
+    def post(url, json, timeout):
+        raise requests.exceptions.ConnectionError("refused")
+
+    client.session.post = post
+
+    def acquire():
+        raise QueueTimeout('sarvam', 'batch', 1.0)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.post_translate({'target_language_code': 'hi-IN'}, timeout=5, acquire=acquire)
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, FlightTimeout, SingleFlight
+
+
+def run_concurrently(flights, key, fn, count, timeout=None):
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flights.do(key, fn, timeout=timeout))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.005)
+    return threads, outcomes
+
+
+def test_identical_calls_share_one_upstream_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(1)
+        return "बुखार"
+
+    threads, outcomes = run_concurrently(flights, 'k', fetch, 4)
+    assert flights.snapshot()["waiting"] == 3
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes == ["बुखार"] * 4
+    assert len(calls) == 1
+    stats = flights.snapshot()
+    assert (stats["calls"], stats["leaders"], stats["coalesced"]) == (4, 1, 3)
+    assert (stats["waiting"], stats["in_flight"], stats["max_waiters"]) == (0, 0, 3)
+    assert stats["coalesce_rate"] == 0.75
+
+
+def test_waiters_share_the_leaders_error():
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.05)
+        raise RuntimeError("503")
+
+    threads, outcomes = run_concurrently(flights, 'k', fail, 3)
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert flights.snapshot()["errors"] == 1
+
+
+def test_timed_out_waiter_is_counted_once_and_stops_waiting():
+    flights = SingleFlight()
+    release = threading.Event()
+    threads, outcomes = run_concurrently(flights, 'k', lambda: release.wait(1) and "ok", 2, timeout=0.05)
+    threads[1].join()
+    assert isinstance(outcomes[0], FlightTimeout)
+    stats = flights.snapshot()
+    assert (stats["calls"], stats["timeouts"], stats["waiting"]) == (2, 1, 0)
+    release.set()
+    threads[0].join()
+
+
+def test_async_waiters_are_counted_once_and_released():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "बुखार"
+
+    async def main():
+        waiter = asyncio.ensure_future(flights.do('k', fetch))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*(flights.do('k', fetch) for _ in range(3)))
+        return [await waiter] + results
+
+    assert asyncio.run(main()) == ["बुखार"] * 4
+    assert len(calls) == 1
+    stats = flights.snapshot()
+    assert (stats["calls"], stats["leaders"], stats["coalesced"], stats["waiting"]) == (4, 1, 3, 0)
+
+
+def test_async_timed_out_waiter_does_not_cancel_the_leader():
+    flights = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do('k', slow))
+        await asyncio.sleep(0)
+        with pytest.raises(FlightTimeout):
+            await flights.do('k', slow, timeout=0.01)
+        assert flights.snapshot()["waiting"] == 0
+        return await leader
+
+    assert asyncio.run(main()) == "ok"
+    assert flights.snapshot()["timeouts"] == 1
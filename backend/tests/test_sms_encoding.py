@@ -0,0 +1,51 @@
+import pytest
+
+from sms_encoding import GSM7, UCS2, count_segments, describe, detect_encoding
+
+
+@pytest.mark.parametrize("text, segments", [
+    ("a" * 160, 1),
+    ("a" * 161, 2),
+    ("a" * 306, 2),
+    ("a" * 307, 3),
+])
+def test_gsm7_segment_boundaries(text, segments):
+    assert describe(text) == {"encoding": GSM7, "segments": segments, "characters": len(text)}
+
+
+def test_gsm7_extension_characters_cost_two_septets():
+    assert count_segments("€" * 80) == 1
+    assert count_segments("€" * 80 + "a") == 2
+
+
+def test_gsm7_escape_sequence_is_not_split_across_segments():
+    # 306 septets would fit two segments, but the euro sign after 152 septets moves whole
+    assert count_segments("a" * 152 + "€" * 77) == 3
+
+
+@pytest.mark.parametrize("text, segments", [
+    ("न" * 70, 1),
+    ("न" * 71, 2),
+    ("न" * 134, 2),
+    ("न" * 135, 3),
+])
+def test_ucs2_segment_boundaries(text, segments):
+    assert describe(text) == {"encoding": UCS2, "segments": segments, "characters": len(text)}
+
+
+def test_one_non_gsm_character_forces_ucs2():
+    assert detect_encoding("café") == GSM7
+    assert detect_encoding("cafá") == UCS2
+    assert describe("a" * 69 + "न")["segments"] == 1
+    assert describe("a" * 70 + "न")["segments"] == 2
+
+
+def test_surrogate_pairs_cost_two_units_and_are_not_split():
+    assert count_segments("😀" * 35) == 1
+    assert count_segments("😀" * 35 + "a") == 2
+    # 134 units would fit two segments, but the emoji after 66 units moves whole
+    assert count_segments("a" * 66 + "😀" * 34) == 3
+
+
+def test_empty_body_has_no_segments():
+    assert describe("") == {"encoding": GSM7, "segments": 0, "characters": 0}
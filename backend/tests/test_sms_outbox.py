@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from delivery_log import STATUS_PENDING, DeliveryLog
+from sms_outbox import STATUS_QUEUED, STATUS_SENDING, STATUS_SENT, RetryLater, SMSOutbox
+
+
+def never_called(job):
+    raise AssertionError("the tests dispatch jobs by hand")
+
+
+@pytest.fixture
+def outbox_path(tmp_path):
+    return str(tmp_path / 'outbox.db')
+
+
+def test_expired_lease_is_reclaimed_and_stale_outcome_dropped(outbox_path):
+    # Two outboxes on one file stand in for two server processes
+    first = SMSOutbox(outbox_path, never_called, lease_seconds=0.05)
+    second = SMSOutbox(outbox_path, never_called, lease_seconds=0.05)
+    job, created = first.enqueue('+919800000000', 'Take rest')
+    assert created
+
+    stalled = first._claim()
+    assert second._claim() is None
+    time.sleep(0.06)
+    reclaimed = second._claim()
+    assert reclaimed['job_id'] == job['job_id']
+    assert reclaimed['attempts'] == 2
+
+    assert second._finish(reclaimed, STATUS_SENT, message_sid='SM2')
+    # The first worker wakes up late: its outcome must not overwrite the re-claim's
+    assert not first._finish(stalled, STATUS_SENT, message_sid='SM1')
+    stored = first.get(job['job_id'])
+    assert (stored['status'], stored['message_sid']) == (STATUS_SENT, 'SM2')
+
+
+def test_renewed_lease_is_not_reclaimed(outbox_path):
+    first = SMSOutbox(outbox_path, never_called, lease_seconds=0.2)
+    second = SMSOutbox(outbox_path, never_called, lease_seconds=0.2)
+    first.enqueue('+919800000000', 'Take rest')
+
+    job = first._claim()
+    time.sleep(0.15)
+    assert first.renew_leases() == 1
+    time.sleep(0.1)
+    assert second._claim() is None
+    assert first._finish(job, STATUS_SENT, message_sid='SM1')
+    assert first.renew_leases() == 0
+
+
+def test_idempotency_key_maps_onto_existing_job(outbox_path):
+    outbox = SMSOutbox(outbox_path, never_called)
+    job, created = outbox.enqueue('+919800000000', 'Take rest', idempotency_key='key-1')
+    again, created_again = outbox.enqueue('+919800000000', 'Take rest', idempotency_key='key-1')
+    assert created and not created_again
+    assert again['job_id'] == job['job_id']
+    assert outbox.pending_count() == 1
+
+
+def test_retry_later_requeues_without_using_an_attempt(outbox_path):
+    def busy(job):
+        raise RetryLater("no Twilio token", 30)
+
+    outbox = SMSOutbox(outbox_path, busy)
+    job, _ = outbox.enqueue('+919800000000', 'Take rest')
+    outbox._dispatch(outbox._claim())
+
+    stored = outbox.get(job['job_id'])
+    assert stored['status'] == STATUS_QUEUED
+    assert stored['attempts'] == 0
+    assert stored['available_at'] > time.time() + 25
+    assert outbox._claim() is None
+
+
+def test_reclaimed_job_is_not_sent_twice(tmp_path):
+    # The outbox sender reserves a delivery keyed by job before calling Twilio; a re-claim
+    # of a job whose first sender died mid-send finds that reservation instead of sending
+    log = DeliveryLog(str(tmp_path / 'deliveries.db'))
+    key = 'outbox:job-1'
+    delivery, created = log.reserve('+919800000000', 'Take rest', idempotency_key=key, source='outbox')
+    assert created
+
+    pending, created = log.reserve('+919800000000', 'Take rest', idempotency_key=key, source='outbox')
+    assert not created
+    assert pending['delivery_id'] == delivery['delivery_id']
+    assert pending['status'] == STATUS_PENDING and not pending['message_sid']
+
+    # A receipt (or the first sender) records the SID; the re-claim then reuses it
+    log.mark_sent(delivery['delivery_id'], 'SM1')
+    sent, created = log.reserve('+919800000000', 'Take rest', idempotency_key=key, source='outbox')
+    assert not created
+    assert sent['message_sid'] == 'SM1'
+
+
+def test_abandoned_reservation_is_released_after_pending_timeout(tmp_path):
+    log = DeliveryLog(str(tmp_path / 'deliveries.db'), pending_timeout=0)
+    key = 'outbox:job-1'
+    first, _ = log.reserve('+919800000000', 'Take rest', idempotency_key=key, source='outbox')
+    time.sleep(0.01)
+    second, created = log.reserve('+919800000000', 'Take rest', idempotency_key=key, source='outbox')
+    assert created
+    assert second['delivery_id'] != first['delivery_id']
+
+
+def test_claim_marks_job_sending(outbox_path):
+    outbox = SMSOutbox(outbox_path, never_called)
+    job, _ = outbox.enqueue('+919800000000', 'Take rest')
+    claimed = outbox._claim()
+    assert claimed['lease_token']
+    assert outbox.get(job['job_id'])['status'] == STATUS_SENDING
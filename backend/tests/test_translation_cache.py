@@ -0,0 +1,62 @@
+import time
+
+from translation_cache import TranslationCache, make_cache_key
+
+
+def make_cache(tmp_path, **kwargs):
+    return TranslationCache(db_path=str(tmp_path / 'cache.db'), **kwargs)
+
+
+def test_whitespace_variants_share_a_key():
+    assert (make_cache_key("Take  rest\t daily", 'en-IN', 'hi-IN', 'm') ==
+            make_cache_key(" Take rest daily ", 'en-IN', 'hi-IN', 'm'))
+    assert make_cache_key("a\nb", 'en-IN', 'hi-IN', 'm') != make_cache_key("a b", 'en-IN', 'hi-IN', 'm')
+
+
+def test_disk_tier_serves_another_process(tmp_path):
+    make_cache(tmp_path).set("fever", 'en-IN', 'hi-IN', 'm', "बुखार")
+    other = make_cache(tmp_path)
+    assert other.get("fever", 'en-IN', 'hi-IN', 'm') == "बुखार"
+    assert other.get("fever", 'en-IN', 'hi-IN', 'm') == "बुखार"
+    stats = other.snapshot()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_purge_reaches_other_processes_memory(tmp_path):
+    first = make_cache(tmp_path, purge_check_interval=0)
+    second = make_cache(tmp_path, purge_check_interval=0)
+    first.set("fever", 'en-IN', 'hi-IN', 'm', "बुखार")
+    assert second.get("fever", 'en-IN', 'hi-IN', 'm') == "बुखार"
+
+    assert first.purge(language='hi-IN') == 1
+    assert second.get("fever", 'en-IN', 'hi-IN', 'm') is None
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = TranslationCache(max_entries=2)
+    cache.set("a", 'en-IN', 'hi-IN', 'm', "A")
+    cache.set("b", 'en-IN', 'hi-IN', 'm', "B")
+    cache.get("a", 'en-IN', 'hi-IN', 'm')
+    cache.set("c", 'en-IN', 'hi-IN', 'm', "C")
+    assert cache.get("b", 'en-IN', 'hi-IN', 'm') is None
+    assert cache.get("a", 'en-IN', 'hi-IN', 'm') == "A"
+
+
+def test_sweep_trims_the_disk_tier_oldest_first(tmp_path):
+    cache = make_cache(tmp_path, disk_max_entries=3, sweep_interval=3600)
+    for text in "abcde":
+        cache.set(text, 'en-IN', 'hi-IN', 'm', text.upper())
+        time.sleep(0.002)
+    assert cache.sweep() == 2
+
+    fresh = make_cache(tmp_path, disk_max_entries=3)
+    assert [fresh.get(text, 'en-IN', 'hi-IN', 'm') for text in "abcde"] == [None, None, "C", "D", "E"]
+    assert cache.snapshot()["disk_evictions"] == 2
+
+
+def test_stores_sweep_expired_rows_periodically(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=0.01, sweep_interval=0)
+    cache.set("a", 'en-IN', 'hi-IN', 'm', "A")
+    time.sleep(0.02)
+    cache.set("b", 'en-IN', 'hi-IN', 'm', "B")
+    assert cache.snapshot()["disk_expirations"] == 1
@@ -0,0 +1,71 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from upload_store import TEMP_PREFIX, UploadStore, UploadTooLarge
+
+REPORT = b'%PDF-1.4 consultation report'
+
+
+def leftovers(root):
+    return [name for name in os.listdir(root) if name.startswith(TEMP_PREFIX)]
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = UploadStore(str(tmp_path), chunk_size=4)
+    first = store.ingest(io.BytesIO(REPORT))
+    second = store.ingest(io.BytesIO(REPORT))
+
+    digest = hashlib.sha256(REPORT).hexdigest()
+    assert first == {"id": digest[:32], "sha256": digest, "size": len(REPORT), "created": True}
+    assert second["created"] is False and second["id"] == first["id"]
+    assert sorted(os.listdir(tmp_path)) == [first["id"]]
+    assert store.content_type(store.path(first["id"])) == 'application/pdf'
+
+
+def test_oversized_upload_leaves_nothing_behind(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=8, chunk_size=4)
+    with pytest.raises(UploadTooLarge):
+        store.ingest(io.BytesIO(REPORT))
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty_upload_is_dropped(tmp_path):
+    store = UploadStore(str(tmp_path))
+    assert store.ingest(io.BytesIO(b'')) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_path_rejects_malformed_names(tmp_path):
+    store = UploadStore(str(tmp_path))
+    assert store.path('../app.py') is None
+    assert store.path('0' * 32) is None
+
+
+def test_multipart_parts_stream_into_the_store(tmp_path):
+    store = UploadStore(str(tmp_path))
+    environ = EnvironBuilder(method='POST', data={
+        'report': (io.BytesIO(REPORT), 'report.pdf'),
+        'audio': (io.BytesIO(b'\x1a\x45\xdf\xa3 webm'), 'note.webm'),
+        'empty': (io.BytesIO(b''), 'empty.bin'),
+    }).get_environ()
+    results = store.ingest_multipart(environ)
+    assert len(results) == 2
+    assert all(result["created"] for result in results)
+    assert leftovers(tmp_path) == []
+
+
+def test_stale_temporary_files_are_removed_on_start(tmp_path):
+    stale = tmp_path / f'{TEMP_PREFIX}dead'
+    stale.write_bytes(b'partial')
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    fresh = tmp_path / f'{TEMP_PREFIX}live'
+    fresh.write_bytes(b'partial')
+
+    UploadStore(str(tmp_path), stale_temp_seconds=3600)
+    assert leftovers(tmp_path) == [fresh.name]
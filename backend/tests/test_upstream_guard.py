@@ -0,0 +1,162 @@
+import time
+
+import pytest
+
+from outbound_scheduler import QueueTimeout
+from upstream_guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, UpstreamGuard
+
+
+def open_breaker(cooldown=0.05):
+    breaker = CircuitBreaker('test', 'hi-IN', failure_threshold=3, cooldown=cooldown)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError("503"))
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test', 'hi-IN', failure_threshold=3, cooldown=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.key == 'hi-IN'
+    assert 1 <= excinfo.value.retry_after <= 30
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_trial_closes():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_for_another_cooldown():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure(RuntimeError("503"))
+    assert breaker.state == OPEN
+    assert breaker.opened_count == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_abandoned_trial_lets_the_next_call_try():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.abandon()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def make_guard(**kwargs):
+    return UpstreamGuard('test', hedge_ratio=0, failure_threshold=2, cooldown=30, **kwargs)
+
+
+def test_guard_counts_only_upstream_failures():
+    guard = make_guard(is_failure=lambda error: not isinstance(error, ValueError))
+
+    def rejected(timeout):
+        raise ValueError("400")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            guard.call('hi-IN', rejected, 5)
+    assert guard.breaker('hi-IN').state == CLOSED
+
+    def unavailable(timeout):
+        raise RuntimeError("503")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            guard.call('hi-IN', unavailable, 5)
+    assert guard.breaker('hi-IN').state == OPEN
+    with pytest.raises(CircuitOpenError):
+        guard.call('hi-IN', lambda timeout: 'ok', 5)
+    assert guard.call('ta-IN', lambda timeout: 'ok', 5) == 'ok'
+
+
+def test_guard_token_wait_does_not_touch_breaker():
+    guard = make_guard()
+
+    def acquire():
+        raise QueueTimeout('sarvam', 'batch', 1.0)
+
+    for _ in range(3):
+        with pytest.raises(QueueTimeout):
+            guard.call('hi-IN', lambda timeout: 'ok', 5, acquire=acquire)
+    breaker = guard.breaker('hi-IN')
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+    assert len(guard.latencies) == 0
+
+
+def test_timed_out_attempts_stretch_the_adaptive_timeout():
+    guard = UpstreamGuard('test', hedge_ratio=0, min_samples=5, min_timeout=0.01, timeout_multiplier=2,
+                          failure_threshold=100)
+    for _ in range(5):
+        guard.call('hi-IN', lambda timeout: 'ok', 5)
+    fast = guard.timeout(5, 'hi-IN')
+    assert fast < 0.05
+
+    def slow(timeout):
+        time.sleep(timeout)
+        raise TimeoutError("read timed out")
+
+    for _ in range(5):
+        with pytest.raises(TimeoutError):
+            guard.call('hi-IN', slow, 5)
+    assert guard.timeout(5, 'hi-IN') >= 2 * fast
+
+
+def test_latency_windows_are_per_key():
+    guard = UpstreamGuard('test', hedge_ratio=0, min_samples=3, min_timeout=0.01)
+
+    def slow(timeout):
+        time.sleep(0.05)
+        return 'ok'
+
+    for _ in range(3):
+        guard.call('hi-IN', slow, 5)
+        guard.call('ta-IN', lambda timeout: 'ok', 5)
+    assert guard.timeout(5, 'hi-IN') >= 0.1
+    assert guard.timeout(5, 'ta-IN') < 0.05
+
+
+def test_half_open_trial_gets_the_full_limit():
+    guard = UpstreamGuard('test', hedge_ratio=0, min_samples=1, min_timeout=0.01, failure_threshold=1,
+                          cooldown=0.05)
+    def unavailable(timeout):
+        raise RuntimeError("503")
+
+    guard.call('hi-IN', lambda timeout: 'ok', 5)
+    with pytest.raises(RuntimeError):
+        guard.call('hi-IN', unavailable, 5)
+    assert guard.timeout(5, 'hi-IN') < 5
+
+    time.sleep(0.06)
+    timeouts = []
+    guard.call('hi-IN', lambda timeout: timeouts.append(timeout), 5)
+    assert timeouts == [5]
+    assert guard.breaker('hi-IN').state == CLOSED
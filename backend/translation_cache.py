@@ -0,0 +1,355 @@
+"""Two-tier cache for Sarvam translations.
+
+Tier one is an in-process LRU with a TTL and size limits, tier two is a SQLite
+file (WAL mode) that survives restarts and is shared by every worker process
+on the host. Entries are keyed on the normalized text, source language,
+target language and model.
+
+The disk tier is bounded too: every `sweep_interval` seconds a process
+that stores a translation deletes expired rows and trims the store to
+`disk_max_entries`, dropping the oldest-stored entries first.
+
+A purge deletes from the shared store and bumps a generation counter kept
+next to it. Every process compares that counter with the one it last saw
+(at most once per `purge_check_interval` seconds) and empties its memory
+tier when another process has purged, so no worker keeps serving purged
+translations from memory.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """Normalize text so trivially different inputs share a cache entry.
+
+    Runs of spaces and tabs collapse to one space; line breaks are kept,
+    since the translator treats them as boundaries.
+    """
+    text = unicodedata.normalize('NFC', text)
+    return '\n'.join(' '.join(line.split()) for line in text.splitlines()).strip()
+
+
+def make_cache_key(text, source_lang, target_lang, model):
+    """Build the cache key for a translation request"""
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{model}|{source_lang}|{target_lang}|{digest}"
+
+
+class TranslationCache:
+    """In-process LRU in front of a shared on-disk SQLite store"""
+
+    def __init__(self, db_path=None, ttl_seconds=7 * 24 * 3600, max_entries=5000,
+                 max_bytes=16 * 1024 * 1024, purge_check_interval=1.0, disk_max_entries=200000,
+                 sweep_interval=300.0):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.purge_check_interval = purge_check_interval
+        self.disk_max_entries = disk_max_entries
+        self.sweep_interval = sweep_interval
+
+        # key -> (translated_text, expires_at, source_lang, target_lang, model)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        # Purge generation of the shared store that the memory tier reflects
+        self._generation = 0
+        self._next_generation_check = 0.0
+        self._next_sweep = time.monotonic() + sweep_interval
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "purged": 0,
+            "memory_resets": 0,
+            "disk_expirations": 0,
+            "disk_evictions": 0,
+        }
+
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False,
+                                 isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    cache_key TEXT PRIMARY KEY,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    translated_text TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_translations_target ON translations (target_lang)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_translations_model ON translations (model)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_translations_expires ON translations (expires_at)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            self._generation = self._read_generation(db)
+            self._db = db
+            self.sweep()
+            logger.info(f"Translation cache store opened at {self.db_path}")
+        except sqlite3.Error as e:
+            # The memory tier still works without the disk tier
+            logger.error(f"Failed to open translation cache store: {e}")
+            self._db = None
+
+    @staticmethod
+    def _read_generation(db):
+        row = db.execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def _check_generation(self):
+        """Empty the memory tier if another process purged the shared store since the last check"""
+        if self._db is None:
+            return
+        now = time.monotonic()
+        if now < self._next_generation_check:
+            return
+        self._next_generation_check = now + self.purge_check_interval
+        try:
+            with self._db_lock:
+                generation = self._read_generation(self._db)
+        except sqlite3.Error as e:
+            logger.warning(f"Translation cache generation check failed: {e}")
+            return
+
+        with self._lock:
+            if generation == self._generation:
+                return
+            self._generation = generation
+            dropped = len(self._memory)
+            self._memory.clear()
+            self._memory_bytes = 0
+            self.stats["memory_resets"] += 1
+        logger.info(f"Translation cache purged elsewhere; dropped {dropped} entries from memory")
+
+    @staticmethod
+    def _entry_size(key, translated_text):
+        return len(key) + len(translated_text.encode('utf-8'))
+
+    def get(self, text, source_lang, target_lang, model):
+        """Return the cached translation or None"""
+        key = make_cache_key(text, source_lang, target_lang, model)
+        now = time.time()
+        self._check_generation()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[0]
+                self._remove_locked(key)
+                self.stats["expirations"] += 1
+
+        row = None
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    row = self._db.execute(
+                        "SELECT translated_text, expires_at FROM translations WHERE cache_key = ?",
+                        (key,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Translation cache read failed: {e}")
+
+        if row and row[1] > now:
+            with self._lock:
+                self.stats["disk_hits"] += 1
+                self._put_locked(key, row[0], row[1], source_lang, target_lang, model)
+            return row[0]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, text, source_lang, target_lang, model, translated_text):
+        """Store a translation in both tiers"""
+        key = make_cache_key(text, source_lang, target_lang, model)
+        expires_at = time.time() + self.ttl_seconds
+
+        with self._lock:
+            self.stats["stores"] += 1
+            self._put_locked(key, translated_text, expires_at, source_lang, target_lang, model)
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO translations "
+                        "(cache_key, source_lang, target_lang, model, translated_text, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, source_lang, target_lang, model, translated_text, expires_at)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Translation cache write failed: {e}")
+            if time.monotonic() >= self._next_sweep:
+                self.sweep()
+
+    def sweep(self):
+        """Delete expired entries from the disk tier and trim it to disk_max_entries, oldest first.
+
+        Returns the number of rows removed.
+        """
+        if self._db is None:
+            return 0
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        try:
+            with self._db_lock:
+                expired = self._db.execute("DELETE FROM translations WHERE expires_at < ?",
+                                           (time.time(),)).rowcount
+                excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.disk_max_entries
+                evicted = 0
+                if excess > 0:
+                    # Every entry lives ttl_seconds, so the earliest expiry is the oldest store
+                    evicted = self._db.execute(
+                        "DELETE FROM translations WHERE cache_key IN "
+                        "(SELECT cache_key FROM translations ORDER BY expires_at LIMIT ?)", (excess,)
+                    ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Translation cache sweep failed: {e}")
+            return 0
+
+        with self._lock:
+            self.stats["disk_expirations"] += expired
+            self.stats["disk_evictions"] += evicted
+        if evicted:
+            logger.info(f"Translation cache store over {self.disk_max_entries} entries; evicted {evicted} oldest")
+        return expired + evicted
+
+    def _put_locked(self, key, translated_text, expires_at, source_lang, target_lang, model):
+        if key in self._memory:
+            self._remove_locked(key)
+        size = self._entry_size(key, translated_text)
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (translated_text, expires_at, source_lang, target_lang, model)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._remove_locked(oldest)
+            self.stats["evictions"] += 1
+
+    def _remove_locked(self, key):
+        entry = self._memory.pop(key)
+        self._memory_bytes -= self._entry_size(key, entry[0])
+
+    def purge(self, language=None, model=None):
+        """Remove entries for one target language and/or one model version.
+
+        With neither argument every entry is removed. Returns the number of
+        entries removed from the disk tier (or the memory tier when there is
+        no disk tier). Other processes drop their memory tiers on their next
+        lookup after the generation check interval.
+        """
+        def matches(entry):
+            return ((language is None or entry[3] == language) and
+                    (model is None or entry[4] == model))
+
+        with self._lock:
+            doomed = [key for key, entry in self._memory.items() if matches(entry)]
+            for key in doomed:
+                self._remove_locked(key)
+            removed = len(doomed)
+
+        if self._db is not None:
+            clauses, params = [], []
+            if language is not None:
+                clauses.append("target_lang = ?")
+                params.append(language)
+            if model is not None:
+                clauses.append("model = ?")
+                params.append(model)
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            try:
+                with self._db_lock:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    try:
+                        removed = self._db.execute(f"DELETE FROM translations{where}", params).rowcount
+                        self._db.execute(
+                            "INSERT INTO cache_meta (name, value) VALUES ('generation', 1) "
+                            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+                        )
+                        generation = self._read_generation(self._db)
+                        self._db.execute("COMMIT")
+                    except Exception:
+                        self._db.execute("ROLLBACK")
+                        raise
+                with self._lock:
+                    # This process already dropped the matching memory entries, unless another one purged too
+                    if generation != self._generation + 1:
+                        self._memory.clear()
+                        self._memory_bytes = 0
+                        self.stats["memory_resets"] += 1
+                    self._generation = generation
+            except sqlite3.Error as e:
+                logger.error(f"Translation cache purge failed: {e}")
+
+        with self._lock:
+            self.stats["purged"] += removed
+        logger.info(f"Purged {removed} cached translations (language={language}, model={model})")
+        return removed
+
+    def preload(self, limit=None):
+        """Fill the memory tier from the disk store, most recently stored entries first"""
+        if self._db is None:
+            return 0
+        limit = min(limit or self.max_entries, self.max_entries)
+        try:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT cache_key, translated_text, expires_at, source_lang, target_lang, model "
+                    "FROM translations WHERE expires_at > ? ORDER BY expires_at DESC LIMIT ?",
+                    (time.time(), limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Translation cache preload failed: {e}")
+            return 0
+
+        with self._lock:
+            # Insert oldest first so the newest entries end up least likely to be evicted
+            for key, translated_text, expires_at, source_lang, target_lang, model in reversed(rows):
+                if key not in self._memory:
+                    self._put_locked(key, translated_text, expires_at, source_lang, target_lang, model)
+        return len(rows)
+
+    def snapshot(self):
+        """Return counters and sizes for the stats endpoint"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["disk_enabled"] = self._db is not None
+        stats["generation"] = self._generation
+        return stats
@@ -0,0 +1,37 @@
+"""Twilio HTTP clients that send API calls to a different base URL.
+
+Used to point the backend at a local Twilio stand-in (see bench/) by
+setting TWILIO_API_BASE_URL; every request for https://api.twilio.com is
+rewritten to that base URL, everything else about the client is unchanged.
+"""
+from twilio.http.http_client import TwilioHttpClient
+
+TWILIO_API_URL = 'https://api.twilio.com'
+
+
+def rebase_url(url, base_url):
+    if url.startswith(TWILIO_API_URL):
+        return base_url.rstrip('/') + url[len(TWILIO_API_URL):]
+    return url
+
+
+class RebasedTwilioHttpClient(TwilioHttpClient):
+    """TwilioHttpClient that sends api.twilio.com requests to base_url"""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        return super().request(method, rebase_url(url, self.base_url), *args, **kwargs)
+
+
+def rebased_async_client(base_url, **kwargs):
+    """AsyncTwilioHttpClient that sends api.twilio.com requests to base_url (needs a running loop)"""
+    from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+    class RebasedAsyncTwilioHttpClient(AsyncTwilioHttpClient):
+        async def request(self, method, url, *args, **kwargs):
+            return await super().request(method, rebase_url(url, base_url), *args, **kwargs)
+
+    return RebasedAsyncTwilioHttpClient(**kwargs)
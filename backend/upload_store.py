@@ -0,0 +1,206 @@
+"""Content-addressed blob store for backend/uploads.
+
+Blobs live flat in one directory under 32-hex-character names, the layout
+the Node server already writes. New blobs are named by the first 128 bits
+of their SHA-256, so uploading the same report twice stores it once.
+
+An upload is streamed chunk by chunk into a temporary file in the same
+directory while it is hashed, then linked into place under its digest. The
+link fails if the blob already exists (another request or worker stored
+the same content first), in which case the temporary copy is dropped.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+
+from werkzeug.formparser import parse_form_data
+
+logger = logging.getLogger(__name__)
+
+BLOB_NAME = re.compile(r'^[0-9a-f]{32}$')
+
+TEMP_PREFIX = '.upload-'
+
+# Leading bytes of the formats the consultation app stores; anything else is served as octet-stream
+MAGIC_TYPES = (
+    (b'\x1a\x45\xdf\xa3', 'video/webm'),
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'OggS', 'audio/ogg'),
+)
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload grows past the store's size cap"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+class PendingUpload:
+    """Temporary file that hashes and counts what is written to it.
+
+    Also usable as the file container werkzeug's multipart parser writes
+    file parts into (it calls write() and then seek(0)).
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(path, 'wb+')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def sync(self):
+        """Flush to stable storage before the blob becomes visible under its name"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class UploadStore:
+    """Streaming ingest and lookup for the content-addressed upload directory"""
+
+    def __init__(self, root, max_bytes=None, chunk_size=64 * 1024, stale_temp_seconds=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        os.makedirs(root, exist_ok=True)
+        self._remove_stale_temp(stale_temp_seconds)
+
+    def _remove_stale_temp(self, max_age):
+        """Delete temporary files left by workers that died mid-upload"""
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(TEMP_PREFIX) and entry.stat().st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                    logger.info(f"Removed abandoned upload {entry.name}")
+                except OSError:
+                    pass
+
+    def begin(self):
+        """Start a new upload; write to it, then commit() or discard() it"""
+        return PendingUpload(os.path.join(self.root, f"{TEMP_PREFIX}{uuid.uuid4().hex}"), self.max_bytes)
+
+    def ingest(self, stream):
+        """Copy a raw request body into the store in chunks; returns the commit() result"""
+        pending = self.begin()
+        try:
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                pending.write(chunk)
+        except BaseException:
+            pending.discard()
+            raise
+        return self.commit(pending)
+
+    def ingest_multipart(self, environ, max_form_memory_size=500 * 1024):
+        """Parse a multipart/form-data body, streaming each file part straight into the store.
+
+        Returns the commit() results of the non-empty file parts. Raises
+        ValueError for a malformed body and UploadTooLarge past the cap.
+        """
+        pending = []
+
+        def stream_factory(total_content_length=None, content_type=None, filename=None, content_length=None):
+            upload = self.begin()
+            pending.append(upload)
+            return upload
+
+        try:
+            _, _, files = parse_form_data(environ, stream_factory=stream_factory,
+                                          max_form_memory_size=max_form_memory_size, silent=False)
+            results = [self.commit(storage.stream) for _, storage in files.items(multi=True)]
+        finally:
+            # Parts the parser never finished (truncated body, size cap) are still temporary files
+            for upload in pending:
+                upload.discard()
+        return [result for result in results if result is not None]
+
+    def commit(self, pending):
+        """Move a finished upload into place under its content address.
+
+        Returns {"id", "sha256", "size", "created"}; created is False when the
+        same content was already stored. An empty upload is dropped and
+        returns None.
+        """
+        if pending.size == 0:
+            pending.discard()
+            return None
+        digest = pending.sha256()
+        name = digest[:32]
+        target = os.path.join(self.root, name)
+        try:
+            pending.sync()
+            pending.close()
+            if os.path.exists(target):
+                created = False
+            else:
+                try:
+                    # Hard link instead of rename: it refuses to overwrite a blob stored concurrently
+                    os.link(pending.path, target)
+                    created = True
+                except FileExistsError:
+                    created = False
+        finally:
+            pending.discard()
+        return {"id": name, "sha256": digest, "size": pending.size, "created": created}
+
+    def path(self, name):
+        """Filesystem path of a stored blob, or None for an unknown or malformed name"""
+        if not BLOB_NAME.match(name):
+            return None
+        path = os.path.join(self.root, name)
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def content_type(path):
+        with open(path, 'rb') as f:
+            head = f.read(16)
+        for magic, mimetype in MAGIC_TYPES:
+            if head.startswith(magic):
+                return mimetype
+        return 'application/octet-stream'
@@ -0,0 +1,454 @@
+"""Adaptive timeouts, hedged requests and circuit breakers for an upstream API.
+
+UpstreamGuard wraps each upstream call:
+
+- the timeout comes from a rolling percentile of recent call latencies for
+  the same key (times a safety multiplier, clamped), never above the
+  caller's own limit, so a brownout costs seconds instead of the full fixed
+  timeout. Attempts that time out count as samples of the time they took,
+  so the window follows an upstream that has become slower;
+- a call still running after the hedge delay gets a second, identical
+  request, and the first success wins. Hedges are paid for out of a budget
+  that only grows as a fraction of normal traffic, so they can never
+  multiply load on an upstream that is already slow;
+- one circuit breaker per key (target language) opens after consecutive
+  failures and rejects calls with CircuitOpenError until a cool-down has
+  passed, then lets a single trial call through, with the caller's full
+  limit as its timeout, to decide whether to close.
+
+Callers answer from the translation cache and glossary before the guard is
+consulted, so those keep working while a breaker is open.
+"""
+import asyncio
+import bisect
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import CIRCUIT_REJECTIONS, CIRCUIT_TRANSITIONS, HEDGED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _NotAttempted(Exception):
+    """An error from a call's acquire step: the upstream was never contacted"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+def _preferred_error(current, error):
+    """The error to report when every attempt failed: an upstream error over a local one"""
+    if current is None or isinstance(current, _NotAttempted):
+        return error
+    return current
+
+
+def is_timeout_error(error):
+    """Default is_timeout: the built-in and asyncio timeout exceptions (aiohttp's included)"""
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, name, key, retry_after):
+        super().__init__(f"{name} circuit open for {key}; retry in {retry_after:.0f}s")
+        self.name = name
+        self.key = key
+        self.retry_after = retry_after
+
+
+class LatencyWindow:
+    """The most recent N latencies, kept sorted for percentile lookups"""
+
+    def __init__(self, size=500):
+        self._samples = deque(maxlen=size)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                oldest = self._samples[0]
+                del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+            self._samples.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, fraction, min_samples=1):
+        """Nearest-rank percentile, or None with fewer than min_samples samples"""
+        with self._lock:
+            count = len(self._sorted)
+            if count < max(1, min_samples):
+                return None
+            return self._sorted[min(count - 1, max(0, math.ceil(fraction * count) - 1))]
+
+
+class HedgeBudget:
+    """Hedges allowed as a fraction of calls: every call deposits ratio tokens, a hedge spends one"""
+
+    def __init__(self, ratio=0.1, burst=10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst) if ratio > 0 else 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        if self.ratio <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self):
+        with self._lock:
+            return self._tokens
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open (one trial) -> closed"""
+
+    def __init__(self, name, key, failure_threshold=5, cooldown=30.0):
+        self.name = name
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self.last_failure = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition_locked(self, state):
+        if state != self.state:
+            logger.warning(f"{self.name} circuit for {self.key}: {self.state} -> {state}")
+            CIRCUIT_TRANSITIONS.inc(self.name, self.key, state)
+            self.state = state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now; returns whether it is the half-open trial"""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.cooldown:
+                self._transition_locked(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            retry_after = max(1.0, self.cooldown - (now - self.opened_at))
+        CIRCUIT_REJECTIONS.inc(self.name, self.key)
+        raise CircuitOpenError(self.name, self.key, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            self._transition_locked(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_failure = str(error)[:200] if error is not None else None
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._trial_in_flight = False
+                if self.state != OPEN:
+                    self.opened_count += 1
+                self.opened_at = time.monotonic()
+                self._transition_locked(OPEN)
+
+    def abandon(self):
+        """The call admitted by before_call was cancelled without an outcome"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.opened_count,
+            }
+            if self.state != CLOSED:
+                snapshot["retry_after"] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+                snapshot["last_failure"] = self.last_failure
+            return snapshot
+
+
+class UpstreamGuard:
+    """Adaptive timeout, hedging and per-key circuit breakers around calls to one upstream"""
+
+    def __init__(self, name, timeout_percentile=0.99, timeout_multiplier=2.0, min_timeout=2.0,
+                 window=500, min_samples=20, hedge_delay=None, hedge_percentile=0.95,
+                 min_hedge_delay=0.25, hedge_ratio=0.1, hedge_burst=10, hedge_workers=32,
+                 failure_threshold=5, cooldown=30.0, is_failure=None, is_timeout=None):
+        self.name = name
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self.hedge_delay_fixed = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.is_failure = is_failure or (lambda error: True)
+        self.is_timeout = is_timeout or is_timeout_error
+
+        # One window per key, so a slow language does not stretch the others' timeouts,
+        # plus one over every call for callers without a key and for /api/health
+        self.window = window
+        self.latencies = LatencyWindow(window)
+        self._windows = {}
+        self.hedge_budget = HedgeBudget(hedge_ratio, hedge_burst)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+        # Sync hedging runs both attempts on this pool; a full pool means no hedge
+        self._executor = None
+        self._slots = threading.Semaphore(hedge_workers)
+        if hedge_ratio > 0 and hedge_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=hedge_workers,
+                                                thread_name_prefix=f'{name}-hedge')
+
+    def latency_window(self, key=None):
+        """Latency window of one key, or of every call when key is None"""
+        if key is None:
+            return self.latencies
+        window = self._windows.get(key)
+        if window is None:
+            with self._breakers_lock:
+                window = self._windows.setdefault(key, LatencyWindow(self.window))
+        return window
+
+    def _observe(self, key, seconds):
+        self.latencies.observe(seconds)
+        if key is not None:
+            self.latency_window(key).observe(seconds)
+
+    def timeout(self, limit, key=None):
+        """Timeout for the next call: a multiple of the rolling percentile, capped at limit"""
+        observed = self.latency_window(key).percentile(self.timeout_percentile, self.min_samples)
+        if observed is None:
+            return limit
+        return min(limit, max(self.min_timeout, observed * self.timeout_multiplier))
+
+    def hedge_delay(self, key=None):
+        """Seconds to wait before hedging, or None when hedging is off or there is no history yet"""
+        if self.hedge_budget.ratio <= 0:
+            return None
+        if self.hedge_delay_fixed:
+            return self.hedge_delay_fixed
+        observed = self.latency_window(key).percentile(self.hedge_percentile, self.min_samples)
+        if observed is None:
+            return None
+        return max(self.min_hedge_delay, observed)
+
+    def breaker(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        self.name, key, self.failure_threshold, self.cooldown)
+        return breaker
+
+    def _record(self, breaker, error):
+        if error is None or not self.is_failure(error):
+            breaker.record_success()
+        else:
+            breaker.record_failure(error)
+
+    def _timed(self, key, fn, timeout, acquire=None):
+        if acquire is not None:
+            try:
+                acquire()
+            except Exception as e:
+                raise _NotAttempted(e) from e
+        # Only the upstream call itself is measured, not the wait for a rate-limit token
+        start = time.perf_counter()
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            if self.is_timeout(e):
+                self._observe(key, time.perf_counter() - start)
+            raise
+        self._observe(key, time.perf_counter() - start)
+        return result
+
+    def call(self, key, fn, limit, acquire=None):
+        """Run fn(timeout) for key under the breaker, hedging it if it runs long.
+
+        fn must raise for upstream errors; is_failure decides which of them
+        count against the breaker. acquire(), when given, runs before each
+        attempt (a hedge included) to wait for a rate-limit token: its wait
+        is not part of the measured latency and its errors (QueueTimeout)
+        are raised without touching the breaker.
+        """
+        breaker = self.breaker(key)
+        trial = breaker.before_call()
+        self.hedge_budget.deposit()
+        try:
+            result = self._call_hedged(key, fn, limit if trial else self.timeout(limit, key), acquire)
+        except _NotAttempted as e:
+            # Local congestion says nothing about the upstream's health
+            breaker.abandon()
+            raise e.error
+        except Exception as e:
+            self._record(breaker, e)
+            raise
+        self._record(breaker, None)
+        return result
+
+    def _submit(self, key, fn, timeout, acquire):
+        """Start fn on the hedge pool, or return None if every slot is busy"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        future = self._executor.submit(contextvars.copy_context().run, self._timed, key, fn, timeout, acquire)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _call_hedged(self, key, fn, timeout, acquire=None):
+        delay = self.hedge_delay(key)
+        primary = self._submit(key, fn, timeout, acquire) if delay is not None and self._executor else None
+        if primary is None:
+            return self._timed(key, fn, timeout, acquire)
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not self.hedge_budget.try_spend():
+            HEDGED_REQUESTS.inc(self.name, 'no_budget')
+            return primary.result()
+        hedge = self._submit(key, fn, timeout, acquire)
+        if hedge is None:
+            HEDGED_REQUESTS.inc(self.name, 'no_capacity')
+            return primary.result()
+        HEDGED_REQUESTS.inc(self.name, 'sent')
+
+        # First success wins; the loser finishes in the background
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        HEDGED_REQUESTS.inc(self.name, 'won')
+                    return future.result()
+                first_error = _preferred_error(first_error, future.exception())
+        raise first_error
+
+    async def acall(self, key, fn, limit, acquire=None):
+        """asyncio counterpart of call(); fn(timeout) and acquire() return awaitables"""
+        breaker = self.breaker(key)
+        trial = breaker.before_call()
+        self.hedge_budget.deposit()
+        try:
+            result = await self._acall_hedged(key, fn, limit if trial else self.timeout(limit, key), acquire)
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except _NotAttempted as e:
+            breaker.abandon()
+            raise e.error
+        except Exception as e:
+            self._record(breaker, e)
+            raise
+        self._record(breaker, None)
+        return result
+
+    async def _atimed(self, key, fn, timeout, acquire=None):
+        if acquire is not None:
+            try:
+                await acquire()
+            except Exception as e:
+                raise _NotAttempted(e) from e
+        start = time.perf_counter()
+        try:
+            result = await fn(timeout)
+        except Exception as e:
+            if self.is_timeout(e):
+                self._observe(key, time.perf_counter() - start)
+            raise
+        self._observe(key, time.perf_counter() - start)
+        return result
+
+    async def _acall_hedged(self, key, fn, timeout, acquire=None):
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await self._atimed(key, fn, timeout, acquire)
+
+        primary = asyncio.ensure_future(self._atimed(key, fn, timeout, acquire))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.hedge_budget.try_spend():
+                HEDGED_REQUESTS.inc(self.name, 'no_budget')
+                return await primary
+            HEDGED_REQUESTS.inc(self.name, 'sent')
+            hedge = asyncio.ensure_future(self._atimed(key, fn, timeout, acquire))
+            pending.add(hedge)
+
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            HEDGED_REQUESTS.inc(self.name, 'won')
+                        return task.result()
+                    first_error = _preferred_error(first_error, task.exception())
+            raise first_error
+        finally:
+            # Unlike threads, the losing attempt can be cancelled
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def is_open(self, key):
+        breaker = self._breakers.get(key)
+        return breaker is not None and breaker.state != CLOSED
+
+    def snapshot(self):
+        """Breaker states plus the current timeout and hedge settings, for /api/health"""
+        with self._breakers_lock:
+            breakers = dict(self._breakers)
+        hedge_delay = self.hedge_delay()
+        p50 = self.latencies.percentile(0.5, self.min_samples)
+        return {
+            "circuit_breakers": {key: breaker.snapshot() for key, breaker in sorted(breakers.items())},
+            "open_circuits": sorted(key for key, breaker in breakers.items() if breaker.state != CLOSED),
+            "latency_samples": len(self.latencies),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "adaptive_timeout": round(self.timeout(float('inf')), 3) if p50 is not None else None,
+            "hedge_delay": round(hedge_delay, 3) if hedge_delay is not None else None,
+            "hedge_tokens": round(self.hedge_budget.tokens, 2),
+        }
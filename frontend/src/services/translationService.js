@@ -1,64 +1,36 @@
-// Translation service using Google Cloud Translation API
-class TranslationService {
-  constructor() {
-    this.apiKey = process.env.REACT_APP_GOOGLE_TRANSLATE_API_KEY;
-    this.apiUrl = 'https://translation.googleapis.com/language/translate/v2';
-  }
+// Translation service backed by the Flask /api/translate endpoint.
+// Known medical phrases are answered by the backend glossary without an
+// upstream call, so no phrase dictionary is kept on the client.
+import { flaskAPI } from './apiService';
+
+const LANGUAGE_CODES = {
+  hi: 'hi-IN',
+  mr: 'mr-IN',
+  ta: 'ta-IN',
+  te: 'te-IN',
+  kn: 'kn-IN',
+  bn: 'bn-IN',
+  gu: 'gu-IN',
+  ml: 'ml-IN',
+  pa: 'pa-IN',
+  en: 'en-IN'
+};
 
+class TranslationService {
   async translateText(text, targetLanguage) {
     if (!text || !text.trim()) return text;
-    
-    // For demo purposes - in production, use Google Cloud Translation API
-    // You'll need to set up a backend proxy for security
-    try {
-      // Mock translation - replace with actual API call
-      const translations = {
-        'hi': {
-          'Fever': 'बुखार',
-          'Cough': 'खांसी',
-          'Headache': 'सिरदर्द',
-          'Hydration: Aim for 2–3 L water/day': 'जलयोजन: प्रतिदिन 2-3 लीटर पानी पिएं',
-          'Follow-up in 3 days if symptoms persist': 'यदि लक्षण बने रहें तो 3 दिनों में फॉलो-अप करें'
-        },
-        'mr': {
-          'Fever': 'ताप',
-          'Cough': 'खोकला',
-          'Headache': 'डोकेदुखी',
-          'Hydration: Aim for 2–3 L water/day': 'जलयोजन: दररोज 2-3 लिटर पाणी प्या',
-          'Follow-up in 3 days if symptoms persist': 'जर लक्षणे कायम राहिली तर 3 दिवसांनी फॉलो-अप करा'
-        }
-      };
 
-      // Simple word-by-word translation for demo
-      let translatedText = text;
-      if (translations[targetLanguage]) {
-        Object.keys(translations[targetLanguage]).forEach(englishText => {
-          translatedText = translatedText.replace(
-            new RegExp(englishText, 'gi'),
-            translations[targetLanguage][englishText]
-          );
-        });
-      }
-
-      return translatedText;
-
-      // For production, use this:
-      /*
-      const response = await fetch(`${this.apiUrl}?key=${this.apiKey}`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          q: text,
-          target: targetLanguage,
-          format: 'text'
-        }),
+    try {
+      const response = await flaskAPI.post('/api/translate', {
+        text,
+        sourceLang: 'en-IN',
+        targetLang: LANGUAGE_CODES[targetLanguage] || targetLanguage
       });
 
-      const data = await response.json();
-      return data.data.translations[0].translatedText;
-      */
+      if (response.data.status === 'success') {
+        return response.data.translated_text;
+      }
+      return text;
     } catch (error) {
       console.error('Translation error:', error);
       return text; // Return original text if translation fails
@@ -66,4 +38,4 @@ class TranslationService {
   }
 }
 
-export default TranslationService;
\ No newline at end of file
+export default TranslationService;